@@ -0,0 +1,113 @@
+"""
+Бенчмарк стоимости рендера на токен для потоковой панели.
+
+Сравнивает старый путь (новый Markdown(весь_текст) на каждый токен) со
+StreamRenderer и печатает среднюю стоимость токена по мере роста ответа.
+
+    python benchmarks/bench_render.py [--tokens 20000] [--fps 10] [--tps 100] [--naive-tokens 2000]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.console import Console
+from rich.markdown import Markdown
+from rich.panel import Panel
+
+from polly.render import StreamRenderer
+
+PARAGRAPH = [
+    "Streaming ", "answers ", "contain ", "**bold** ", "words, ", "`inline code` ", "and ",
+    "[links](https://example.com). ", "Each ", "token ", "is ", "a ", "few ", "characters.\n",
+]
+CODE = ["```python\n", "def f(x):\n", "    return x * 2\n", "```\n"]
+LIST = ["- item ", "one\n", "- item ", "two\n"]
+
+
+def token_stream(n):
+    """Синтетический ответ: абзацы, списки и код-блоки вперемешку."""
+    blocks = [PARAGRAPH, LIST, PARAGRAPH, CODE]
+    i = 0
+    while True:
+        for block in blocks:
+            for tok in block:
+                if i >= n:
+                    return
+                yield tok
+                i += 1
+            yield "\n"
+            i += 1
+
+
+def make_console():
+    return Console(file=io.StringIO(), width=100, height=40, color_system="truecolor", force_terminal=True)
+
+
+def bench_naive(tokens, frame_every):
+    """Старое поведение: полный парс на каждый токен, рендер раз в кадр."""
+    console = make_console()
+    text = ""
+    costs = []
+    panel = None
+    for i, tok in enumerate(tokens):
+        t0 = time.perf_counter()
+        text += tok
+        panel = Panel(Markdown(text), title="Polly", border_style="blue")
+        if i % frame_every == 0:
+            console.render_lines(panel, console.options)
+        costs.append(time.perf_counter() - t0)
+    return costs
+
+
+def bench_stream(tokens, frame_every):
+    console = make_console()
+    renderer = StreamRenderer()
+    panel = Panel(renderer, title="Polly", border_style="blue")
+    costs = []
+    for i, tok in enumerate(tokens):
+        t0 = time.perf_counter()
+        renderer.feed(tok)
+        if i % frame_every == 0:
+            console.render_lines(panel, console.options)
+        costs.append(time.perf_counter() - t0)
+    return costs
+
+
+def report(name, costs, buckets):
+    size = max(len(costs) // buckets, 1)
+    row = []
+    for b in range(buckets):
+        part = costs[b * size:(b + 1) * size]
+        if part:
+            row.append(sum(part) / len(part) * 1e6)
+    print(f"{name:<10}" + "".join(f"{v:>10.1f}" for v in row) + f"   total {sum(costs):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render cost per token")
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--fps", type=int, default=10, help="Кадров в секунду (как render_fps)")
+    parser.add_argument("--tps", type=int, default=100, help="Токенов в секунду от модели")
+    parser.add_argument("--buckets", type=int, default=8)
+    parser.add_argument("--naive-tokens", type=int, default=2000,
+                        help="Старый путь квадратичный: гоняем его только на начале ответа (0 - пропустить)")
+    args = parser.parse_args()
+
+    tokens = list(token_stream(args.tokens))
+    frame_every = max(args.tps // args.fps, 1)
+    size = len(tokens) // args.buckets
+
+    print(f"{len(tokens)} tokens, one frame every {frame_every} tokens; mean us/token per {size}-token bucket")
+    print(f"{'':<10}" + "".join(f"{'<' + str((b + 1) * size):>10}" for b in range(args.buckets)))
+    report("stream", bench_stream(tokens, frame_every), args.buckets)
+    if args.naive_tokens:
+        naive = bench_naive(tokens[:args.naive_tokens], frame_every)
+        report("naive", naive, max(args.buckets * len(naive) // len(tokens), 1))
+
+
+if __name__ == "__main__":
+    main()
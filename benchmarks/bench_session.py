@@ -0,0 +1,280 @@
+"""
+Бенчмарк собственных накладных расходов polly на локальном SSE-сервере
+(benchmarks/fake_server.py) вместо удаленного API.
+
+Сценарии:
+- stream:   один длинный ответ без ограничения скорости - пропускная способность
+            run_stream (сеть + SSE + рендер), tokens/s;
+- paced:    ответ с реалистичным темпом и задержкой - время до первого кадра (TTFR)
+            и отставание конца рендера от последнего байта;
+- tools:    пачка read-only вызовов - задержка от последнего байта ответа до
+            старта первого инструмента и время всей фазы инструментов;
+- session:  много ходов с текстом и инструментами под tracemalloc - пик памяти
+            (wall_s здесь завышен самим tracemalloc).
+
+    python benchmarks/bench_session.py [--tokens 20000] [--turns 20] [--repeat 5] [--json out.json]
+    python benchmarks/bench_session.py --baseline old.json [--tolerance 0.2]
+
+С --baseline сравнивает с прошлым JSON и завершается с кодом 1 при регрессии.
+Запускается с временным HOME, чтобы не трогать ~/.polly.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# До импорта polly: CONFIG_DIR считается от HOME при импорте
+os.environ["HOME"] = tempfile.mkdtemp(prefix="polly-bench-")
+
+import rich
+
+import polly.api
+import polly.core
+import polly.tools
+from polly.core import PollyIDE
+from polly.render import StreamRenderer
+from fake_server import FakeSSEServer, Step
+
+# Метрики, где больше - лучше; остальные (_ms, _s, _mb) - чем меньше, тем лучше
+HIGHER_IS_BETTER = {"tokens_per_s"}
+# Разница меньше этой не считается регрессией, как бы ни была велика в процентах
+NOISE_FLOOR = {"_ms": 5.0, "_s": 0.05, "_mb": 0.5}
+
+
+class Probe:
+    """Отметки времени из горячих точек polly: первый кадр с текстом, вызовы инструментов."""
+    def __init__(self):
+        self.first_render = None
+        self.tool_starts = []
+        self.tool_time = 0.0
+
+    def reset(self):
+        self.__init__()
+
+
+PROBE = Probe()
+
+
+def install_probes():
+    render = StreamRenderer.__rich_console__
+
+    def traced_render(self, console, options):
+        if PROBE.first_render is None and self.text:
+            PROBE.first_render = time.perf_counter()
+        return render(self, console, options)
+
+    StreamRenderer.__rich_console__ = traced_render
+
+    tool = polly.core.execute_local_tool
+
+    def traced_tool(name, args):
+        t0 = time.perf_counter()
+        PROBE.tool_starts.append(t0)
+        try:
+            return tool(name, args)
+        finally:
+            PROBE.tool_time += time.perf_counter() - t0
+
+    polly.core.execute_local_tool = traced_tool
+
+
+def quiet_console():
+    """Рендер идет как в терминале (ANSI, ширина 100), но в никуда."""
+    sink = io.StringIO()
+    rich.reconfigure(file=sink, force_terminal=True, width=100)
+    polly.core.console = polly.tools.console = rich.get_console()
+    return sink
+
+
+def new_ide(fps):
+    ide = PollyIDE()
+    ide.cfg["api_key"] = None
+    ide.cfg["render_fps"] = fps
+    ide.session = None  # Журнал сессии меряем отдельно, здесь только поток и инструменты
+    return ide
+
+
+def turn(ide, text="bench"):
+    ide.history.append({"role": "user", "content": text})
+    PROBE.reset()
+    t0 = time.perf_counter()
+    ide.run_stream()
+    return t0, time.perf_counter()
+
+
+def bench_stream(server, args):
+    server.script(Step(tokens=args.tokens, chunk_tokens=1))
+    ide = new_ide(args.fps)
+    t0, t1 = turn(ide)
+    ide.close()
+    return {
+        "tokens": args.tokens,
+        "wall_s": round(t1 - t0, 3),
+        "tokens_per_s": round(args.tokens / (t1 - t0)),
+        "ttfr_ms": round((PROBE.first_render - t0) * 1000, 1),
+    }
+
+
+def bench_paced(server, args):
+    step = Step(tokens=args.paced_tokens, token_rate=args.rate, chunk_tokens=1, latency=args.latency)
+    server.script(step)
+    ide = new_ide(args.fps)
+    t0, t1 = turn(ide)
+    ide.close()
+    ideal = args.latency + args.paced_tokens / args.rate
+    return {
+        "tokens": args.paced_tokens,
+        "token_rate": args.rate,
+        "latency_ms": args.latency * 1000,
+        "ttfr_ms": round((PROBE.first_render - t0) * 1000, 1),
+        "ttfr_overhead_ms": round((PROBE.first_render - t0 - args.latency) * 1000, 1),
+        "tail_lag_ms": round((t1 - server.last_byte) * 1000, 1),
+        "overhead_ms": round((t1 - t0 - ideal) * 1000, 1),
+    }
+
+
+def bench_tools(server, args):
+    calls = [("list_files", {"path": ROOT}), ("read_file", {"path": os.path.join(ROOT, "setup.py")}),
+             ("search_code", {"query": "def main", "path": ROOT})]
+    burst = [calls[i % len(calls)] for i in range(args.tool_burst)]
+    server.script(Step(tokens=10, tool_calls=burst))
+    ide = new_ide(args.fps)
+    marks = {}
+    run_tools = ide._run_tools
+
+    def traced_run_tools(tool_buffer):
+        marks["last_byte"] = server.last_byte  # Дальше следующий запрос его перезапишет
+        marks["phase_start"] = time.perf_counter()
+        run_tools(tool_buffer)
+        marks["phase_end"] = time.perf_counter()
+
+    ide._run_tools = traced_run_tools
+    turn(ide)
+    ide.close()
+    return {
+        "tool_calls": len(burst),
+        "last_byte_to_tool_ms": round((min(PROBE.tool_starts) - marks["last_byte"]) * 1000, 2),
+        "dispatch_ms": round((min(PROBE.tool_starts) - marks["phase_start"]) * 1000, 2),
+        "tools_phase_ms": round((marks["phase_end"] - marks["phase_start"]) * 1000, 1),
+        "tools_busy_ms": round(PROBE.tool_time * 1000, 1),
+    }
+
+
+def bench_session(server, args):
+    ide = new_ide(args.fps)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for i in range(args.turns):
+        server.script(Step(tokens=200, tool_calls=[("read_file", {"path": os.path.join(ROOT, "polly", "core.py"),
+                                                                   "fresh": True})]),
+                      Step(tokens=args.turn_tokens))
+        turn(ide, f"turn {i}")
+    wall = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ide.close()
+    return {
+        "turns": args.turns,
+        "messages": len(ide.history),
+        "wall_s": round(wall, 2),
+        "traced_current_mb": round(current / 2**20, 2),
+        "traced_peak_mb": round(peak / 2**20, 2),
+        "maxrss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def median_run(runs):
+    """Медиана каждой метрики по нескольким прогонам сценария."""
+    return {key: statistics.median(r[key] for r in runs) if isinstance(runs[0][key], (int, float)) else runs[0][key]
+            for key in runs[0]}
+
+
+def compare(results, baseline, tolerance):
+    """Метрики, ухудшившиеся больше чем на tolerance (доля)."""
+    regressions = []
+    for scenario, metrics in results.items():
+        old = baseline.get("scenarios", {}).get(scenario, {})
+        for key, value in metrics.items():
+            prev = old.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(prev, (int, float)) or prev <= 0:
+                continue
+            if key in HIGHER_IS_BETTER:
+                floor = 0
+            else:
+                floor = next((v for suffix, v in NOISE_FLOOR.items() if key.endswith(suffix)), None)
+                if floor is None or abs(value - prev) < floor:
+                    continue
+            change = (value - prev) / prev
+            worse = -change if key in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append(f"{scenario}.{key}: {prev} -> {value} ({change:+.0%})")
+    return regressions
+
+
+SCENARIOS = {"stream": bench_stream, "paced": bench_paced, "tools": bench_tools, "session": bench_session}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="polly streaming/tools overhead benchmark")
+    parser.add_argument("--only", choices=sorted(SCENARIOS), action="append", help="Запустить только эти сценарии")
+    parser.add_argument("--tokens", type=int, default=20000, help="stream: токенов в ответе")
+    parser.add_argument("--fps", type=int, default=10, help="render_fps")
+    parser.add_argument("--paced-tokens", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=200, help="paced: токенов в секунду")
+    parser.add_argument("--latency", type=float, default=0.2, help="paced: задержка до первого байта, сек")
+    parser.add_argument("--tool-burst", type=int, default=12, help="tools: вызовов в одном ответе")
+    parser.add_argument("--turns", type=int, default=20, help="session: ходов")
+    parser.add_argument("--turn-tokens", type=int, default=1000, help="session: токенов в ответе хода")
+    parser.add_argument("--repeat", type=int, default=5, help="Прогонов каждого сценария (кроме session), берется медиана")
+    parser.add_argument("--json", help="Записать результаты в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение (доля)")
+    args = parser.parse_args()
+
+    install_probes()
+    quiet_console()
+    server = FakeSSEServer(Step(tokens=10)).start()
+    polly.api.API_URL = server.url
+
+    results = {}
+    try:
+        for name in args.only or SCENARIOS:
+            runs = [SCENARIOS[name](server, args) for _ in range(1 if name == "session" else args.repeat)]
+            results[name] = median_run(runs)
+            print(f"{name:<8} " + "  ".join(f"{k}={v}" for k, v in results[name].items()), file=sys.__stdout__)
+    finally:
+        server.stop()
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+        "scenarios": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.__stdout__)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Бенчмарк декодирования SSE: старый цикл iter_lines/decode/json.loads
+против polly.sse.iter_deltas на сырых байтах.
+
+    python benchmarks/bench_sse.py [--tokens 200000] [--chunk 1024]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from polly import sse
+
+
+def make_stream(n):
+    events = []
+    for i in range(n):
+        chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "model": "bench",
+                 "choices": [{"index": 0, "delta": {"content": f"tok{i % 100} "}, "finish_reason": None}]}
+        events.append(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+    events.append(b"data: [DONE]\n\n")
+    return b"".join(events)
+
+
+def split(raw, size):
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+def iter_lines(chunks):
+    # Упрощенный аналог requests.Response.iter_lines
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def decode_old(chunks):
+    full_content = ""
+    markdown_text = ""
+    for line in iter_lines(chunks):
+        if not line: continue
+        decoded = line.decode('utf-8')
+        if not decoded.startswith('data: '): continue
+        data_str = decoded.replace('data: ', '')
+        if data_str == '[DONE]':
+            break
+        chunk = json.loads(data_str)
+        delta = chunk["choices"][0]["delta"]
+        if "content" in delta and delta["content"]:
+            full_content += delta["content"]
+            markdown_text += delta["content"]
+    return full_content
+
+
+def decode_new(chunks):
+    parts = []
+    for txt, _ in sse.iter_deltas(chunks):
+        if txt:
+            parts.append(txt)
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE decode throughput")
+    parser.add_argument("--tokens", type=int, default=200000)
+    parser.add_argument("--chunk", type=int, default=1024, help="Размер сетевого чанка в байтах")
+    args = parser.parse_args()
+
+    chunks = split(make_stream(args.tokens), args.chunk)
+    print(f"{args.tokens} tokens, {args.chunk}-byte chunks, json backend: {sse._loads.__module__}")
+    results = {}
+    for name, fn in (("old", decode_old), ("iter_deltas", decode_new)):
+        t0 = time.perf_counter()
+        results[name] = fn(chunks)
+        dt = time.perf_counter() - t0
+        print(f"{name:<12} {args.tokens / dt:>12,.0f} tokens/s")
+    assert results["old"] == results["iter_deltas"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Бенчмарк холодного старта CLI: wall time каждой подкоманды и самые
+дорогие импорты по `python -X importtime`.
+
+    python benchmarks/bench_startup.py [--runs 10] [--top 8] [--json out.json]
+
+Запускается с временным HOME, чтобы не трогать ~/.polly.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Подкоманды без сети и без интерактива
+COMMANDS = {
+    "help": ["help"],
+    "models": ["models"],
+    "reset": ["reset"],
+    "prompt": ["prompt", "{prompt_file}"],
+    "import-core": None,  # Для сравнения: сколько стоит путь с PollyIDE
+}
+
+
+def argv_code(argv):
+    if argv is None:
+        return "import polly.core"
+    return f"import sys; sys.argv = ['polly'] + {argv!r}; from polly.main import main; main()"
+
+
+def run(code, env, importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", code]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-500:])
+    return elapsed, proc.stderr
+
+
+def parse_importtime(stderr, top):
+    """Строки вида 'import time:   self |  cumulative | module'."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        # Вложенность импорта - отступ в колонке имени (по 2 пробела на уровень)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cum_us), int(self_us), name.strip(), depth))
+    total = sum(r[1] for r in rows)
+    heavy = sorted((r[:3] for r in rows if r[3] == 0), reverse=True)[:top]  # только верхний уровень
+    return total, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="polly startup benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=8, help="Сколько верхнеуровневых импортов показать")
+    parser.add_argument("--json", help="Записать результаты в JSON")
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp(prefix="polly-bench-")
+    prompt_file = os.path.join(home, "prompt.txt")
+    with open(prompt_file, "w") as f:
+        f.write("You are a benchmark.")
+    env = {**os.environ, "HOME": home, "PYTHONPATH": ROOT, "TERM": "dumb"}
+
+    results = {}
+    for name, argv in COMMANDS.items():
+        if argv:
+            argv = [a.format(prompt_file=prompt_file) for a in argv]
+        code = argv_code(argv)
+        run(code, env)  # прогрев файлового кэша и .pyc
+        times = [run(code, env)[0] for _ in range(args.runs)]
+        _, stderr = run(code, env, importtime=True)
+        import_us, heavy = parse_importtime(stderr, args.top)
+        results[name] = {
+            "wall_ms_median": round(statistics.median(times) * 1000, 1),
+            "wall_ms_min": round(min(times) * 1000, 1),
+            "import_ms": round(import_us / 1000, 1),
+            "top_imports": [{"module": m, "cumulative_ms": round(c / 1000, 1)} for c, _, m in heavy],
+        }
+        print(f"{name:<12} median {results[name]['wall_ms_median']:>7.1f} ms   "
+              f"min {results[name]['wall_ms_min']:>7.1f} ms   imports {results[name]['import_ms']:>7.1f} ms")
+        for item in results[name]["top_imports"]:
+            print(f"{'':<14}{item['cumulative_ms']:>7.1f} ms  {item['module']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version.split()[0], "runs": args.runs, "commands": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
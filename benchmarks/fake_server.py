@@ -0,0 +1,144 @@
+"""
+Локальный OpenAI-совместимый SSE-сервер для бенчмарков: отвечает на
+POST chat/completions потоком дельт без сети и без модели.
+
+Каждый запрос отыгрывает следующий Step из очереди (или шаг по
+умолчанию, когда очередь пуста):
+
+    server = FakeSSEServer(Step(tokens=5000, token_rate=0)).start()
+    server.script(Step(tool_calls=[("list_files", {})]), Step(tokens=100))
+    polly.api.API_URL = server.url
+    ...
+    server.stop()
+"""
+import collections
+import http.server
+import json
+import threading
+import time
+
+
+class Step:
+    """
+    Один ответ модели.
+    - tokens: сколько текстовых токенов отдать;
+    - token_rate: токенов в секунду (0 - без ограничения, максимально быстро);
+    - chunk_tokens: токенов в одном SSE-событии;
+    - latency: пауза перед первым байтом, сек;
+    - tool_calls: [(name, args_dict), ...] - пачка вызовов после текста;
+    - stall: пауза между преамбулой с ролью и первым токеном, сек;
+    - drop: оборвать соединение сразу после преамбулы с ролью (до первого токена).
+    """
+    def __init__(self, tokens=1000, token_rate=0, chunk_tokens=1, latency=0.0, tool_calls=None,
+                 stall=0.0, drop=False):
+        self.tokens = tokens
+        self.token_rate = token_rate
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.latency = latency
+        self.tool_calls = tool_calls or []
+        self.stall = stall
+        self.drop = drop
+
+
+def _event(delta):
+    chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "model": "bench",
+             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+    return b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n"
+
+
+# Токены похожи на обычный ответ: слова, markdown, код-блоки
+_WORDS = ["Streaming ", "answers ", "contain ", "**bold** ", "words, ", "`code` ", "and ", "lists.\n\n",
+          "- item ", "one\n", "- item ", "two\n\n", "```python\n", "x = 1\n", "```\n\n"]
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "polly-bench"
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            pass  # Клиент закрыл keep-alive соединение - для бенчмарка это норма
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        srv = self.server.owner
+        step = srv.next_step()
+        srv.requests.append({"bytes": len(body), "received": time.perf_counter()})
+
+        if step.latency:
+            time.sleep(step.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # Как у OpenAI: первое событие - только роль с пустым content
+        self._write(_event({"role": "assistant", "content": ""}))
+        if step.drop:
+            self.close_connection = True  # Без завершающего чанка: клиент видит обрыв потока
+            return
+        if step.stall:
+            time.sleep(step.stall)
+
+        interval = step.chunk_tokens / step.token_rate if step.token_rate else 0
+        next_at = time.perf_counter()
+        i = 0
+        while i < step.tokens:
+            n = min(step.chunk_tokens, step.tokens - i)
+            text = "".join(_WORDS[(i + k) % len(_WORDS)] for k in range(n))
+            self._write(_event({"content": text}))
+            i += n
+            if interval:
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        for idx, (name, args) in enumerate(step.tool_calls):
+            self._write(_event({"tool_calls": [{"index": idx, "id": f"call_{idx}", "type": "function",
+                                                "function": {"name": name, "arguments": json.dumps(args)}}]}))
+        self._write(b"data: [DONE]\n\n")
+        srv.last_byte = time.perf_counter()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSSEServer:
+    def __init__(self, default=None):
+        self.default = default or Step()
+        self.queue = collections.deque()
+        self.requests = []
+        self.last_byte = None  # perf_counter последнего байта последнего ответа
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def script(self, *steps):
+        with self._lock:
+            self.queue.extend(steps)
+
+    def next_step(self):
+        with self._lock:
+            return self.queue.popleft() if self.queue else self.default
+
+    def start(self):
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_port}/v1/chat/completions"
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
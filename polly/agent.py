@@ -0,0 +1,52 @@
+import time
+
+
+class TurnBudget:
+    """
+    Бюджет одного сообщения пользователя для цикла агента:
+    число шагов (запросов к модели), время и токены (промпт + ответ).
+    Ноль в любом лимите - без ограничения.
+    """
+    def __init__(self, max_steps=25, max_seconds=600, max_tokens=400000):
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.steps = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started = time.monotonic()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            max_steps=cfg.get("max_steps", 25),
+            max_seconds=cfg.get("max_turn_seconds", 600),
+            max_tokens=cfg.get("max_turn_tokens", 400000),
+        )
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def add_step(self, prompt_tokens, completion_tokens):
+        self.steps += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def exceeded(self):
+        """Причина остановки или None, если можно делать следующий шаг."""
+        if self.max_steps and self.steps >= self.max_steps:
+            return f"step limit ({self.max_steps})"
+        if self.max_seconds and self.elapsed >= self.max_seconds:
+            return f"time limit ({self.max_seconds}s)"
+        if self.max_tokens and self.tokens >= self.max_tokens:
+            return f"token limit ({self.max_tokens})"
+        return None
+
+    def summary(self):
+        return (f"{self.steps} steps | {self.elapsed:.1f}s | "
+                f"~{self.prompt_tokens} prompt + ~{self.completion_tokens} completion tokens")
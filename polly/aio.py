@@ -0,0 +1,319 @@
+import asyncio
+import json
+import threading
+
+import requests
+from rich.console import Console
+from rich.live import Live
+from rich.panel import Panel
+
+from . import api, procs
+from .core import PollyIDE
+from .render import StreamRenderer
+from .sse import SSEDecoder, DONE, _deltas
+from .agent import TurnBudget
+from .metrics import STATS, StepTimer
+from .resilience import RetryPolicy, RETRY_STATUS, aopen_stream, parse_retry_after
+from .payload import encode_payload, compress
+from .tools import execute_local_tool
+from .transport import http2_supported
+
+try:
+    import httpx  # Нативный async-клиент; без него работаем через мост к потокам
+except ImportError:
+    httpx = None
+
+console = Console()
+
+CANCELLED = "Cancelled by user."
+
+
+async def _aiter_sync(iterator):
+    """Мост: синхронный итератор читается в потоке, не блокируя event loop."""
+    it = iter(iterator)
+    sentinel = object()
+    while True:
+        item = await asyncio.to_thread(next, it, sentinel)
+        if item is sentinel:
+            return
+        yield item
+
+
+class AsyncHttpPool:
+    """
+    Асинхронный клиент для stream_completion.
+    - С httpx: общий httpx.AsyncClient (keep-alive, опционально HTTP/2),
+      несколько запросов могут быть в полете одновременно.
+    - Без httpx: синхронный HttpPool, чтение чанков в потоках.
+    """
+    def __init__(self, sync_pool, cfg):
+        self.sync_pool = sync_pool
+        self._client = None
+        if httpx is not None:
+            size = cfg.get("http_pool_size", 4)
+            self._client = httpx.AsyncClient(
+                http2=bool(cfg.get("http2", False)) and http2_supported(),
+                limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+                timeout=httpx.Timeout(cfg.get("read_timeout", 120), connect=cfg.get("connect_timeout", 10)),
+            )
+
+    @property
+    def native(self):
+        return self._client is not None
+
+    async def stream(self, payload, api_key=None, cache=None, timer=None, retry=None, gzip_body=False, builder=None):
+        """
+        Асинхронный генератор сырых байтов ответа. Ретраи (статусы RETRY_STATUS,
+        Retry-After, ошибки соединения) - только до первого отданного байта.
+        """
+        retry = retry or RetryPolicy()
+        if not self.native or cache is not None:
+            # Кэш, ретраи и обработка ошибок уже есть в синхронном пути - переиспользуем
+            response = await asyncio.to_thread(api.stream_completion, payload, api_key, self.sync_pool, cache, retry,
+                                               gzip_body, builder)
+            if timer is not None:
+                timer.response(response)
+            completed = False
+            try:
+                async for chunk in _aiter_sync(response.iter_content(chunk_size=None)):
+                    yield chunk
+                completed = True
+            finally:
+                if completed:
+                    response.close()
+                else:
+                    # Отмена (hedging, Ctrl-C): поток to_thread еще держит буфер ответа,
+                    # close() в event loop ждал бы его - закрываем в фоне
+                    threading.Thread(target=response.close, daemon=True).start()
+            return
+
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        encode = builder.encode if builder is not None else encode_payload
+        body = encode(payload)
+        compressed = compress(body) if gzip_body and not api._gzip_state["rejected"] else None
+        if compressed is not None:
+            body = compressed
+            headers["Content-Encoding"] = "gzip"
+        attempt = 0
+        while True:
+            sent = False
+            try:
+                async with self._client.stream("POST", api.API_URL, headers=headers, content=body) as response:
+                    if response.status_code in RETRY_STATUS and attempt < retry.max_retries:
+                        wait = retry.delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                        reason = f"API returned {response.status_code}"
+                    else:
+                        if compressed is not None and response.status_code in (400, 415):
+                            api._gzip_state["rejected"] = True  # Как в api.stream_completion
+                            body = encode(payload)
+                            del headers["Content-Encoding"]
+                            compressed = None
+                            continue
+                        if response.status_code >= 400:
+                            raw = await response.aread()
+                            try:
+                                msg = json.loads(raw).get('error', {}).get('message', raw[:200])
+                            except Exception:
+                                msg = f"Status {response.status_code}"
+                            console.print(f"\n[bold red][API ERROR][/]: {msg}")
+                            raise Exception(f"Network Error: {response.status_code} Error for url: {api.API_URL}")
+                        if timer is not None and timer.ttfb is None:
+                            timer.headers(len(body))  # Ретрай или hedged-запрос: считаем первый ответ
+                        async for chunk in response.aiter_bytes():  # С декодированием Content-Encoding
+                            sent = True
+                            yield chunk
+                        return
+            except httpx.HTTPError as e:
+                if sent:
+                    # Обрыв потока: тот же тип, что у requests, - повтор решает aopen_stream
+                    raise requests.exceptions.ConnectionError(str(e))
+                if attempt >= retry.max_retries:
+                    raise Exception(f"Network Error: {e}")
+                wait = retry.delay(attempt)
+                reason = f"connection failed ({type(e).__name__})"
+            console.print(f"[yellow]⟳ {reason}, retrying in {wait:.1f}s ({attempt + 1}/{retry.max_retries})...[/]")
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+async def aiter_deltas(chunks):
+    """Асинхронный аналог sse.iter_deltas."""
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for data in decoder.feed(chunk):
+            if data == DONE:
+                return
+            for delta in _deltas(data):
+                yield delta
+    for data in decoder.flush():
+        if data == DONE:
+            return
+        for delta in _deltas(data):
+            yield delta
+
+
+class AsyncPollyIDE(PollyIDE):
+    """
+    Асинхронный движок поверх того же состояния сессии (история, бюджеты,
+    планировщик, снимки). Сеть, рендер и инструменты не блокируют друг друга:
+    - рендер идет своей задачей с частотой render_fps, независимо от чтения сети;
+    - инструменты выполняются через asyncio.to_thread, read-only - параллельно;
+    - Ctrl-C отменяет текущий шаг, история остается валидной.
+    Включается настройкой "engine": "async".
+    """
+    _runner = None
+    _aio_http = None
+
+    def run_stream(self):
+        # Один event loop на сессию (asyncio.Runner, 3.11+): async-клиент и его
+        # keep-alive соединения живут между сообщениями. Runner сам превращает
+        # Ctrl-C в отмену текущей задачи.
+        if self._runner is None and hasattr(asyncio, "Runner"):
+            self._runner = asyncio.Runner()
+        try:
+            if self._runner is not None:
+                self._runner.run(self.arun_stream())
+            else:
+                asyncio.run(self._arun_once())
+        except KeyboardInterrupt:
+            console.print("[yellow]⏹ Interrupted.[/]")
+
+    async def _arun_once(self):
+        try:
+            await self.arun_stream()
+        finally:
+            if self._aio_http is not None:
+                await self._aio_http.aclose()
+                self._aio_http = None
+
+    async def arun_stream(self):
+        if self._aio_http is None:
+            self._aio_http = AsyncHttpPool(self.http, self.cfg)
+        budget = TurnBudget.from_config(self.cfg)
+        STATS.begin_turn()
+        try:
+            while True:
+                tool_buffer = await self._astream_step(self._aio_http, budget)
+                if not tool_buffer:
+                    return
+                await self._arun_tools(tool_buffer)
+                if self._budget_exhausted(budget):
+                    return
+        finally:
+            STATS.end_turn(budget.elapsed)
+
+    def close(self):
+        if self._runner is not None:
+            if self._aio_http is not None:
+                self._runner.run(self._aio_http.aclose())
+            self._runner.close()
+        super().close()
+
+    async def _render_loop(self, live):
+        interval = 1 / max(self.cfg.get("render_fps", 10), 1)
+        while True:
+            live.refresh()
+            await asyncio.sleep(interval)
+
+    async def _astream_step(self, aio_http, budget):
+        payload, prompt_tokens = self._begin_step()
+        timer = StepTimer(self.step, self.step_model)
+        tool_buffer = []
+        tool_args = []
+        renderer = StreamRenderer()
+        answer_panel = Panel(renderer, title=f"Polly ({self.step_model})", border_style="blue")
+
+        failed = None
+        with Live(Panel("...", title=f"Polly ({self.step_model})", border_style="blue"), auto_refresh=False) as live:
+            render_task = asyncio.create_task(self._render_loop(live))
+            try:
+                label, deltas = await self._aopen_stream(aio_http, payload, timer)
+                if label == "fallback":
+                    answer_panel.title = f"Polly ({timer.model}, hedged)"
+                started = False
+                async for txt, t_calls in deltas:
+                    if txt or t_calls:
+                        timer.delta()  # Преамбула с ролью - не первый токен
+                    if txt:
+                        if not started:
+                            live.update(answer_panel)
+                            started = True
+                        renderer.feed(txt)
+                    if t_calls:
+                        self._collect_tool_deltas(tool_buffer, tool_args, t_calls)
+            except asyncio.CancelledError:
+                # Сохраняем то, что успели получить, но без недописанных tool_calls
+                renderer.finish()
+                self._finish_step(budget, prompt_tokens, renderer.text, [], [], timer, renderer)
+                raise
+            except Exception as e:
+                if not renderer.text:
+                    live.update(Panel(f"[red]Error: {e}[/]", title="Error"))
+                    self._record_step(timer.finish(prompt_tokens, 0, 0, renderer, error=str(e)))
+                    return []
+                # Как в _stream_step: показанный текст сохраняем, недописанные tool_calls - нет
+                failed = e
+            finally:
+                render_task.cancel()
+                renderer.finish()
+
+        if failed is not None:
+            console.print(f"[red]Stream interrupted: {failed}. Partial answer kept - send a message to continue.[/]")
+            return self._finish_step(budget, prompt_tokens, renderer.text, [], [], timer, renderer)
+        return self._finish_step(budget, prompt_tokens, renderer.text, tool_buffer, tool_args, timer, renderer)
+
+    async def _aopen_stream(self, aio_http, payload, timer):
+        """Как PollyIDE._open_stream: ретраи до первого токена и hedged-запрос к запасной модели."""
+        def start(p=payload):
+            self._before_request(p["model"])
+            return aiter_deltas(aio_http.stream(p, self.cfg["api_key"], self.cache, timer, self.retry,
+                                                self.cfg.get("gzip_requests", False), self.payload_builder))
+
+        start_fallback = None
+        hedge_after, fallback = self._hedge_plan()
+        if fallback:
+            def start_fallback():
+                return start(self._create_payload(fallback, payload.get("tools")))
+
+        label, deltas = await aopen_stream(start, self.retry, hedge_after, start_fallback, self._on_retry)
+        if label == "fallback":
+            timer.model = fallback
+        return label, deltas
+
+    async def _arun_tools(self, tool_buffer):
+        calls = self._parse_calls(tool_buffer)
+        results = [None] * len(calls)
+        cached = {}
+        # Поток to_thread при отмене не прерывается: команды в нем останавливает это событие
+        stop = threading.Event()
+        token = procs.CANCEL.set(stop)
+        try:
+            for batch in self.scheduler.plan(calls):
+                batch = self._skip_unchanged_reads(calls, batch, cached)
+                if len(batch) > 1:
+                    with console.status(f"[bold white]Running {len(batch)} read-only tools...[/]", spinner="dots"):
+                        batch_results = await asyncio.gather(
+                            *(asyncio.to_thread(execute_local_tool, *calls[i]) for i in batch))
+                    for i, result in zip(batch, batch_results):
+                        results[i] = result
+                        console.print(f"[dim]🛠 {self._spinner_text(*calls[i])} [green]Done.[/][/]")
+                elif batch:
+                    i = batch[0]
+                    results[i] = await asyncio.to_thread(self._run_tool, *calls[i])
+        except asyncio.CancelledError:
+            stop.set()  # Группа процессов запущенной команды получит SIGTERM (потом SIGKILL)
+            # У каждого tool_call должен быть результат, иначе API отклонит историю
+            results = [CANCELLED if r is None else r for r in results]
+            self._record_results(tool_buffer, calls, results, cached)
+            raise
+        finally:
+            procs.CANCEL.reset(token)
+        for i in cached:
+            console.print(f"[dim]🛠 {self._spinner_text(*calls[i])} [green]Unchanged.[/][/]")
+        self._record_results(tool_buffer, calls, results, cached)
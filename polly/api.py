@@ -1,42 +1,46 @@
 import requests
-import json                                             from rich.console import Console                        from .tools import get_tools_schema
-                                                        console = Console()                                     API_URL = "https://gen.pollinations.ai/v1/chat/completions"
-
-def sanitize_history(history):                              """                                                     Чистит историю для строгих API (Perplexity, Anthropic, Vertex AI).                                              1. Склеивает подряд идущие сообщения 'user'.            2. Удаляет пустые сообщения (кроме функциональных).
-    """                                                     if not history: return []
-
-    cleaned = []
-    for msg in history:                                         role = msg.get("role")                                  content = msg.get("content")
-        tool_calls = msg.get("tool_calls")                                                                              # --- ЛОГИКА ФИЛЬТРАЦИИ ---
-        # Мы должны оставить сообщение, если:                   # 1. У него есть непустой контент.
-        # 2. ИЛИ это вызов инструмента (Assistant с tool_calls).                                                        # 3. ИЛИ это результат инструмента (Role = tool), даже если контент пустой.                             
-        has_content = content is not None and str(content).strip() != ""
-        has_tool_calls = tool_calls is not None and len(tool_calls) > 0
-        is_tool_result = role == "tool"                                                                                 if not has_content and not has_tool_calls and not is_tool_result:                                                   continue
-                                                                if not cleaned:
-            cleaned.append(msg)
-            continue
+import json
+import time
+from rich.console import Console
+from .tools import get_tools_schema
+from .transport import get_default_pool
+from .context import fit_history, context_budget
+from .cache import payload_key
+from .payload import encode_payload, compress
+from .sanitize import SanitizedView, rules_for, sanitized_history
+from .resilience import RetryPolicy, RETRY_STATUS, parse_retry_after
+
+console = Console()
+API_URL = "https://gen.pollinations.ai/v1/chat/completions"
+
+def sanitize_history(history, model_name=""):
+    """
+    Чистит историю для строгих API (Perplexity, Anthropic, Vertex AI) по
+    правилам провайдера (sanitize.PROVIDER_RULES): склеивает подряд идущие
+    сообщения 'user', удаляет пустые (кроме функциональных). Разовая полная
+    пересборка; на горячем пути - инкрементальный sanitized_history.
+    """
+    if not history: return []
+    return SanitizedView(rules_for(model_name)[1]).update(history)
+
+def create_payload(model, history, config_data, on_evict=None, views=None):
+    # 0. Чистим историю от дублей и пустых сообщений (инкрементально, исходная history не меняется)
+    clean_history = sanitized_history(model, history, views)
 
-        prev = cleaned[-1]                              
-        # Если User идет сразу за User -> склеиваем их в одно сообщение
-        if role == 'user' and prev['role'] == 'user':
-            prev_content = prev.get("content", "")
-            curr_content = msg.get("content", "")
-            prev['content'] = f"{prev_content}\n\n{curr_content}"
-        else:
-            cleaned.append(msg)                         
-    return cleaned
-
-def create_payload(model, history, config_data):
-    # 1. Сначала чистим историю от дублей и пустых сообщений                                                        clean_history = sanitize_history(history)
-                                                            # 2. Получаем схему инструментов
+    # 1. Ужимаем под бюджет контекста модели (измененные сообщения копируются)
+    # on_evict узнает, какие результаты инструментов модель больше не видит
+    clean_history = fit_history(clean_history, context_budget(model, config_data), on_evict)
+
+    # 2. Получаем схему инструментов
     tools = get_tools_schema(config_data)
 
     payload = {
         "model": model,
         "messages": clean_history,
-        "tools": tools,                                         "stream": True,
-    }                                                   
+        "tools": tools,
+        "stream": True,
+    }
+
     # --- ЛОГИКА REASONING (THINKING) ---
     if config_data.get("reasoning", False):
         # Отключаем thinking для Gemini (часто вызывает конфликт с Tools 400 Bad Request)
@@ -44,15 +48,71 @@ def create_payload(model, history, config_data):
             pass
 
         # Для моделей Claude/Kimi можно пробовать включать thinking
-        elif "claude" in model.lower() or "kimi" in model.lower():                                                          payload["thinking"] = {
-                "type": "enabled",                                      "budget_tokens": config_data.get("budget_tokens", 4096)                                                     }                                                   # Для o1/o3 OpenAI
-        elif "o1" in model.lower() or "o3" in model.lower():                                                                payload["reasoning_effort"] = config_data.get("reasoning_effort", "high")                                                                                       return payload
-                                                        def stream_completion(payload, api_key=None):               headers = {"Content-Type": "application/json"}
-    if api_key:                                                 headers["Authorization"] = f"Bearer {api_key}"  
-    try:                                                        response = requests.post(API_URL, headers=headers, json=payload, stream=True, timeout=120)
-                                                                if response.status_code >= 400:                             try:
+        elif "claude" in model.lower() or "kimi" in model.lower():
+            payload["thinking"] = {
+                "type": "enabled",
+                "budget_tokens": config_data.get("budget_tokens", 4096)
+            }
+        # Для o1/o3 OpenAI
+        elif "o1" in model.lower() or "o3" in model.lower():
+            payload["reasoning_effort"] = config_data.get("reasoning_effort", "high")
+    return payload
+
+def stream_completion(payload, api_key=None, http=None, cache=None, retry=None, gzip_body=False, builder=None):
+    # Кэш ответов (opt-in): одинаковый payload -> тот же сохраненный SSE-поток
+    if cache is not None:
+        key = payload_key(payload)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        if cache.mode == "replay":
+            raise Exception("Response cache miss in replay mode (no network)")
+
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    # Переиспользуем keep-alive соединение вместо нового рукопожатия на каждый запрос
+    http = http or get_default_pool()
+    retry = retry or RetryPolicy()
+    encode = builder.encode if builder is not None else encode_payload
+    body = encode(payload)
+    compressed = compress(body) if gzip_body and not _gzip_state["rejected"] else None
+    if compressed is not None:
+        body = compressed
+        headers["Content-Encoding"] = "gzip"
+    attempt = 0
+    while True:
+        try:
+            response = http.post(API_URL, headers=headers, data=body, stream=True)
+        except requests.exceptions.RequestException as e:
+            if attempt < retry.max_retries and RetryPolicy.retryable(e):
+                attempt = _backoff(retry, attempt, f"connection failed ({type(e).__name__})")
+                continue
+            raise Exception(f"Network Error: {e}")
+        response.request_bytes = len(body)  # Для метрик шага
+
+        if response.status_code in RETRY_STATUS and attempt < retry.max_retries:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            response.close()
+            attempt = _backoff(retry, attempt, f"API returned {response.status_code}", retry_after)
+            continue
+
+        if compressed is not None and response.status_code in (400, 415):
+            # Эндпоинт не принимает gzip: один раз повторяем без сжатия и больше не сжимаем
+            response.close()
+            _gzip_state["rejected"] = True
+            body = encode(payload)
+            del headers["Content-Encoding"]
+            compressed = None
+            continue
+
+        if response.status_code >= 400:
+            try:
                 err = response.json()
-                msg = err.get('error', {}).get('message', str(err))                                                             # Вывод ошибки в консоль                                console.print(f"\n[bold red][API ERROR][/]: {msg}")                                                         except:
+                msg = err.get('error', {}).get('message', str(err))
+                # Вывод ошибки в консоль
+                console.print(f"\n[bold red][API ERROR][/]: {msg}")
+            except:
                 console.print(f"\n[bold red][API ERROR][/]: Status {response.status_code}")
                 # Если 400, часто помогает просто напечатать тело, чтобы понять причину
                 console.print(response.text[:200])
@@ -60,7 +120,20 @@ def create_payload(model, history, config_data):
             # Не вызываем raise_for_status сразу, чтобы поток не падал,
             # но вышестоящий код должен обработать это.
             # Для надежности кидаем исключение.
-            response.raise_for_status()
-                                                                return response
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Network Error: {e}")
+            try:
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                raise Exception(f"Network Error: {e}")
+
+        if cache is not None:
+            return cache.record(key, response)
+        return response
+
+# Эндпоинт отверг gzip-тело: дальше в этом процессе шлем без сжатия
+_gzip_state = {"rejected": False}
+
+def _backoff(retry, attempt, reason, retry_after=None):
+    wait = retry.delay(attempt, retry_after)
+    console.print(f"[yellow]⟳ {reason}, retrying in {wait:.1f}s ({attempt + 1}/{retry.max_retries})...[/]")
+    time.sleep(wait)
+    return attempt + 1
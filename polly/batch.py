@@ -0,0 +1,399 @@
+"""
+polly batch: много независимых диалогов из JSONL параллельно.
+
+Строка входа - JSON-объект:
+    {"id": "review-1", "prompt": "Review src/app.py", "model": "claude", "cwd": "/repo", "system": "..."}
+Обязателен только prompt; id по умолчанию - номер строки, остальное берется
+из конфига и аргументов командной строки.
+
+Каждый диалог - тот же цикл агента, что в PollyIDE (запрос -> инструменты ->
+запрос, бюджет TurnBudget), но без Live-рендера, спиннеров и журнала сессии.
+Результаты пишутся NDJSON по мере готовности; при повторном запуске с тем же
+--output уже успешные id пропускаются, упавшие выполняются заново.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from rich.console import Console
+
+from .config import ConfigManager
+from .core import PollyIDE
+from .tools import READ_ONLY_TOOLS, execute_local_tool, get_tools_schema, configure_tools, run_command
+from .transport import HttpPool
+from .cache import ResponseCache
+from .resilience import RetryPolicy
+from .patch import PatchError, apply_patch
+from .agent import TurnBudget
+from .metrics import StepTimer
+from .router import ModelRouter
+
+# stdout может быть занят NDJSON - все сообщения идут в stderr
+console = Console(stderr=True)
+
+# Интерактивные и долгоживущие инструменты в batch не предлагаются
+BATCH_EXCLUDED = {"secrets_env", "list_processes", "process_logs", "kill_process"}
+# Аргументы инструментов, которые являются путями
+PATH_ARGS = ("path", "src", "dest")
+
+
+class RateLimiter:
+    """Не больше per_minute запросов в минуту: каждый следующий - не раньше чем через 60/per_minute сек."""
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Workdir:
+    """
+    Рабочая папка диалога. Процесс один, os.chdir общий для всех потоков,
+    поэтому относительные пути инструментов переписываются в абсолютные от root,
+    а `cd` в execute_command меняет только папку этого диалога.
+    confine=True (--sandbox): пути вне root отвергаются, команды оболочки
+    недоступны (их побочные эффекты папкой не ограничить).
+    """
+    def __init__(self, root, confine=False):
+        self.root = os.path.realpath(root)
+        self.cwd = self.root
+        self.confine = confine
+
+    def resolve(self, path):
+        full = os.path.realpath(os.path.join(self.cwd, os.path.expanduser(path)))
+        if self.confine and full != self.root and not full.startswith(self.root + os.sep):
+            raise PermissionError(f"Path '{path}' is outside the sandbox {self.root}")
+        return full
+
+    def rewrite(self, name, args):
+        """Копия args с абсолютными путями. PermissionError - путь вне песочницы."""
+        args = dict(args)
+        if name in ("list_files", "search_code"):
+            args.setdefault("path", ".")
+        for key in PATH_ARGS:
+            if isinstance(args.get(key), str):
+                args[key] = self.resolve(args[key])
+        return args
+
+    def apply_patch(self, args):
+        """Пути внутри diff - тоже от папки диалога и в пределах песочницы."""
+        try:
+            return apply_patch(args.get("patch", ""), resolve=self.resolve)
+        except (PatchError, PermissionError) as e:
+            return f"Error: {e}"
+
+    def run_command(self, args):
+        cmd = args.get("command", "")
+        if args.get("background"):
+            return "Error: background processes are not available in batch mode."
+        if cmd.startswith("cd "):
+            try:
+                path = self.resolve(cmd[3:].strip())
+            except PermissionError as e:
+                return f"Error: {e}"
+            if not os.path.isdir(path):
+                return f"Error: No such directory: {path}"
+            self.cwd = path
+            return f"CWD changed to {path}"
+        return run_command(cmd, args.get("timeout"), cwd=self.cwd)
+
+
+class BatchJob:
+    def __init__(self, job_id, prompt, model=None, cwd=None, system=None):
+        self.id = job_id
+        self.prompt = prompt
+        self.model = model
+        self.cwd = cwd
+        self.system = system
+
+    @classmethod
+    def parse(cls, line, lineno):
+        data = json.loads(line)
+        if not isinstance(data, dict) or not data.get("prompt"):
+            raise ValueError("expected an object with a 'prompt'")
+        return cls(str(data.get("id", lineno)), data["prompt"], data.get("model"), data.get("cwd"), data.get("system"))
+
+
+def read_jobs(path):
+    """Задания из JSONL ('-' - stdin). Битые строки - ошибка с номером строки."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    jobs = []
+    try:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                jobs.append(BatchJob.parse(line, lineno))
+            except ValueError as e:
+                raise ValueError(f"{path}:{lineno}: {e}") from None
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return jobs
+
+
+def completed_ids(path):
+    """id заданий, уже успешно записанных в выходной файл (для продолжения после сбоя)."""
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # Недописанная строка при аварийном завершении
+                if rec.get("status") == "ok":
+                    done.add(rec.get("id"))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+class BatchConversation(PollyIDE):
+    """
+    Один диалог batch поверх цикла PollyIDE: пул соединений, кэш и политика
+    ретраев общие на весь batch; история, снимки файлов и рабочая папка - свои.
+    """
+    def __init__(self, runner, job):
+        cfg = dict(runner.cfg, model=job.model or runner.cfg["model"])
+        if job.model:
+            cfg["route_models"] = False  # Модель задания задана явно
+        self._setup(runner.cfg_mgr, cfg, runner.http, runner.cache, runner.retry, runner.router)
+        self.history = [{"role": "system", "content": job.system or runner.system_prompt},
+                        {"role": "user", "content": job.prompt}]
+        self.runner = runner
+        self.workdir = Workdir(job.cwd or runner.cwd, runner.sandbox)
+        self.budget = None
+        self.tool_calls = 0
+        self.error = None
+
+    def run(self):
+        """Цикл агента до ответа без вызовов инструментов. Возвращает причину остановки по бюджету или None."""
+        budget = self.budget = TurnBudget.from_config(self.cfg)
+        while True:
+            tool_buffer = self._stream_step(budget)
+            if not tool_buffer or self.error:
+                return None
+            self._run_tools(tool_buffer)
+            reason = budget.exceeded()
+            if reason:
+                return reason
+
+    def _request_tools(self):
+        return self.runner.tools
+
+    def _before_request(self, model):
+        # Лимит на каждую попытку, включая ретраи и hedged-запрос к запасной модели
+        self.runner.limiter(model).acquire()
+
+    def _stream_step(self, budget):
+        payload, prompt_tokens = self._begin_step()
+        timer = StepTimer(self.step, self.step_model)
+        tool_buffer = []
+        tool_args = []
+        parts = []
+        try:
+            _, _, deltas = self._open_stream(payload, timer)
+            for txt, t_calls in deltas:
+                if txt or t_calls:
+                    timer.delta()  # TTFT нужен роутеру моделей и в batch
+                if txt:
+                    parts.append(txt)
+                if t_calls:
+                    self._collect_tool_deltas(tool_buffer, tool_args, t_calls)
+        except Exception as e:
+            if not parts:
+                self._record_step(timer.finish(prompt_tokens, 0, 0, error=str(e)))
+                raise
+            # Обрыв посреди ответа: часть сохраняем, задание считается неуспешным
+            self.error = f"Stream interrupted: {e}"
+            tool_buffer, tool_args = [], []
+        return self._finish_step(budget, prompt_tokens, "".join(parts), tool_buffer, tool_args, timer)
+
+    def _run_tools(self, tool_buffer):
+        calls = []
+        for name, args in self._parse_calls(tool_buffer):
+            try:
+                calls.append((name, self.workdir.rewrite(name, args), None))
+            except PermissionError as e:
+                calls.append((name, args, f"Error: {e}"))
+        self.tool_calls += len(calls)
+        results = [None] * len(calls)
+        cached = {}
+        for batch in self.scheduler.plan([(name, args) for name, args, _ in calls]):
+            batch = self._skip_unchanged_reads(calls, batch, cached)
+            for i, result in zip(batch, self.scheduler.map(lambda i: self._run_tool(*calls[i]), batch)):
+                results[i] = result
+        self._record_results(tool_buffer, [(name, args) for name, args, _ in calls], results, cached)
+
+    def _run_tool(self, func_name, args, denied=None):
+        if denied is not None:
+            return denied
+        if func_name not in self.runner.tool_names:
+            return f"Error: tool '{func_name}' is not available in batch mode."
+        if func_name == "execute_command":
+            return self.workdir.run_command(args)
+        if func_name == "apply_patch":
+            return self.workdir.apply_patch(args)
+        return execute_local_tool(func_name, args)
+
+    def answer(self):
+        for msg in reversed(self.history):
+            if msg["role"] == "assistant" and msg.get("content"):
+                return msg["content"]
+        return ""
+
+
+class BatchRunner:
+    """
+    Пул потоков над заданиями: общий пул соединений (размером с число
+    воркеров), лимит запросов в минуту на модель, NDJSON по мере готовности.
+    """
+    def __init__(self, cfg_mgr=None, workers=None, model=None, rpm=None, cwd=None, sandbox=False, tools="all"):
+        self.cfg_mgr = cfg_mgr or ConfigManager()
+        self.cfg = dict(self.cfg_mgr.load())
+        if model:
+            self.cfg["model"] = model
+        configure_tools(self.cfg)
+        self.workers = workers or self.cfg.get("batch_workers", 8)
+        self.system_prompt = self.cfg_mgr.get_system_prompt()
+        self.cwd = os.path.abspath(cwd or os.getcwd())
+        self.sandbox = sandbox
+        self.http = HttpPool.from_config(dict(self.cfg, http_pool_size=max(self.workers, self.cfg.get("http_pool_size", 4))))
+        self.cache = ResponseCache.from_config(self.cfg)
+        self.retry = RetryPolicy.from_config(self.cfg)
+        self.router = ModelRouter.from_config(self.cfg)  # Общие замеры скорости: пишутся и из batch
+        # Лимиты запросов в минуту: {"*": по умолчанию для каждой модели, "model": свой}
+        self.rpm = dict(self.cfg.get("batch_rpm") or {})
+        self.rpm.update(rpm or {})
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+        allowed = {"none": set(), "read": READ_ONLY_TOOLS}.get(tools)
+        excluded = BATCH_EXCLUDED | ({"execute_command"} if sandbox else set())
+        # Один список на весь batch: PayloadBuilder кэширует его JSON по identity
+        self.tools = [t for t in get_tools_schema(self.cfg)
+                      if "function" not in t or (t["function"]["name"] not in excluded
+                                                 and (allowed is None or t["function"]["name"] in allowed))]
+        if allowed is not None and not allowed:
+            self.tools = []
+        self.tool_names = {t["function"]["name"] for t in self.tools if "function" in t}
+
+    def limiter(self, model):
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limiter = self._limiters[model] = RateLimiter(self.rpm.get(model, self.rpm.get("*", 0)))
+            return limiter
+
+    def run_job(self, job):
+        t0 = time.monotonic()
+        conv = BatchConversation(self, job)
+        record = {"id": job.id, "model": conv.cfg["model"]}
+        try:
+            stop_reason = conv.run()
+            record.update(status="error" if conv.error else "ok", answer=conv.answer(), error=conv.error,
+                          stop_reason=stop_reason)
+        except Exception as e:
+            record.update(status="error", answer=conv.answer(), error=str(e), stop_reason=None)
+        finally:
+            conv.scheduler.shutdown()
+        budget = conv.budget
+        record.update(
+            model=conv.step_model,
+            steps=budget.steps if budget else 0,
+            tool_calls=conv.tool_calls,
+            prompt_tokens=budget.prompt_tokens if budget else 0,
+            completion_tokens=budget.completion_tokens if budget else 0,
+            elapsed_s=round(time.monotonic() - t0, 2),
+        )
+        return record
+
+    def run(self, jobs, out, skip=()):
+        """Выполняет задания, пишет результаты в out (построчно, с flush). Возвращает (ok, failed)."""
+        pending = [j for j in jobs if j.id not in skip]
+        if len(pending) < len(jobs):
+            console.print(f"[dim]Skipping {len(jobs) - len(pending)} jobs already completed.[/]")
+        counts = {"ok": 0, "error": 0}
+
+        def write(record):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            counts[record["status"]] += 1
+            if record["status"] != "ok":
+                console.print(f"[red]✗ {record['id']}: {record['error']}[/]")
+            console.print(f"[dim][{counts['ok'] + counts['error']}/{len(pending)}] {record['id']} "
+                          f"{record['status']} in {record['elapsed_s']}s[/]")
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="polly-batch")
+        futures = [pool.submit(self.run_job, job) for job in pending]
+        try:
+            for future in as_completed(futures):
+                write(future.result())
+        except KeyboardInterrupt:
+            # Новые задания не стартуют, начатые дописываются (повторный Ctrl+C - выход сразу)
+            console.print("[yellow]Interrupted: waiting for running jobs (Ctrl+C again to abort). "
+                          "Rerun with the same --output to continue.[/]")
+            for future in futures:
+                future.cancel()
+            for future in as_completed(futures):
+                if not future.cancelled():
+                    write(future.result())
+            raise
+        finally:
+            pool.shutdown(wait=False)
+            self.http.close()
+            self.router.save()
+        return counts["ok"], counts["error"]
+
+
+def _redirect_consoles():
+    """Сообщения модулей polly (ретраи, ошибки API) - в stderr, чтобы не смешивать с NDJSON."""
+    for name, module in list(sys.modules.items()):
+        if name.startswith("polly.") and isinstance(getattr(module, "console", None), Console):
+            module.console = console
+
+
+def parse_rpm(values):
+    """['60', 'claude=20'] -> {'*': 60, 'claude': 20}"""
+    rpm = {}
+    for value in values or ():
+        model, _, limit = value.rpartition("=")
+        rpm[model or "*"] = float(limit)
+    return rpm
+
+
+def run_batch(args):
+    try:
+        jobs = read_jobs(args.input)
+    except (OSError, ValueError) as e:
+        console.print(f"[red]{e}[/]")
+        return 2
+    _redirect_consoles()
+    runner = BatchRunner(workers=args.workers, model=args.model, rpm=parse_rpm(args.rpm), cwd=args.cwd,
+                         sandbox=args.sandbox, tools=args.tools)
+    skip = completed_ids(args.output) if args.output else set()
+    t0 = time.monotonic()
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        ok, failed = runner.run(jobs, out, skip)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    console.print(f"[bold]Batch: {ok} ok, {failed} failed, {len(skip & {j.id for j in jobs})} skipped "
+                  f"in {time.monotonic() - t0:.1f}s[/]")
+    return 1 if failed else 0
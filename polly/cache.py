@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from .config import CONFIG_DIR
+
+CACHE_DIR = CONFIG_DIR / "cache"
+CHUNK = 16 * 1024
+
+
+def payload_key(payload):
+    """Канонический хэш запроса: порядок ключей и пробелы не влияют."""
+    canon = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    """Ответ из кэша с тем же интерфейсом, что и потоковый requests.Response."""
+    status_code = 200
+    from_cache = True
+
+    def __init__(self, path):
+        self.path = path
+
+    def iter_content(self, chunk_size=None):
+        with open(self.path, "rb") as f:
+            while True:
+                block = f.read(chunk_size or CHUNK)
+                if not block:
+                    break
+                yield block
+
+    def close(self):
+        pass
+
+
+class _RecordingResponse:
+    """Прокси над живым ответом: отдает чанки дальше и пишет их во временный файл."""
+    def __init__(self, response, cache, key):
+        self._response = response
+        self._cache = cache
+        self._key = key
+        self.status_code = response.status_code
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def iter_content(self, chunk_size=None):
+        fd, tmp = tempfile.mkstemp(dir=self._cache.root, suffix=".part")
+        complete = False
+        tail = b""
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in self._response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    # Потребитель может остановиться на [DONE], не дочитав поток
+                    complete = b"[DONE]" in tail + chunk
+                    tail = chunk[-16:]
+                    yield chunk
+                complete = True
+        finally:
+            if complete:
+                self._cache.commit(self._key, tmp)
+            else:
+                os.unlink(tmp)
+
+
+class ResponseCache:
+    """
+    Контент-адресный кэш сырых SSE-ответов в ~/.polly/cache с LRU по размеру.
+    Режимы: "on" - читать и писать; "replay" - только из кэша, без сети.
+    Время последнего доступа хранится в mtime файла.
+    """
+    def __init__(self, root=CACHE_DIR, max_bytes=200 * 1024 * 1024, mode="on"):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, cfg):
+        """None, если кэш выключен. Переменная POLLY_RESPONSE_CACHE перекрывает конфиг."""
+        mode = os.environ.get("POLLY_RESPONSE_CACHE") or cfg.get("response_cache", "off")
+        if mode not in ("on", "replay"):
+            return None
+        return cls(max_bytes=int(cfg.get("cache_max_mb", 200)) * 1024 * 1024, mode=mode)
+
+    def _path(self, key):
+        return self.root / f"{key}.sse"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            os.utime(path)  # LRU: отмечаем доступ
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResponse(path)
+
+    def record(self, key, response):
+        return _RecordingResponse(response, self, key)
+
+    def commit(self, key, tmp):
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for path in self.root.glob("*.sse"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                except OSError:
+                    pass
+
+    def clear(self):
+        for path in self.root.glob("*.sse"):
+            path.unlink()
@@ -1,5 +1,7 @@
 # polly/config.py
 import json
+import os
+import tempfile
 from pathlib import Path
 
 APP_NAME = "polly"
@@ -10,6 +12,7 @@ DEFAULT_SYSTEM_PROMPT = """
 You are Polly, an elite IDE AI Assistant.
 - You have access to the local file system and terminal.
 - Use `write_file` to create code, do not just print it.
+- Use `edit_file` to change existing files instead of rewriting them with `write_file`.
 - If the user asks for information and you have search capabilities, use them.
 - Be concise, professional, and accurate.
 - Always add env file if its needed in your script, and ask user for api keys using tool calling.
@@ -20,36 +23,115 @@ class ConfigManager:
         "api_key": None,
         "model": "claude",
         "reasoning": False,
-        "custom_prompt_path": None
+        "custom_prompt_path": None,
+        "engine": "sync",  # sync / async
+        # --- HTTP ---
+        "http_pool_size": 4,
+        "connect_timeout": 10,
+        "read_timeout": 120,
+        "http2": False,
+        "gzip_requests": False,  # Content-Encoding: gzip для больших тел (если API принимает)
+        "max_retries": 3,
+        "retry_base_delay": 0.5,
+        "retry_max_delay": 20,
+        "hedge_after": 0,  # Сек без первого токена до hedged-запроса (0 - выключено)
+        "fallback_model": None,  # None - подобрать по MODELS_DB
+        # --- UI ---
+        "render_fps": 10,
+        # --- TOOLS ---
+        "tool_workers": 8,
+        "read_max_bytes": 262144,
+        "read_preview_lines": 100,
+        "bg_ready_timeout": 10,
+        "bg_log_bytes": 65536,
+        "exec_max_bytes": 65536,
+        # --- AGENT LOOP (0 = без ограничения) ---
+        "max_steps": 25,
+        "max_turn_seconds": 600,
+        "max_turn_tokens": 400000,
+        # --- CONTEXT ---
+        "max_context_tokens": 120000,
+        "context_ratio": 0.75,
+        # --- RESPONSE CACHE: off / on / replay ---
+        "response_cache": "off",
+        "cache_max_mb": 200,
+        # --- MODEL ROUTER (замеры в ~/.polly/model_stats.json) ---
+        "route_models": False,  # True - на каждый запрос самая быстрая здоровая модель с нужными возможностями
+        "router_explore": 0.1,  # Доля запросов к еще не измеренным моделям
+        "router_models": None,  # Список моделей для выбора (None - все из MODELS_DB)
+        # --- BATCH (polly batch) ---
+        "batch_workers": 8,
+        "batch_rpm": {},  # Запросов в минуту: {"*": на каждую модель, "<model>": свой лимит}
+        # --- SESSIONS (~/.polly/sessions) ---
+        "sessions": True,
+        "session_blob_bytes": 16384,
+        "session_fsync_seconds": 1.0,
+        "session_max_count": 200,  # Старые журналы сверх числа/возраста удаляются (0 - без ограничения)
+        "session_max_age_days": 30
     }
 
     def __init__(self):
-        if not CONFIG_DIR.exists():
-            CONFIG_DIR.mkdir()
+        CONFIG_DIR.mkdir(parents=True, exist_ok=True)
+        # Кэш в памяти: перечитываем файл, только если сменились mtime/размер
+        self._data = None
+        self._stamp = None
+        self._prompt = None
+        self._prompt_stamp = None
         if not CONFIG_FILE.exists():
             self.save(self.defaults)
 
-    def load(self):
+    @staticmethod
+    def _file_stamp(path):
         try:
-            with open(CONFIG_FILE, 'r') as f:
-                data = json.load(f)
-            return {**self.defaults, **data}
-        except:
-            return self.defaults
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def load(self):
+        stamp = self._file_stamp(CONFIG_FILE)
+        if self._data is None or stamp != self._stamp:
+            try:
+                with open(CONFIG_FILE, 'r') as f:
+                    data = json.load(f)
+                self._data = {**self.defaults, **data}
+            except:
+                self._data = dict(self.defaults)
+            self._stamp = stamp
+        # Копия: вызывающий код может менять свой словарь
+        return dict(self._data)
 
     def save(self, data):
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
+        # Атомарная запись: temp-файл + rename, параллельные процессы не увидят половину файла
+        fd, tmp = tempfile.mkstemp(dir=CONFIG_DIR, prefix=".config.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, CONFIG_FILE)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self._data = {**self.defaults, **data}
+        self._stamp = self._file_stamp(CONFIG_FILE)
 
     def update(self, key, value):
+        """Меняет один ключ и возвращает актуальный конфиг."""
         data = self.load()
         data[key] = value
         self.save(data)
+        return dict(self._data)
 
     def get_system_prompt(self):
         data = self.load()
-        if data.get("custom_prompt_path"):
-            path = Path(data["custom_prompt_path"])
-            if path.exists():
-                return path.read_text(encoding="utf-8")
-        return DEFAULT_SYSTEM_PROMPT
+        path = data.get("custom_prompt_path")
+        stamp = (path, self._file_stamp(path)) if path else None
+        if self._prompt is not None and stamp == self._prompt_stamp:
+            return self._prompt
+        prompt = DEFAULT_SYSTEM_PROMPT
+        if path and stamp[1] is not None:
+            prompt = Path(path).read_text(encoding="utf-8")
+        self._prompt, self._prompt_stamp = prompt, stamp
+        return prompt
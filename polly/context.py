@@ -0,0 +1,126 @@
+import json
+from .models import get_context_window
+
+ELIDE_AFTER = 800     # Результаты длиннее этого (символов) можно сокращать
+KEEP_HEAD = 300       # Сколько символов оставить от сокращенного результата
+
+
+def estimate_tokens(text):
+    """Грубая оценка: ~4 символа на токен. Точный токенайзер тут не нужен."""
+    return len(text) // 4 if text else 0
+
+
+def message_tokens(msg):
+    tokens = 4  # роль и служебная разметка
+    content = msg.get("content")
+    if content:
+        tokens += estimate_tokens(content if isinstance(content, str) else str(content))
+    for tc in msg.get("tool_calls") or []:
+        fn = tc.get("function", {})
+        tokens += estimate_tokens(fn.get("name", "")) + estimate_tokens(fn.get("arguments", ""))
+    return tokens
+
+
+def context_budget(model, cfg):
+    """Бюджет истории в токенах: часть окна модели, но не больше max_context_tokens."""
+    window = get_context_window(model)
+    return min(int(window * cfg.get("context_ratio", 0.75)), cfg.get("max_context_tokens", 120000))
+
+
+def _elide_text(text):
+    return f"{text[:KEEP_HEAD]}\n[Polly: {len(text) - KEEP_HEAD} chars elided to save context. Re-run the tool if you need it again.]"
+
+
+def _elide_tool_result(msg):
+    content = msg.get("content")
+    if not isinstance(content, str) or len(content) <= ELIDE_AFTER:
+        return None
+    return {**msg, "content": _elide_text(content)}
+
+
+def _elide_tool_calls(msg):
+    """Длинные аргументы старых вызовов (например, content у write_file)."""
+    calls = msg.get("tool_calls")
+    if not calls or not any(len(tc.get("function", {}).get("arguments", "")) > ELIDE_AFTER for tc in calls):
+        return None
+    new_calls = []
+    for tc in calls:
+        fn = tc.get("function", {})
+        args = fn.get("arguments", "")
+        if len(args) > ELIDE_AFTER:
+            try:
+                data = json.loads(args)
+                # Аргументы должны остаться валидным JSON
+                data = {k: _elide_text(v) if isinstance(v, str) and len(v) > ELIDE_AFTER else v for k, v in data.items()}
+                args = json.dumps(data, ensure_ascii=False)
+            except (ValueError, AttributeError):
+                args = "{}"
+            tc = {**tc, "function": {**fn, "arguments": args}}
+        new_calls.append(tc)
+    return {**msg, "tool_calls": new_calls}
+
+
+def fit_history(history, budget, on_evict=None):
+    """
+    Возвращает историю, укладывающуюся в budget токенов. Исходный список и
+    словари не меняются - измененные сообщения копируются.
+    on_evict(tool_call_ids) получает id результатов инструментов, которые
+    сокращены или выкинуты: модель их больше не видит (FileSnapshots.evict).
+    Порядок ужатия:
+      1. сокращаем старые результаты инструментов и длинные аргументы вызовов;
+      2. выкидываем самые старые ходы целиком (user + все его assistant/tool),
+         поэтому пары tool_call/tool result не рвутся;
+      3. если не влезает даже последний ход - сокращаем и его инструменты,
+         кроме результатов самого последнего вызова.
+    Системный промпт остается всегда.
+    """
+    if not history:
+        return history
+    sizes = [message_tokens(m) for m in history]
+    total = sum(sizes)
+    if total <= budget:
+        return history
+
+    msgs = list(history)
+    evicted = []
+    has_system = msgs[0].get("role") == "system"
+    first = 1 if has_system else 0
+    user_idx = [i for i in range(first, len(msgs)) if msgs[i].get("role") == "user"]
+    last_turn = user_idx[-1] if user_idx else first
+
+    def elide(start, stop):
+        nonlocal total
+        for i in range(start, stop):
+            if total <= budget:
+                return
+            msg = msgs[i]
+            new = _elide_tool_result(msg) if msg.get("role") == "tool" else _elide_tool_calls(msg)
+            if new is not None:
+                if msg.get("role") == "tool":
+                    evicted.append(msg.get("tool_call_id"))
+                size = message_tokens(new)
+                total += size - sizes[i]
+                msgs[i], sizes[i] = new, size
+
+    # 1. Старые ходы: сокращаем инструменты
+    elide(first, last_turn)
+
+    # 2. Старые ходы: выкидываем целиком, от самых старых
+    cut = first
+    for start in user_idx[1:]:
+        if total <= budget:
+            break
+        total -= sum(sizes[cut:start])
+        cut = start
+    if cut > first:
+        evicted.extend(m.get("tool_call_id") for m in msgs[first:cut] if m.get("role") == "tool")
+        msgs = msgs[:first] + msgs[cut:]
+        sizes = sizes[:first] + sizes[cut:]
+        last_turn -= cut - first
+
+    # 3. Текущий ход: сокращаем все, кроме результатов последнего вызова
+    last_assistant = max((i for i in range(len(msgs)) if msgs[i].get("role") == "assistant"), default=len(msgs))
+    elide(last_turn, last_assistant)
+    if on_evict is not None and evicted:
+        on_evict(evicted)
+    return msgs
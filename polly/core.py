@@ -1,25 +1,67 @@
 import json
 import os
 import shlex
+import time
 from rich.console import Console
 from rich.panel import Panel
-from rich.markdown import Markdown
 from rich.prompt import Prompt
 from rich.live import Live
 
-from .config import ConfigManager
+from .config import ConfigManager, CONFIG_DIR
 from .api import create_payload, stream_completion
-from .tools import execute_local_tool
+from .tools import execute_local_tool, configure_tools, get_tools_schema
+from . import procs
+from .transport import HttpPool
+from .render import StreamRenderer
+from .scheduler import ToolScheduler
+from .agent import TurnBudget
+from .snapshots import FileSnapshots
+from .payload import PayloadBuilder
+from .cache import ResponseCache
+from .sessions import SessionStore, find_session, list_sessions
+from .metrics import STATS, StepTimer
+from .context import estimate_tokens, message_tokens
+from .resilience import RetryPolicy, open_stream
 from .utils import upgrade_polly
-from .models import list_models_table
+from .models import list_models_table, pick_fallback, CAP_CODE, CAP_SEARCH, CAP_REASONING, CAP_TOOLS
+from .router import ModelRouter, print_model_stats
 
 console = Console()
 
 class PollyIDE:
     def __init__(self):
-        self.cfg_mgr = ConfigManager()
-        self.cfg = self.cfg_mgr.load()
+        cfg_mgr = ConfigManager()
+        cfg = cfg_mgr.load()
+        configure_tools(cfg)
+        # Один пул соединений на всю сессию
+        self._setup(cfg_mgr, cfg, HttpPool.from_config(cfg), ResponseCache.from_config(cfg),
+                    RetryPolicy.from_config(cfg), ModelRouter.from_config(cfg))
         self.history = [{"role": "system", "content": self.cfg_mgr.get_system_prompt()}]
+        # Журнал сессии в ~/.polly/sessions (None, если выключен). Создается на
+        # первом сообщении в интерактивном режиме: разовые запросы журнал не плодят
+        self._session_pending = True
+
+    def _setup(self, cfg_mgr, cfg, http, cache, retry, router):
+        """
+        Состояние одного диалога. Пул соединений, кэш ответов (None, если выключен),
+        политика ретраев и роутер передаются готовыми: batch делит их между заданиями.
+        """
+        self.cfg_mgr = cfg_mgr
+        self.cfg = cfg
+        self.http = http
+        self.cache = cache
+        self.retry = retry
+        self.scheduler = ToolScheduler(max_workers=self.cfg.get("tool_workers", 8))
+        # Снимки прочитанных файлов: повторное чтение -> ссылка или diff
+        self.snapshots = FileSnapshots(max_bytes=self.cfg.get("read_max_bytes", 262144))
+        # Кэш JSON сообщений и очищенные виды истории этого диалога
+        self.payload_builder = PayloadBuilder()
+        self.sanitized_views = {}
+        self.step = 0  # Номер запроса к модели в сессии
+        # Замеры скорости моделей; с route_models - и выбор модели на каждый запрос
+        self.router = router
+        self.step_model = self.cfg["model"]  # Модель текущего запроса
+        self.session = None
 
     def handle_slash_command(self, cmd_line):
         try:
@@ -31,6 +73,7 @@ class PollyIDE:
         
         if base == "/reset":
             self.history = [{"role": "system", "content": self.cfg_mgr.get_system_prompt()}]
+            self.snapshots.forget()
             console.print("[yellow]🧹 Context cleared.[/]")
             return True
         elif base == "/upgrade":
@@ -38,6 +81,15 @@ class PollyIDE:
             return True
         elif base == "/models":
             list_models_table()
+            print_model_stats(self.router, console, self.cfg["model"])
+            return True
+        elif base == "/route":
+            if len(parts) < 2:
+                console.print(f"[green]Model routing: {self.cfg.get('route_models', False)}[/]")
+                return True
+            val = parts[1].lower() == "on"
+            self.cfg = self.cfg_mgr.update("route_models", val)
+            console.print(f"[green]Model routing: {val}[/]")
             return True
         elif base == "/config":
             console.print(Panel(json.dumps(self.cfg, indent=2), title="Config", border_style="cyan"))
@@ -48,8 +100,9 @@ class PollyIDE:
                 return True
             path = parts[1]
             if os.path.exists(path):
-                self.cfg_mgr.update("custom_prompt_path", os.path.abspath(path))
+                self.cfg = self.cfg_mgr.update("custom_prompt_path", os.path.abspath(path))
                 self.history = [{"role": "system", "content": self.cfg_mgr.get_system_prompt()}]
+                self.snapshots.forget()
                 console.print(f"[green]System prompt loaded from {path}. Memory reset.[/]")
             else:
                 console.print(f"[red]File not found: {path}[/]")
@@ -57,88 +110,291 @@ class PollyIDE:
         elif base == "/google":
             if len(parts) < 2: return True
             val = parts[1].lower() == "on"
-            self.cfg_mgr.update("google_search", val)
-            self.cfg = self.cfg_mgr.load()
+            self.cfg = self.cfg_mgr.update("google_search", val)
             console.print(f"[green]Google Search: {val}[/]")
             return True
         elif base == "/reasoning":
             if len(parts) < 2: return True
             val = parts[1].lower() == "on"
-            self.cfg_mgr.update("reasoning", val)
-            self.cfg = self.cfg_mgr.load()
+            self.cfg = self.cfg_mgr.update("reasoning", val)
             console.print(f"[green]Reasoning: {val}[/]")
             return True
         elif base == "/api":
             if len(parts) < 2: return True
-            self.cfg_mgr.update("api_key", parts[1])
-            self.cfg = self.cfg_mgr.load()
+            self.cfg = self.cfg_mgr.update("api_key", parts[1])
             console.print("[green]API Key saved.[/]")
             return True
         elif base == "/model":
             if len(parts) < 2: return True
-            self.cfg_mgr.update("model", parts[1])
-            self.cfg = self.cfg_mgr.load()
+            self.cfg = self.cfg_mgr.update("model", parts[1])
             console.print(f"[green]Model: {parts[1]}[/]")
             return True
+        elif base == "/net":
+            console.print(Panel(json.dumps(self.http.stats(), indent=2), title="Connection Pool", border_style="cyan"))
+            return True
+        elif base == "/resume":
+            if len(parts) < 2:
+                self._print_sessions()
+            else:
+                self.resume(parts[1])
+            return True
+        elif base == "/stats":
+            if len(parts) > 1 and parts[1] == "export":
+                path = parts[2] if len(parts) > 2 else str(CONFIG_DIR / "stats.jsonl")
+                console.print(f"[green]Exported {STATS.export(path)} turns to {path}[/]")
+            elif len(parts) > 1 and parts[1] == "reset":
+                STATS.reset()
+                console.print("[yellow]Stats cleared.[/]")
+            else:
+                self._print_stats()
+            return True
         elif base == "/help":
-            console.print("[bold]Commands:[/]\n/reset, /upgrade, /models, /config, /prompt <path>\n/google on/off, /reasoning on/off, /api key, /model name")
+            console.print("[bold]Commands:[/]\n/reset, /upgrade, /models, /config, /net, /stats [export [path]|reset], /resume [id], /prompt <path>\n/google on/off, /reasoning on/off, /route on/off, /api key, /model name")
             return True
         elif base == "/exit":
+            self.close()
             exit(0)
         return False
 
     def run_stream(self):
-        payload = create_payload(self.cfg["model"], self.history, self.cfg)
-        full_content = ""
+        """
+        Цикл агента на одно сообщение пользователя: запрос -> инструменты -> запрос...
+        Вместо рекурсии - явный цикл с бюджетом шагов, времени и токенов.
+        """
+        budget = TurnBudget.from_config(self.cfg)
+        STATS.begin_turn()
+        try:
+            while True:
+                tool_buffer = self._stream_step(budget)
+                if not tool_buffer:
+                    return
+                self._run_tools(tool_buffer)
+                if self._budget_exhausted(budget):
+                    return
+        finally:
+            STATS.end_turn(budget.elapsed)
+
+    def _budget_exhausted(self, budget):
+        reason = budget.exceeded()
+        if reason:
+            console.print(Panel(
+                f"[yellow]Stopped: {reason} reached.[/]\n[dim]{budget.summary()}[/]\n"
+                f"Tool results are kept in context - send a message to continue.",
+                title="Agent Budget", border_style="yellow"))
+        return bool(reason)
+
+    def _persist(self):
+        if self.session is None:
+            return
+        try:
+            self.session.sync(self.history)
+        except OSError as e:
+            console.print(f"[yellow]Session log disabled: {e}[/]")
+            self.session = None
+
+    def resume(self, session_id=None):
+        """Подменяет историю сохраненной сессией и дальше дописывает в ее журнал."""
+        sid = find_session(session_id, exclude=self.session.id if self.session else None)
+        if sid is None:
+            console.print(f"[red]No saved session{f' matching {session_id}' if session_id else ''}.[/]")
+            return False
+        if self.session is not None:
+            self.session.close()
+        self._session_pending = False
+        self.session = SessionStore(sid, self.cfg.get("session_blob_bytes", 16384),
+                                    self.cfg.get("session_fsync_seconds", 1.0))
+        self.history = self.session.load()
+        self.snapshots.forget()
+        if not self.history:
+            self.history = [{"role": "system", "content": self.cfg_mgr.get_system_prompt()}]
+        console.print(f"[green]Resumed session {sid} ({len(self.history)} messages).[/]")
+        return True
+
+    def _print_sessions(self):
+        sessions = list_sessions()
+        if not sessions:
+            console.print("[yellow]No saved sessions.[/]")
+            return
+        lines = []
+        for sid, meta, mtime in sessions:
+            current = " [green](current)[/]" if self.session and sid == self.session.id else ""
+            lines.append(f"{sid}  [dim]{time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))}  {meta.get('cwd', '')}[/]{current}")
+        console.print(Panel("\n".join(lines) + "\n\n/resume <id> (a prefix is enough)", title="Sessions", border_style="cyan"))
+
+    def _print_stats(self):
+        st = STATS.summary()
+        if not st["steps"]:
+            console.print("[yellow]No requests yet.[/]")
+            return
+
+        def sec(value):
+            return "-" if value is None else f"{value * 1000:.0f} ms"
+
+        lines = [
+            f"Turns: {st['turns']} | Requests: {st['steps']} (cached {st['cached_steps']}, errors {st['errors']}) | Wall: {st['turn_wall_s']}s",
+            f"Sent: {st['request_bytes'] / 1024:.1f} KiB | Tokens: ~{st['prompt_tokens']} prompt + ~{st['completion_tokens']} completion",
+            f"TTFB p50: {sec(st['ttfb_p50_s'])} | TTFT p50: {sec(st['ttft_p50_s'])} p95: {sec(st['ttft_p95_s'])} | "
+            f"Throughput p50: {st['tokens_per_s_p50'] or '-'} tok/s",
+            f"Render: {st['render_s']:.2f}s | Tools: {st['tool_s']:.2f}s",
+        ]
+        for name, agg in sorted(st["tools"].items(), key=lambda kv: -kv[1]["total_s"]):
+            lines.append(f"  {name}: {agg['calls']} calls, avg {sec(agg['total_s'] / agg['calls'])}, "
+                         f"max {sec(agg['max_s'])}, {agg['result_chars']} chars")
+        console.print(Panel("\n".join(lines), title="Session Stats", border_style="cyan"))
+
+    def _required_caps(self, tools):
+        """Возможности, без которых модель для запроса с инструментами tools не годится."""
+        need = set()
+        if any("function" in t for t in tools):
+            need.add(CAP_TOOLS)
+        if self.history and self.history[-1].get("role") == "tool":
+            need.add(CAP_CODE)  # Середина цикла с инструментами
+        # Поиск - требование, только если пользователь включил его сам (/google on).
+        # По умолчанию ключа в конфиге нет: иначе роутер выбирал бы только из поисковых моделей
+        if self.cfg.get("google_search") and any(t.get("type") == "google_search" for t in tools):
+            need.add(CAP_SEARCH)
+        if self.cfg.get("reasoning"):
+            need.add(CAP_REASONING)
+        return need
+
+    def _pick_model(self, tools):
+        if not self.cfg.get("route_models"):
+            return self.cfg["model"]
+        return self.router.choose(self._required_caps(tools), self.cfg["model"])
+
+    def _request_tools(self):
+        """Инструменты для запроса (общий список get_tools_schema - не менять)."""
+        return get_tools_schema(self.cfg)
+
+    def _create_payload(self, model, tools):
+        payload = create_payload(model, self.history, self.cfg, self.snapshots.evict, self.sanitized_views)
+        if tools:
+            payload["tools"] = tools
+        else:
+            del payload["tools"]
+        return payload
+
+    def _record_step(self, step):
+        STATS.record_step(step)
+        self.router.record(step)
+
+    def _begin_step(self):
+        self.step += 1
+        self._persist()
+        tools = self._request_tools()
+        self.step_model = self._pick_model(tools)
+        payload = self._create_payload(self.step_model, tools)
+        prompt_tokens = sum(message_tokens(m) for m in payload["messages"])
+        return payload, prompt_tokens
+
+    @staticmethod
+    def _collect_tool_deltas(tool_buffer, tool_args, t_calls):
+        """Склеивает фрагменты tool_calls из дельт по index."""
+        for tc in t_calls:
+            if "index" in tc:
+                idx = tc["index"]
+                while len(tool_buffer) <= idx:
+                    tool_buffer.append({"id": "", "function": {"name": "", "arguments": ""}, "type": "function"})
+                    tool_args.append([])
+
+                if tc.get("id"):
+                    tool_buffer[idx]["id"] += tc["id"]
+
+                if "function" in tc:
+                    if tc["function"].get("name"):
+                        tool_buffer[idx]["function"]["name"] += tc["function"]["name"]
+                    if tc["function"].get("arguments"):
+                        tool_args[idx].append(tc["function"]["arguments"])
+
+    def _stream_step(self, budget):
+        """Один запрос к модели. Возвращает tool_calls ответа (или пустой список)."""
+        payload, prompt_tokens = self._begin_step()
+        timer = StepTimer(self.step, self.step_model)
         tool_buffer = []
-        markdown_text = ""
-        
-        # Индикатор ожидания ответа
-        with Live(Panel("...", title=f"Polly ({self.cfg['model']})", border_style="blue"), refresh_per_second=10) as live:
+        tool_args = []  # Куски arguments по каждому tool_call, склеиваем один раз в конце
+        renderer = StreamRenderer()  # Копит куски текста ответа
+        answer_panel = Panel(renderer, title=f"Polly ({self.step_model})", border_style="blue")
+
+        # Индикатор ожидания ответа; кадры рисует авто-рефреш Live с частотой render_fps
+        failed = None
+        with Live(Panel("...", title=f"Polly ({self.step_model})", border_style="blue"), refresh_per_second=self.cfg.get("render_fps", 10)) as live:
             try:
-                response = stream_completion(payload, self.cfg["api_key"])
-                for line in response.iter_lines():
-                    if not line: continue
-                    decoded = line.decode('utf-8')
-                    if not decoded.startswith('data: '): continue
-                    
-                    data_str = decoded.replace('data: ', '')
-                    if data_str == '[DONE]': 
-                        break
-                    
-                    try:
-                        chunk = json.loads(data_str)
-                        delta = chunk["choices"][0]["delta"]
-                        
-                        # Обработка текстового контента
-                        if "content" in delta and delta["content"]:
-                            txt = delta["content"]
-                            full_content += txt
-                            markdown_text += txt
-                            live.update(Panel(Markdown(markdown_text), title=f"Polly ({self.cfg['model']})", border_style="blue"))
-                        
-                        # Обработка вызовов инструментов
-                        if "tool_calls" in delta:
-                            t_calls = delta["tool_calls"]
-                            for tc in t_calls:
-                                if "index" in tc:
-                                    idx = tc["index"]
-                                    while len(tool_buffer) <= idx:
-                                        tool_buffer.append({"id": "", "function": {"name": "", "arguments": ""}, "type": "function"})
-                                    
-                                    if "id" in tc: 
-                                        tool_buffer[idx]["id"] += tc["id"]
-                                    
-                                    if "function" in tc:
-                                        if "name" in tc["function"]: 
-                                            tool_buffer[idx]["function"]["name"] += tc["function"]["name"]
-                                        if "arguments" in tc["function"]: 
-                                            tool_buffer[idx]["function"]["arguments"] += tc["function"]["arguments"]
-                    except json.JSONDecodeError:
-                        continue
+                label, response, deltas = self._open_stream(payload, timer)
+                if label == "fallback":
+                    answer_panel.title = f"Polly ({timer.model}, hedged)"
+                started = False
+                for txt, t_calls in deltas:
+                    if txt or t_calls:
+                        timer.delta()  # Преамбула с ролью - не первый токен
+                    # Обработка текстового контента
+                    if txt:
+                        if not started:
+                            live.update(answer_panel)
+                            started = True
+                        renderer.feed(txt)
+
+                    # Обработка вызовов инструментов
+                    if t_calls:
+                        self._collect_tool_deltas(tool_buffer, tool_args, t_calls)
             except Exception as e:
-                live.update(Panel(f"[red]Error: {e}[/]", title="Error"))
-                return
+                if not renderer.text:
+                    live.update(Panel(f"[red]Error: {e}[/]", title="Error"))
+                    self._record_step(timer.finish(prompt_tokens, 0, 0, renderer, error=str(e)))
+                    return []
+                # Обрыв посреди ответа: показанный текст сохраняем, недописанные tool_calls - нет
+                failed = e
+            finally:
+                # Финальный кадр - весь ответ, а не только видимый хвост
+                renderer.finish()
+
+        if failed is not None:
+            console.print(f"[red]Stream interrupted: {failed}. Partial answer kept - send a message to continue.[/]")
+            return self._finish_step(budget, prompt_tokens, renderer.text, [], [], timer, renderer)
+        return self._finish_step(budget, prompt_tokens, renderer.text, tool_buffer, tool_args, timer, renderer)
+
+    def _open_stream(self, payload, timer):
+        """Поток ответа с ретраями до первой дельты и (опционально) hedged-запросом к запасной модели."""
+        def start(p=payload):
+            self._before_request(p["model"])
+            response = stream_completion(p, self.cfg["api_key"], http=self.http, cache=self.cache, retry=self.retry,
+                                         gzip_body=self.cfg.get("gzip_requests", False), builder=self.payload_builder)
+            timer.response(response)
+            return response
+
+        start_fallback = None
+        hedge_after, fallback = self._hedge_plan()
+        if fallback:
+            def start_fallback():
+                return start(self._create_payload(fallback, payload.get("tools")))
+
+        label, response, deltas = open_stream(start, self.retry, hedge_after, start_fallback, self._on_retry)
+        if label == "fallback":
+            timer.model = fallback
+        return label, response, deltas
+
+    def _before_request(self, model):
+        """Вызывается перед каждой попыткой запроса к model: первой, ретраем и hedged."""
+
+    def _hedge_plan(self):
+        """(hedge_after, запасная модель или None, если hedging выключен)."""
+        hedge_after = self.cfg.get("hedge_after", 0)
+        fallback = self.cfg.get("fallback_model") or pick_fallback(self.step_model)
+        if hedge_after and fallback and fallback != self.step_model:
+            return hedge_after, fallback
+        return 0, None
+
+    def _on_retry(self, error, attempt, wait):
+        console.print(f"[yellow]⟳ Stream dropped before the first token ({type(error).__name__}), "
+                      f"retrying in {wait:.1f}s ({attempt}/{self.retry.max_retries})...[/]")
+
+    def _finish_step(self, budget, prompt_tokens, full_content, tool_buffer, tool_args, timer=None, renderer=None):
+        """Собирает сообщение ассистента, добавляет его в историю и учитывает шаг в бюджете и метриках."""
+        for tool, parts in zip(tool_buffer, tool_args):
+            tool["function"]["arguments"] = "".join(parts)
+        completion_tokens = estimate_tokens(full_content) + sum(estimate_tokens(t["function"]["arguments"]) for t in tool_buffer)
+        budget.add_step(prompt_tokens, completion_tokens)
+        if timer is not None:
+            self._record_step(timer.finish(prompt_tokens, completion_tokens, len(tool_buffer), renderer))
 
         # 1. Сначала добавляем сообщение ассистента в историю
         if full_content or tool_buffer:
@@ -156,57 +412,116 @@ class PollyIDE:
             
             self.history.append(msg)
 
-        # 2. Если были вызовы инструментов, выполняем их и добавляем результаты
-        if tool_buffer:
-            for tool in tool_buffer:
-                func_name = tool["function"]["name"]
-                call_id = tool["id"]
-                try:
-                    args = json.loads(tool["function"]["arguments"])
-                except Exception:
-                    # Если JSON битый
-                    console.print(f"[red]Error parsing arguments for {func_name}[/]")
-                    args = {}
-
-                # Формируем текст для спиннера (для тех тулзов, где он нужен)
-                spinner_text = f"Running {func_name}..."
-                if func_name == "write_file":
-                    path = args.get('path', '???')
-                    spinner_text = f"Writing file {path}..."
-                elif func_name == "read_file":
-                    spinner_text = f"Reading file {args.get('path')}..."
-                elif func_name == "google_search":
-                    spinner_text = f"Searching Google..."
-                
-                # ДЛЯ КОМАНД МЫ НЕ ИСПОЛЬЗУЕМ СПИННЕР, 
-                # чтобы видеть вывод (logs) в реальном времени из tools.py
-                if func_name == "execute_command":
-                    console.print(f"[dim]🚀 Launching command: {args.get('command')}[/]")
-                    result = execute_local_tool(func_name, args)
-                
-                # Для остальных тулзов - спиннер
-                else:
-                    with console.status(f"[bold white]{spinner_text}[/]", spinner="dots"):
-                        if func_name == "google_search":
-                            result = execute_local_tool(func_name, args)
-                        else:
-                            result = execute_local_tool(func_name, args)
-                    console.print(f"[dim]🛠 {spinner_text} [green]Done.[/][/]")
-
-                # Добавляем результат тулза в историю
-                self.history.append({
-                    "role": "tool",
-                    "tool_call_id": call_id,
-                    "name": func_name,
-                    "content": str(result)
-                })
-            
-            # Рекурсивный вызов для получения ответа модели на результаты инструментов
-            self.run_stream()
+        self._persist()
+        return tool_buffer
+
+    def _parse_calls(self, tool_buffer):
+        calls = []
+        for tool in tool_buffer:
+            func_name = tool["function"]["name"]
+            try:
+                args = json.loads(tool["function"]["arguments"])
+            except Exception:
+                # Если JSON битый
+                console.print(f"[red]Error parsing arguments for {func_name}[/]")
+                args = {}
+            calls.append((func_name, args))
+        return calls
+
+    def _run_tools(self, tool_buffer):
+        """Выполняет tool_calls и добавляет результаты в историю."""
+        calls = self._parse_calls(tool_buffer)
+        results = [None] * len(calls)
+        cached = {}
+        for batch in self.scheduler.plan(calls):
+            batch = self._skip_unchanged_reads(calls, batch, cached)
+            if len(batch) > 1:
+                # Независимые read-only вызовы - параллельно, под одним спиннером
+                with console.status(f"[bold white]Running {len(batch)} read-only tools...[/]", spinner="dots"):
+                    batch_results = self.scheduler.map(lambda i: execute_local_tool(*calls[i]), batch)
+                for i, result in zip(batch, batch_results):
+                    results[i] = result
+                    console.print(f"[dim]🛠 {self._spinner_text(*calls[i])} [green]Done.[/][/]")
+            elif batch:
+                i = batch[0]
+                results[i] = self._run_tool(*calls[i])
+        for i in cached:
+            console.print(f"[dim]🛠 {self._spinner_text(*calls[i])} [green]Unchanged.[/][/]")
+        self._record_results(tool_buffer, calls, results, cached)
+
+    def _skip_unchanged_reads(self, calls, batch, cached):
+        """
+        read_file файла с теми же mtime и размером, что при прошлом чтении,
+        не выполняем: ссылка сразу в cached. Проверяем перед каждой пачкой,
+        то есть после записей из предыдущих. Возвращает остаток пачки.
+        """
+        rest = []
+        for i in batch:
+            name, args = calls[i][:2]
+            ref = self.snapshots.lookup(args) if name == "read_file" else None
+            if ref is None:
+                rest.append(i)
+            else:
+                cached[i] = ref
+        return rest
+
+    def _record_results(self, tool_buffer, calls, results, cached=None):
+        # Повторные чтения файлов заменяем ссылкой/diff (в основном потоке, по порядку)
+        for i, (func_name, args) in enumerate(calls):
+            if cached and i in cached:
+                results[i] = cached[i]
+            elif func_name == "read_file" and results[i] is not None:
+                results[i] = self.snapshots.dedupe(args, results[i], self.step, tool_buffer[i]["id"])
+
+        # Добавляем результаты тулзов в историю в исходном порядке вызовов
+        for tool, (func_name, _), result in zip(tool_buffer, calls, results):
+            self.history.append({
+                "role": "tool",
+                "tool_call_id": tool["id"],
+                "name": func_name,
+                "content": str(result)
+            })
+        self._persist()
+
+    def _spinner_text(self, func_name, args):
+        # Формируем текст для спиннера (для тех тулзов, где он нужен)
+        if func_name == "write_file":
+            return f"Writing file {args.get('path', '???')}..."
+        elif func_name == "edit_file":
+            return f"Editing file {args.get('path', '???')}..."
+        elif func_name == "apply_patch":
+            return "Applying patch..."
+        elif func_name == "read_file":
+            return f"Reading file {args.get('path')}..."
+        elif func_name == "search_code":
+            return f"Searching code for '{args.get('query')}'..."
+        elif func_name == "process_logs":
+            return f"Reading logs of PID {args.get('pid')}..."
+        elif func_name == "kill_process":
+            return f"Stopping PID {args.get('pid')}..."
+        elif func_name == "google_search":
+            return f"Searching Google..."
+        return f"Running {func_name}..."
+
+    def _run_tool(self, func_name, args):
+        # ДЛЯ КОМАНД МЫ НЕ ИСПОЛЬЗУЕМ СПИННЕР, 
+        # чтобы видеть вывод (logs) в реальном времени из tools.py
+        if func_name == "execute_command":
+            console.print(f"[dim]🚀 Launching command: {args.get('command')}[/]")
+            return execute_local_tool(func_name, args)
+
+        # Для остальных тулзов - спиннер
+        spinner_text = self._spinner_text(func_name, args)
+        with console.status(f"[bold white]{spinner_text}[/]", spinner="dots"):
+            result = execute_local_tool(func_name, args)
+        console.print(f"[dim]🛠 {spinner_text} [green]Done.[/][/]")
+        return result
 
     def start(self):
         console.clear()
         console.print(Panel(f"[bold green]Polly IDE v2.4[/]\n[dim]Model: {self.cfg['model']} | Reasoning: {self.cfg['reasoning']}[/]", border_style="green"))
+        if self.session is not None and len(self.history) > 1:
+            console.print(f"[dim]Session {self.session.id}: {len(self.history)} messages restored.[/]")
         
         while True:
             try:
@@ -214,7 +529,18 @@ class PollyIDE:
                 if not u: continue
                 if u.startswith("/"):
                     if self.handle_slash_command(u): continue
+                if self._session_pending:
+                    self._session_pending = False
+                    self.session = SessionStore.from_config(self.cfg)
                 self.history.append({"role": "user", "content": u})
                 self.run_stream()
             except KeyboardInterrupt:
                 break
+
+    def close(self):
+        self.http.close()
+        self.scheduler.shutdown()
+        procs.MANAGER.shutdown()
+        self.router.save()
+        if self.session is not None:
+            self.session.close()
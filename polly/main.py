@@ -1,13 +1,18 @@
 import argparse
 import sys
 import os
-from rich.console import Console
-from .core import PollyIDE
 from .config import ConfigManager
-from .utils import upgrade_polly
-from .models import list_models_table
 
-console = Console()
+# Тяжелые модули (rich, requests, core) грузим только в тех ветках, где они нужны:
+# polly вызывают из скриптов и хуков редактора, и холодный старт платится каждый раз.
+_console = None
+
+def get_console():
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
 
 def main():
     parser = argparse.ArgumentParser(description="Polly - AI IDE CLI")
@@ -19,44 +24,76 @@ def main():
     subparsers.add_parser("reset", help="Reset all settings")
     subparsers.add_parser("help", help="Show this help message")
     
+    r_parser = subparsers.add_parser("resume", help="Resume a saved session (latest by default)")
+    r_parser.add_argument("id", nargs="?", help="Session id or its prefix")
+
+    b_parser = subparsers.add_parser("batch", help="Run prompts from a JSONL file concurrently")
+    b_parser.add_argument("input", help="JSONL with {\"id\", \"prompt\", [\"model\", \"cwd\", \"system\"]} per line ('-' for stdin)")
+    b_parser.add_argument("-o", "--output", help="Append NDJSON results here (rerun to resume); default stdout")
+    b_parser.add_argument("-j", "--workers", type=int, help="Concurrent conversations (default: batch_workers)")
+    b_parser.add_argument("-m", "--model", help="Model for jobs without their own")
+    b_parser.add_argument("--rpm", action="append", metavar="[MODEL=]N", help="Requests per minute, per model")
+    b_parser.add_argument("--cwd", help="Working directory for jobs without their own")
+    b_parser.add_argument("--sandbox", action="store_true", help="Confine file tools to the job directory, no shell")
+    b_parser.add_argument("--tools", choices=["all", "read", "none"], default="all", help="Tools offered to the model")
+
     p_parser = subparsers.add_parser("prompt", help="Set custom system prompt file")
     p_parser.add_argument("path", help="Path to prompt.txt")
 
     args, unknown = parser.parse_known_args()
-    mgr = ConfigManager()
 
     if args.command == "help":
         parser.print_help()
         return
 
     if args.command == "models":
+        from .models import list_models_table
+        from .router import ModelRouter, print_model_stats
         list_models_table()
+        print_model_stats(ModelRouter(), get_console(), ConfigManager().load().get("model"))
         return
 
     if args.command == "upgrade":
+        from .utils import upgrade_polly
         upgrade_polly()
         return
 
     if args.command == "reset":
-        console.print("[yellow]Please use /reset inside the app or delete ~/.polly[/]")
+        get_console().print("[yellow]Please use /reset inside the app or delete ~/.polly[/]")
         return
     
+    if args.command == "batch":
+        from .batch import run_batch
+        sys.exit(run_batch(args))
+
     if args.command == "prompt":
+        console = get_console()
         if os.path.exists(args.path):
-            mgr.update("custom_prompt_path", os.path.abspath(args.path))
+            ConfigManager().update("custom_prompt_path", os.path.abspath(args.path))
             console.print(f"[green]System prompt set to {args.path}[/]")
         else:
             console.print(f"[red]File not found: {args.path}[/]")
         return
 
+    if ConfigManager().load().get("engine") == "async":
+        from .aio import AsyncPollyIDE as PollyIDE
+    else:
+        from .core import PollyIDE
+    console = get_console()
     ide = PollyIDE()
-    if unknown:
+    # close сохраняет замеры роутера и журнал сессии - и после разового запроса
+    try:
+        if args.command == "resume" and not ide.resume(args.id):
+            return
+        if not unknown:
+            ide.start()
+            return
         msg = " ".join(unknown)
         console.print(f"[bold blue]You:[/] {msg}")
         ide.history.append({"role": "user", "content": msg})
         ide.run_stream()
-    else:
-        ide.start()
+    finally:
+        ide.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,154 @@
+import json
+import statistics
+import threading
+import time
+
+
+class StepTimer:
+    """Таймеры одного запроса к модели. Вызовы дешевые: perf_counter и пара присваиваний."""
+    def __init__(self, step, model):
+        self.step = step
+        self.model = model
+        self.start = time.perf_counter()
+        self.ttfb = None  # Заголовки ответа получены (соединение + ожидание сервера)
+        self.ttft = None  # Первая дельта (текст или tool_call)
+        self.end = None
+        self.request_bytes = 0
+        self.cached = False
+        self.render_seconds = 0.0
+        self.frames = 0
+
+    def headers(self, request_bytes=0, cached=False):
+        self.ttfb = time.perf_counter() - self.start
+        self.request_bytes = request_bytes
+        self.cached = cached
+
+    def response(self, response):
+        if self.ttfb is not None:
+            return  # Ретрай или hedged-запрос: считаем первый ответ
+        self.headers(getattr(response, "request_bytes", 0), bool(getattr(response, "from_cache", False)))
+
+    def delta(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+
+    def finish(self, prompt_tokens, completion_tokens, tool_calls, renderer=None, error=None):
+        self.end = time.perf_counter() - self.start
+        if renderer is not None:
+            self.render_seconds = renderer.render_seconds
+            self.frames = renderer.frames
+        streaming = self.end - (self.ttft or self.end)
+        return {
+            "step": self.step,
+            "model": self.model,
+            "request_bytes": self.request_bytes,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "ttfb_s": _r(self.ttfb),
+            "ttft_s": _r(self.ttft),
+            "total_s": _r(self.end),
+            "tokens_per_s": round(completion_tokens / streaming, 1) if streaming > 0 else None,
+            "render_s": _r(self.render_seconds),
+            "frames": self.frames,
+            "tool_calls": tool_calls,
+            "cached": self.cached,
+            "error": error,
+        }
+
+
+def _r(value):
+    return None if value is None else round(value, 4)
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+class SessionStats:
+    """
+    Метрики сессии: ход = сообщение пользователя, внутри - шаги (запросы к модели)
+    и вызовы инструментов. Инструменты пишут из потоков планировщика - под локом.
+    """
+    def __init__(self):
+        self.turns = []
+        self._current = None
+        self._exported = 0  # Сколько завершенных ходов уже выгружено
+        self._lock = threading.Lock()
+
+    def begin_turn(self):
+        with self._lock:
+            self._current = {"started": time.time(), "steps": [], "tools": []}
+            self.turns.append(self._current)
+
+    def end_turn(self, wall_seconds):
+        with self._lock:
+            if self._current is not None:
+                self._current["wall_s"] = _r(wall_seconds)
+                self._current = None
+
+    def record_step(self, step):
+        with self._lock:
+            if self._current is not None:
+                self._current["steps"].append(step)
+
+    def record_tool(self, name, seconds, result_chars):
+        with self._lock:
+            if self._current is not None:
+                self._current["tools"].append({"name": name, "seconds": _r(seconds), "result_chars": result_chars})
+
+    def summary(self):
+        with self._lock:
+            steps = [s for t in self.turns for s in t["steps"]]
+            tools = [c for t in self.turns for c in t["tools"]]
+            walls = [t["wall_s"] for t in self.turns if t.get("wall_s") is not None]
+        ttft = [s["ttft_s"] for s in steps if s["ttft_s"] is not None and not s["cached"]]
+        tps = [s["tokens_per_s"] for s in steps if s["tokens_per_s"]]
+        by_tool = {}
+        for c in tools:
+            agg = by_tool.setdefault(c["name"], {"calls": 0, "total_s": 0.0, "max_s": 0.0, "result_chars": 0})
+            agg["calls"] += 1
+            agg["total_s"] += c["seconds"]
+            agg["max_s"] = max(agg["max_s"], c["seconds"])
+            agg["result_chars"] += c["result_chars"]
+        return {
+            "turns": len(walls),
+            "steps": len(steps),
+            "cached_steps": sum(1 for s in steps if s["cached"]),
+            "errors": sum(1 for s in steps if s["error"]),
+            "turn_wall_s": round(sum(walls), 2),
+            "request_bytes": sum(s["request_bytes"] for s in steps),
+            "prompt_tokens": sum(s["prompt_tokens"] for s in steps),
+            "completion_tokens": sum(s["completion_tokens"] for s in steps),
+            "ttfb_p50_s": _pct([s["ttfb_s"] for s in steps if s["ttfb_s"] is not None and not s["cached"]], 50),
+            "ttft_p50_s": _pct(ttft, 50),
+            "ttft_p95_s": _pct(ttft, 95),
+            "tokens_per_s_p50": _r(_pct(tps, 50)),
+            "render_s": round(sum(s["render_s"] or 0 for s in steps), 3),
+            "tool_s": round(sum(c["seconds"] for c in tools), 3),
+            "tools": by_tool,
+        }
+
+    def export(self, path):
+        """Дописывает еще не выгруженные ходы в JSON Lines (по ходу на строку). Возвращает число строк."""
+        with self._lock:
+            done = [t for t in self.turns if t.get("wall_s") is not None]
+            turns = done[self._exported:]
+            self._exported = len(done)
+        with open(path, "a", encoding="utf-8") as f:
+            for t in turns:
+                f.write(json.dumps(t, ensure_ascii=False) + "\n")
+        return len(turns)
+
+    def reset(self):
+        with self._lock:
+            self.turns = []
+            self._current = None
+            self._exported = 0
+
+
+# Одна сессия на процесс: инструменты - функции модуля tools, им нужен общий приемник
+STATS = SessionStats()
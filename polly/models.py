@@ -1,11 +1,17 @@
-from rich.console import Console                        from rich.table import Table
-from rich import box
-                                                        console = Console()
+# rich импортируется лениво в list_models_table: models нужен tools/context
+# на горячем пути, а таблица - только для `polly models` и /models
 
-CAP_SEARCH = "search"                                   CAP_REASONING = "reasoning"                             CAP_VISION = "vision"
+CAP_SEARCH = "search"
+CAP_REASONING = "reasoning"
+CAP_VISION = "vision"
 CAP_AUDIO = "audio"
-CAP_CODE = "code"                                       TIER_FREE = "free"
-TIER_PAID = "paid"                                      
+CAP_CODE = "code"
+# Вызов функций (tools в запросе). В MODELS_DB не пишется: он есть почти у
+# всех, поэтому ведем список исключений NO_TOOL_CALLING
+CAP_TOOLS = "tools"
+TIER_FREE = "free"
+TIER_PAID = "paid"
+
 # СТРОГО ПО СПИСКУ POLLINATIONS
 MODELS_DB = {
     # --- TEXT / CODING ---
@@ -14,28 +20,108 @@ MODELS_DB = {
     "openai-large": {"name": "GPT-5.2", "caps": [CAP_VISION, CAP_REASONING], "tier": TIER_FREE, "desc": "Powerful"},
     "qwen-coder": {"name": "Qwen3 Coder 30B", "caps": [CAP_CODE], "tier": TIER_FREE, "desc": "Top Coding Model"},
     "deepseek": {"name": "DeepSeek V3.2", "caps": [CAP_REASONING, CAP_CODE], "tier": TIER_FREE, "desc": "Reasoning & Code"},
-    "mistral": {"name": "Mistral Small 3.2 24B", "caps": [], "tier": TIER_FREE, "desc": "General Purpose"},         "grok": {"name": "xAI Grok 4 Fast", "caps": [], "tier": TIER_FREE, "desc": "Fast Text"},                        "nova-fast": {"name": "Amazon Nova Micro", "caps": [], "tier": TIER_FREE, "desc": "Micro Model"},                                                                       # --- GOOGLE GEMINI ---
+    "mistral": {"name": "Mistral Small 3.2 24B", "caps": [], "tier": TIER_FREE, "desc": "General Purpose"},
+    "grok": {"name": "xAI Grok 4 Fast", "caps": [], "tier": TIER_FREE, "desc": "Fast Text"},
+    "nova-fast": {"name": "Amazon Nova Micro", "caps": [], "tier": TIER_FREE, "desc": "Micro Model"},
+    # --- GOOGLE GEMINI ---
     "gemini-fast": {"name": "Gemini 2.5 Flash Lite", "caps": [CAP_VISION, CAP_SEARCH, CAP_CODE], "tier": TIER_FREE, "desc": "Fast with Search"},
     "gemini-search": {"name": "Gemini 3 Flash (Search)", "caps": [CAP_VISION, CAP_SEARCH, CAP_CODE], "tier": TIER_FREE, "desc": "Optimized for Search"},
-    "gemini": {"name": "Gemini 3 Flash", "caps": [CAP_VISION, CAP_AUDIO, CAP_SEARCH, CAP_CODE], "tier": TIER_FREE, "desc": "Balanced"},                                     "gemini-large": {"name": "Gemini 3 Pro", "caps": [CAP_VISION, CAP_AUDIO, CAP_REASONING, CAP_SEARCH], "tier": TIER_PAID, "desc": "PAID ONLY"},
-    "gemini-legacy": {"name": "Gemini 2.5 Pro", "caps": [CAP_VISION, CAP_AUDIO, CAP_REASONING, CAP_SEARCH, CAP_CODE], "tier": TIER_PAID, "desc": "PAID ONLY"},                                                                      # --- ANTHROPIC CLAUDE ---
+    "gemini": {"name": "Gemini 3 Flash", "caps": [CAP_VISION, CAP_AUDIO, CAP_SEARCH, CAP_CODE], "tier": TIER_FREE, "desc": "Balanced"},
+    "gemini-large": {"name": "Gemini 3 Pro", "caps": [CAP_VISION, CAP_AUDIO, CAP_REASONING, CAP_SEARCH], "tier": TIER_PAID, "desc": "PAID ONLY"},
+    "gemini-legacy": {"name": "Gemini 2.5 Pro", "caps": [CAP_VISION, CAP_AUDIO, CAP_REASONING, CAP_SEARCH, CAP_CODE], "tier": TIER_PAID, "desc": "PAID ONLY"},
+    # --- ANTHROPIC CLAUDE ---
     "claude-fast": {"name": "Claude Haiku 4.5", "caps": [CAP_VISION], "tier": TIER_FREE, "desc": "Fastest Claude"},
     "claude": {"name": "Claude Sonnet 4.5", "caps": [CAP_VISION], "tier": TIER_FREE, "desc": "Intelligent Coding"},
-    "claude-large": {"name": "Claude Opus 4.5", "caps": [CAP_VISION], "tier": TIER_PAID, "desc": "PAID ONLY"},  
-    # --- SEARCH & REASONING ---                            "perplexity-fast": {"name": "Perplexity Sonar", "caps": [CAP_SEARCH], "tier": TIER_FREE, "desc": "Search Engine"},
-    "perplexity-reasoning": {"name": "Perplexity Sonar Reasoning", "caps": [CAP_REASONING, CAP_SEARCH], "tier": TIER_FREE, "desc": "Thinking Search"},                      "nomnom": {"name": "NomNom", "caps": [CAP_SEARCH], "tier": TIER_FREE, "desc": "Experimental Search"},           "kimi": {"name": "Moonshot Kimi K2.5", "caps": [CAP_VISION, CAP_REASONING], "tier": TIER_FREE, "desc": "Thinking Model"},                                               "minimax": {"name": "MiniMax M2.1", "caps": [CAP_REASONING], "tier": TIER_FREE, "desc": "Thinking Model"},
-    "glm": {"name": "Z.ai GLM-4.7", "caps": [CAP_REASONING], "tier": TIER_FREE, "desc": "Thinking Model"},                                                                  # --- SPECIAL ---
+    "claude-large": {"name": "Claude Opus 4.5", "caps": [CAP_VISION], "tier": TIER_PAID, "desc": "PAID ONLY"},
+    # --- SEARCH & REASONING ---
+    "perplexity-fast": {"name": "Perplexity Sonar", "caps": [CAP_SEARCH], "tier": TIER_FREE, "desc": "Search Engine"},
+    "perplexity-reasoning": {"name": "Perplexity Sonar Reasoning", "caps": [CAP_REASONING, CAP_SEARCH], "tier": TIER_FREE, "desc": "Thinking Search"},
+    "nomnom": {"name": "NomNom", "caps": [CAP_SEARCH], "tier": TIER_FREE, "desc": "Experimental Search"},
+    "kimi": {"name": "Moonshot Kimi K2.5", "caps": [CAP_VISION, CAP_REASONING], "tier": TIER_FREE, "desc": "Thinking Model"},
+    "minimax": {"name": "MiniMax M2.1", "caps": [CAP_REASONING], "tier": TIER_FREE, "desc": "Thinking Model"},
+    "glm": {"name": "Z.ai GLM-4.7", "caps": [CAP_REASONING], "tier": TIER_FREE, "desc": "Thinking Model"},
+    # --- SPECIAL ---
     "openai-audio": {"name": "GPT-4o Mini Audio", "caps": [CAP_AUDIO, CAP_VISION], "tier": TIER_FREE, "desc": "Audio Native"},
     "chickytutor": {"name": "ChickyTutor", "caps": [], "tier": TIER_FREE, "desc": "Language Tutor"},
-    "midijourney": {"name": "MIDIjourney", "caps": [], "tier": TIER_FREE, "desc": "Music Generation"},          }
-                                                        def supports_search(model_name):
-    """                                                     Проверяет, поддерживает ли указанная модель веб-поиск.
-    Используется в tools.py для фильтрации доступных инструментов.                                                  """                                                     if model_name not in MODELS_DB:
-        return False                                        return CAP_SEARCH in MODELS_DB[model_name]["caps"]
-                                                        def list_models_table():
+    "midijourney": {"name": "MIDIjourney", "caps": [], "tier": TIER_FREE, "desc": "Music Generation"},
+}
+
+# Примерные окна контекста по семействам моделей (в токенах)
+CONTEXT_WINDOWS = {
+    "gemini": 1000000,
+    "claude": 200000,
+    "openai": 128000,
+    "deepseek": 128000,
+    "qwen": 128000,
+    "mistral": 128000,
+    "grok": 128000,
+    "perplexity": 127000,
+    "kimi": 128000,
+    "glm": 128000,
+    "minimax": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 32000
+
+def get_context_window(model_name):
+    for family, window in CONTEXT_WINDOWS.items():
+        if model_name.startswith(family):
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+# Модели, которые не умеют tool calling (поисковые и специализированные)
+NO_TOOL_CALLING = {"perplexity-fast", "perplexity-reasoning", "nomnom", "openai-audio", "chickytutor", "midijourney"}
+
+def model_caps(model_name):
+    """Возможности модели из MODELS_DB плюс CAP_TOOLS, если она умеет вызывать функции."""
+    caps = set(MODELS_DB[model_name]["caps"])
+    if model_name not in NO_TOOL_CALLING:
+        caps.add(CAP_TOOLS)
+    return caps
+
+def supports_search(model_name):
+    """
+    Проверяет, поддерживает ли указанная модель веб-поиск.
+    Используется в tools.py для фильтрации доступных инструментов.
+    """
+    if model_name not in MODELS_DB:
+        return False
+    return CAP_SEARCH in MODELS_DB[model_name]["caps"]
+
+def pick_fallback(model_name, exclude=()):
+    """
+    Запасная модель для hedged-запроса: та же или бесплатная тарифная группа
+    и все возможности исходной (vision/audio/search/reasoning/tools). Среди подходящих -
+    с наибольшим пересечением возможностей, при равенстве - по порядку MODELS_DB.
+    """
+    info = MODELS_DB.get(model_name)
+    if info is None:
+        return None
+    have = model_caps(model_name)
+    need = have - {CAP_CODE}
+    best, best_score = None, -1
+    for name, cand in MODELS_DB.items():
+        if name == model_name or name in exclude:
+            continue
+        if cand["tier"] != TIER_FREE and cand["tier"] != info["tier"]:
+            continue
+        caps = model_caps(name)
+        if not need <= caps:
+            continue
+        score = len(caps & have)
+        if score > best_score:
+            best, best_score = name, score
+    return best
+
+def list_models_table():
+    from rich.console import Console
+    from rich.table import Table
+    from rich import box
+
+    console = Console()
     table = Table(title="🤖 Polly Models (Pollinations API)", box=box.ROUNDED)
     table.add_column("ID", style="cyan bold")
-    table.add_column("Name", style="green")                 table.add_column("Caps", style="magenta")
+    table.add_column("Name", style="green")
+    table.add_column("Caps", style="magenta")
     table.add_column("Tier", style="yellow")
 
     for mid, info in MODELS_DB.items():
@@ -43,8 +129,10 @@ MODELS_DB = {
         if CAP_SEARCH in info["caps"]: caps.append("🔍")
         if CAP_REASONING in info["caps"]: caps.append(" 🧠")
         if CAP_CODE in info["caps"]: caps.append("💻")
-        if CAP_VISION in info["caps"]: caps.append("👁️")         if CAP_AUDIO in info["caps"]: caps.append("🎙️")
+        if CAP_VISION in info["caps"]: caps.append("👁️")
+        if CAP_AUDIO in info["caps"]: caps.append("🎙️")
 
         tier = "💎" if info["tier"] == TIER_PAID else " 🆓"
-        table.add_row(mid, info["name"], " ".join(caps), tier)                                                  
+        table.add_row(mid, info["name"], " ".join(caps), tier)
+
     console.print(table)
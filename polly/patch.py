@@ -0,0 +1,294 @@
+"""
+Правка файлов без переписывания целиком: блоки search/replace и unified diff.
+Правки проверяются по текущему содержимому и применяются в памяти (все или
+ни одной), файл пишется атомарно: temp-файл в той же папке + os.replace.
+"""
+import os
+import re
+import stat
+import tempfile
+
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """Правка не сходится с текущим содержимым файла. Текст - подсказка для модели."""
+
+
+def read_text(path):
+    """(текст с \\n, перевод строки файла). CRLF-файл после правки остается CRLF."""
+    with open(path, "rb") as f:
+        text = f.read().decode("utf-8")
+    newline = "\r\n" if "\r\n" in text else "\n"
+    return text.replace("\r\n", "\n"), newline
+
+
+def atomic_write(path, text, newline="\n"):
+    """Пишет текст через temp-файл + rename: читатели видят старый файл или новый, не половину."""
+    # Симлинк не подменяем обычным файлом: пишем в файл, на который он указывает
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = None
+    if newline != "\n":
+        text = text.replace("\n", newline)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp, mode)  # mkstemp создает 0600 - возвращаем права исходного файла
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _line_of(text, pos):
+    return text.count("\n", 0, pos) + 1
+
+
+def _find_loose(text, search):
+    """Совпадения search построчно без учета пробелов в конце строк: [(start, stop), ...]."""
+    lines = text.split("\n")
+    want = [l.rstrip() for l in search.strip("\n").split("\n")]
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+    found = []
+    for i in range(len(lines) - len(want) + 1):
+        if all(lines[i + k].rstrip() == want[k] for k in range(len(want))):
+            found.append((offsets[i], offsets[i + len(want)] - 1))
+    return found
+
+
+def _not_found_hint(text, search):
+    first = next((l.strip() for l in search.split("\n") if l.strip()), "")
+    hits = [i + 1 for i, line in enumerate(text.split("\n")) if first and first in line][:5]
+    if hits:
+        return f" Its first line appears at line(s) {', '.join(map(str, hits))} - re-read them and copy the block exactly."
+    return " Re-read the file: it may have changed."
+
+
+def apply_edits(text, edits):
+    """
+    Применяет блоки [{"search", "replace", "replace_all"?}] по очереди.
+    search должен встречаться ровно один раз (или replace_all); если точного
+    совпадения нет, пробуем без учета пробелов в конце строк.
+    Возвращает (новый текст, [номера первых измененных строк]).
+    """
+    if not edits:
+        raise PatchError("No edits given.")
+    changed = []
+    for n, edit in enumerate(edits, 1):
+        search = edit.get("search", "")
+        replace = edit.get("replace", "")
+        if not search:
+            raise PatchError(f"Edit {n}: 'search' is empty. Use write_file to create a file.")
+        count = text.count(search)
+        if count > 1 and not edit.get("replace_all"):
+            lines = sorted({_line_of(text, m.start()) for m in re.finditer(re.escape(search), text)})[:5]
+            raise PatchError(f"Edit {n}: 'search' matches {count} times (lines {', '.join(map(str, lines))}). "
+                             f"Add surrounding lines to make it unique or set replace_all.")
+        if count:
+            changed.append(_line_of(text, text.index(search)))
+            text = text.replace(search, replace) if edit.get("replace_all") else text.replace(search, replace, 1)
+            continue
+        spans = _find_loose(text, search)
+        if len(spans) != 1:
+            if spans:
+                raise PatchError(f"Edit {n}: 'search' matches {len(spans)} times ignoring trailing spaces. "
+                                 f"Add surrounding lines to make it unique.")
+            raise PatchError(f"Edit {n}: 'search' not found." + _not_found_hint(text, search))
+        start, stop = spans[0]
+        changed.append(_line_of(text, start))
+        replace = replace.strip("\n")
+        if not replace:
+            # Удаление блока: забираем и его перевод строки, иначе останется пустая строка
+            if stop < len(text):
+                stop += 1
+            elif start:
+                start -= 1
+        text = text[:start] + replace + text[stop:]
+    return text, changed
+
+
+def parse_unified_diff(diff):
+    """
+    Unified diff -> [(old_path, new_path, hunks)], hunk = (old_start, old_lines, new_lines).
+    Пути без префиксов a/ и b/; /dev/null - None (создание или удаление файла).
+    Diff без заголовков ---/+++ (только @@-блоки) дает один файл с путями None.
+    """
+    lines = diff.splitlines()
+    files = []
+    current = None
+    hunk = None
+    for i, line in enumerate(lines):
+        # "--- " - заголовок файла, только если следом "+++ "; иначе это удаленная строка "-- ..."
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = [_diff_path(line[4:]), _diff_path(lines[i + 1][4:]), []]
+            files.append(current)
+            hunk = None
+        elif line.startswith("+++ ") and hunk is None:
+            continue
+        elif line.startswith("@@"):
+            m = _HUNK.match(line)
+            if not m:
+                raise PatchError(f"Bad hunk header: {line}")
+            if current is None:
+                current = [None, None, []]
+                files.append(current)
+            hunk = (int(m.group(1)), [], [], int(m.group(2) or 1))
+            current[2].append(hunk)
+        elif hunk is not None:
+            if line.startswith("\\"):
+                continue  # "\ No newline at end of file"
+            tag, body = (line[0], line[1:]) if line else (" ", "")
+            if tag not in " -+":
+                hunk = None  # Мусор между блоками (например, строка diff --git)
+                continue
+            if tag in " -":
+                hunk[1].append(body)
+            if tag in " +":
+                hunk[2].append(body)
+    if not any(f[2] for f in files):
+        raise PatchError("No hunks found: expected a unified diff with @@ -a,b +c,d @@ headers.")
+    for f in files:
+        for k, (start, old, new, count) in enumerate(f[2]):
+            # Пустые строки в конце блока сверх счетчика из заголовка - хвост сообщения, не контекст
+            while len(old) > count and old[-1] == "" and new and new[-1] == "":
+                old.pop()
+                new.pop()
+            f[2][k] = (start, old, new)
+    return [tuple(f) for f in files]
+
+
+def _diff_path(raw):
+    path = raw.split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path[:2] in ("a/", "b/"):
+        path = path[2:]
+    return path
+
+
+def _locate(lines, old, expected, loose=False):
+    """Позиция блока old в lines, ближайшая к expected (contextless-сдвиг как у patch)."""
+    if not old:
+        return min(max(expected, 0), len(lines))
+    key = (lambda s: s.rstrip()) if loose else (lambda s: s)
+    want = [key(l) for l in old]
+    for delta in range(len(lines) + 1):
+        for pos in (expected - delta, expected + delta) if delta else (expected,):
+            if 0 <= pos <= len(lines) - len(old) and [key(l) for l in lines[pos:pos + len(old)]] == want:
+                return pos
+    return None
+
+
+def apply_hunks(text, hunks):
+    """Применяет блоки unified diff к тексту. Возвращает (новый текст, [номера первых измененных строк])."""
+    lines = text.split("\n")
+    trailing = lines and lines[-1] == ""
+    if trailing:
+        lines.pop()
+    shift = 0
+    changed = []
+    for n, (start, old, new) in enumerate(hunks, 1):
+        # Для вставки без контекста (-a,0) start - строка, после которой вставляем
+        expected = (start if not old else start - 1) + shift
+        pos = _locate(lines, old, expected)
+        if pos is None:
+            pos = _locate(lines, old, expected, loose=True)
+        if pos is None:
+            preview = "\n".join(old[:3])
+            raise PatchError(f"Hunk {n} (@@ -{start}) does not match the file. Expected lines:\n{preview}\n"
+                             f"Re-read the file around line {start} and regenerate the diff.")
+        lines[pos:pos + len(old)] = new
+        shift += len(new) - len(old)
+        # Первая измененная строка, а не начало контекста
+        first = next((k for k, (a, b) in enumerate(zip(old, new)) if a != b), min(len(old), len(new)))
+        changed.append(pos + first + 1)
+    return "\n".join(lines) + ("\n" if trailing or not lines else ""), changed
+
+
+def _summary(path, before, after, changed):
+    old_lines = before.count("\n")
+    new_lines = after.count("\n")
+    where = ", ".join(str(l) for l in sorted(changed)[:10])
+    return f"Edited {path}: {len(changed)} change(s) at line(s) {where}; {old_lines} -> {new_lines} lines."
+
+
+def edit_file(path, edits=None, diff=None):
+    """Правка одного файла блоками search/replace или unified diff (без заголовков или с ними)."""
+    if not os.path.isfile(path):
+        raise PatchError(f"File '{path}' not found. Use write_file to create it.")
+    text, newline = read_text(path)
+    if edits:
+        new_text, changed = apply_edits(text, edits)
+    elif diff:
+        files = parse_unified_diff(diff)
+        if len(files) > 1:
+            raise PatchError("The diff touches several files: use apply_patch.")
+        new_text, changed = apply_hunks(text, files[0][2])
+    else:
+        raise PatchError("Pass either 'edits' or 'diff'.")
+    if new_text == text:
+        return f"No changes: {path} already has this content."
+    atomic_write(path, new_text, newline)
+    return _summary(path, text, new_text, changed)
+
+
+def apply_patch(diff, resolve=os.path.abspath):
+    """
+    Многофайловый unified diff. Сначала все файлы проверяются и собираются в
+    памяти, затем пишутся (каждый атомарно) - ошибка в любом блоке не оставляет
+    половину правок. resolve - путь из diff -> путь на диске.
+    """
+    plan = []
+    for old_path, new_path, hunks in parse_unified_diff(diff):
+        rel = new_path or old_path
+        if rel is None:
+            raise PatchError("A file in the patch has no path: add ---/+++ headers.")
+        path = resolve(rel)
+        # Разные пути в ---/+++ - переименование: читаем старый файл, пишем новый
+        source = resolve(old_path) if old_path and new_path and old_path != new_path else None
+        if source and os.path.exists(path):
+            raise PatchError(f"{rel}: patch renames {old_path} to it, but it already exists.")
+        if old_path is None:
+            if os.path.exists(path):
+                raise PatchError(f"{rel}: patch creates the file, but it already exists.")
+            text, newline = "", "\n"
+        else:
+            try:
+                text, newline = read_text(source or path)
+            except FileNotFoundError:
+                raise PatchError(f"{old_path}: file not found.") from None
+        try:
+            new_text, changed = apply_hunks(text, hunks)
+        except PatchError as e:
+            raise PatchError(f"{rel}: {e}") from None
+        plan.append((rel, old_path, path, source, new_path is None, text, new_text, newline, changed))
+
+    results = []
+    for rel, old_path, path, source, delete, text, new_text, newline, changed in plan:
+        if delete:
+            os.remove(path)
+            results.append(f"Deleted {rel}.")
+        elif source:
+            atomic_write(path, new_text, newline)
+            os.remove(source)
+            summary = f" {_summary(rel, text, new_text, changed)}" if new_text != text else ""
+            results.append(f"Renamed {old_path} -> {rel}.{summary}")
+        elif not text and changed:
+            atomic_write(path, new_text, newline)
+            results.append(f"Created {rel} ({new_text.count(chr(10))} lines).")
+        else:
+            atomic_write(path, new_text, newline)
+            results.append(_summary(rel, text, new_text, changed))
+    return "\n".join(results)
@@ -0,0 +1,58 @@
+import gzip
+import json
+import threading
+
+GZIP_MIN_BYTES = 4096  # Меньше - сжатие не окупает CPU
+
+
+class PayloadBuilder:
+    """
+    Сериализация тела запроса без повторного кодирования всей истории.
+
+    Сообщения истории между шагами не меняются (fit_history и SanitizedView
+    копируют то, что правят), поэтому их JSON кэшируется по identity словаря,
+    а тело собирается склейкой байтов. Результат побайтно равен
+    json.dumps(payload).encode(). Кэш держит только сообщения последней сборки,
+    поэтому билдер у каждого диалога свой (PollyIDE.payload_builder): с общим
+    диалоги batch вытесняли бы кэш друг друга. encode_payload - для разовых вызовов.
+    """
+    def __init__(self):
+        self._encoded = {}  # id(obj) -> (obj, bytes); ссылка на obj не дает id переиспользоваться
+        self._lock = threading.Lock()
+
+    def _cached(self, obj, used):
+        key = id(obj)
+        hit = self._encoded.get(key)
+        if hit is None or hit[0] is not obj:
+            hit = (obj, json.dumps(obj).encode("utf-8"))
+        used[key] = hit
+        return hit[1]
+
+    def encode(self, payload):
+        with self._lock:
+            used = {}
+            parts = []
+            for key, value in payload.items():
+                if key == "messages":
+                    encoded = b"[" + b", ".join(self._cached(m, used) for m in value) + b"]"
+                elif key == "tools":
+                    encoded = self._cached(value, used)  # Общий список из get_tools_schema
+                else:
+                    encoded = json.dumps(value).encode("utf-8")
+                parts.append(json.dumps(key).encode("utf-8") + b": " + encoded)
+            self._encoded = used
+            return b"{" + b", ".join(parts) + b"}"
+
+
+def compress(body, level=5):
+    """gzip для тел больше GZIP_MIN_BYTES; None - сжимать не стоит."""
+    if len(body) < GZIP_MIN_BYTES:
+        return None
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+_default_builder = PayloadBuilder()
+
+def encode_payload(payload):
+    """Тело запроса через общий билдер: для разовых вызовов вне диалога."""
+    return _default_builder.encode(payload)
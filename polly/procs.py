@@ -0,0 +1,375 @@
+import atexit
+import codecs
+import collections
+import contextvars
+import os
+import re
+import selectors
+import signal
+import socket
+import subprocess
+import threading
+import time
+
+# Типичные строки готовности dev-серверов (uvicorn, flask, vite, next, django, node...)
+DEFAULT_READY = re.compile(
+    r"listening|running on|ready in|server started|started server|serving|"
+    r"accepting connections|application startup complete|https?://[\w.\-]+:\d+",
+    re.IGNORECASE,
+)
+
+KILL_GRACE = 3  # Секунд между SIGTERM и SIGKILL
+
+# Отмена команды переднего плана (threading.Event) из async-движка. asyncio.to_thread
+# копирует контекст в поток, поэтому run_captured видит событие без проброса через tools
+CANCEL = contextvars.ContextVar("polly_cancel", default=None)
+
+
+class LogRing:
+    """Кольцевой буфер строк лога, ограниченный по байтам: старые строки вытесняются."""
+    def __init__(self, max_bytes=64 * 1024):
+        self.max_bytes = max_bytes
+        self.lines = collections.deque()
+        self.size = 0
+        self.total = 0    # Сколько строк пришло за все время
+        self.dropped = 0  # Сколько вытеснено
+
+    def append(self, line):
+        self.lines.append(line)
+        self.size += len(line)
+        self.total += 1
+        while self.size > self.max_bytes and len(self.lines) > 1:
+            self.size -= len(self.lines.popleft())
+            self.dropped += 1
+
+    def tail(self, n):
+        if n <= 0:
+            return []
+        return list(self.lines)[-n:]
+
+
+class BackgroundProcess:
+    def __init__(self, command, log_bytes):
+        self.command = command
+        self.log = LogRing(log_bytes)
+        self.started = time.time()
+        self.ready = False
+        self.echo = True  # Пока ждем готовности - дублируем лог в терминал
+        self._cond = threading.Condition()
+        self._pattern = None
+
+        env = os.environ.copy()
+        env["PYTHONUNBUFFERED"] = "1"
+        self.proc = subprocess.Popen(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            env=env,
+            preexec_fn=os.setsid,
+        )
+        self.pid = self.proc.pid
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        try:
+            for line in iter(self.proc.stdout.readline, ""):
+                if self.echo:
+                    print(f"[BG] {line}", end="")
+                with self._cond:
+                    self.log.append(line)
+                    if not self.ready and self._pattern is not None and self._pattern.search(line):
+                        self.ready = True
+                    self._cond.notify_all()
+        except (OSError, ValueError):
+            pass
+        with self._cond:
+            self.proc.poll()
+            self._cond.notify_all()
+
+    @property
+    def running(self):
+        return self.proc.poll() is None
+
+    def wait_ready(self, pattern=None, port=None, timeout=10):
+        """
+        Ждет первого из: совпадение pattern в логе, TCP-порт принимает соединения,
+        процесс завершился, истек timeout. Возвращает "ready" / "exited" / "timeout".
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if pattern is not None:
+                self._pattern = pattern
+                self.ready = any(pattern.search(line) for line in self.log.lines)
+            while True:
+                if self.ready:
+                    return "ready"
+                if self.proc.poll() is not None:
+                    return "exited"
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return "timeout"
+                if port is not None:
+                    self._cond.release()
+                    try:
+                        if _port_open(port):
+                            self.ready = True
+                            continue
+                    finally:
+                        self._cond.acquire()
+                    self._cond.wait(min(remaining, 0.1))
+                else:
+                    self._cond.wait(remaining)
+
+    def kill(self):
+        """SIGTERM всей группе процессов, через KILL_GRACE секунд - SIGKILL."""
+        if self.running:
+            _signal_group(self.pid, signal.SIGTERM)
+            try:
+                self.proc.wait(KILL_GRACE)
+            except subprocess.TimeoutExpired:
+                _signal_group(self.pid, signal.SIGKILL)
+                self.proc.wait()
+        # Дочерние процессы группы могли пережить лидера
+        _signal_group(self.pid, signal.SIGKILL)
+        self._reader.join(1)
+        return self.proc.returncode
+
+
+def _port_open(port, host="127.0.0.1"):
+    try:
+        with socket.create_connection((host, port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+
+def _signal_group(pid, sig):
+    try:
+        os.killpg(pid, sig)  # preexec_fn=os.setsid: pgid == pid лидера
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ProcessManager:
+    """Реестр фоновых процессов сессии: запуск с проверкой готовности, логи, остановка."""
+    def __init__(self):
+        self.procs = {}  # pid -> BackgroundProcess
+        self._lock = threading.Lock()
+
+    def start(self, command, ready_pattern=None, ready_port=None, timeout=10, log_bytes=64 * 1024):
+        if ready_pattern:
+            pattern = re.compile(ready_pattern)
+        elif ready_port is None:
+            pattern = DEFAULT_READY
+        else:
+            pattern = None
+        bp = BackgroundProcess(command, log_bytes)
+        with self._lock:
+            self.procs[bp.pid] = bp
+        status = bp.wait_ready(pattern, ready_port, timeout)
+        bp.echo = False  # Дальше лог только в буфере: см. process_logs
+        return bp, status
+
+    def get(self, pid):
+        with self._lock:
+            return self.procs.get(pid)
+
+    def list(self):
+        with self._lock:
+            return list(self.procs.values())
+
+    def kill(self, pid):
+        with self._lock:
+            bp = self.procs.pop(pid, None)
+        if bp is None:
+            return None
+        return bp.kill()
+
+    def shutdown(self):
+        for bp in self.list():
+            self.kill(bp.pid)
+
+
+MANAGER = ProcessManager()
+atexit.register(MANAGER.shutdown)
+
+
+def _uptime(bp):
+    return f"{int(time.time() - bp.started)}s"
+
+
+def start_background(command, ready_pattern=None, ready_port=None, timeout=10, log_bytes=64 * 1024, tail=40):
+    try:
+        bp, status = MANAGER.start(command, ready_pattern, ready_port, timeout, log_bytes)
+    except re.error as e:
+        return f"Error: invalid ready_pattern: {e}"
+    except OSError as e:
+        return f"Failed to start: {e}"
+    logs = "".join(bp.log.tail(tail))
+    waited = f"{time.time() - bp.started:.1f}s"
+    if status == "ready":
+        return (f"SUCCESS: Process started (PID {bp.pid}) and is ready after {waited}.\n"
+                f"Logs so far:\n{logs}\n[Polly]: I will keep this running. Use process_logs / kill_process with this PID.")
+    if status == "exited":
+        code = bp.proc.returncode
+        MANAGER.kill(bp.pid)
+        if code == 0:
+            return f"Process exited normally (Code 0) after {waited}.\nLogs:\n{logs}"
+        return f"ERROR: Process started but crashed (Code {code}).\nLogs:\n{logs}"
+    return (f"Process started (PID {bp.pid}) and is still running, but no readiness signal within {timeout}s "
+            f"(pass ready_pattern or ready_port to detect it).\nLogs so far:\n{logs}")
+
+
+def list_processes():
+    procs = MANAGER.list()
+    if not procs:
+        return "No background processes."
+    lines = []
+    for bp in procs:
+        state = "running" if bp.running else f"exited ({bp.proc.returncode})"
+        ready = ", ready" if bp.ready else ""
+        lines.append(f"PID {bp.pid}: {state}{ready}, up {_uptime(bp)}, {bp.log.total} log lines - {bp.command}")
+    return "\n".join(lines)
+
+
+def process_logs(pid, lines=50, grep=None):
+    bp = MANAGER.get(pid)
+    if bp is None:
+        return f"Error: no background process with PID {pid}."
+    try:
+        pattern = re.compile(grep, re.IGNORECASE) if grep else None
+    except re.error as e:
+        return f"Error: invalid grep: {e}"
+    buffered = list(bp.log.lines)
+    if pattern is not None:
+        buffered = [line for line in buffered if pattern.search(line)]
+    shown = buffered[-lines:] if lines > 0 else []
+    state = "running" if bp.running else f"exited ({bp.proc.returncode})"
+    header = f"[PID {bp.pid} {state}: last {len(shown)} of {bp.log.total} lines"
+    if bp.log.dropped:
+        header += f", {bp.log.dropped} oldest dropped from buffer"
+    return header + "]\n" + "".join(shown)
+
+
+def kill_process(pid):
+    bp = MANAGER.get(pid)
+    if bp is None:
+        return f"Error: no background process with PID {pid}."
+    code = MANAGER.kill(pid)
+    return f"Stopped PID {pid} and its process group (exit code {code})."
+
+
+class HeadTailBuffer:
+    """
+    Захват вывода с лимитом по байтам: первые head_bytes и последние tail_bytes,
+    середина выбрасывается (в результате остается маркер с числом пропущенных байт).
+    """
+    def __init__(self, max_bytes=64 * 1024):
+        self.head_bytes = max_bytes // 4
+        self.tail_bytes = max_bytes - self.head_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def append(self, data):
+        self.total += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > 2 * self.tail_bytes:
+                del self.tail[:-self.tail_bytes]
+
+    def getvalue(self):
+        tail = self.tail[-self.tail_bytes:]
+        omitted = self.total - len(self.head) - len(tail)
+        head = self.head.decode("utf-8", errors="replace")
+        if not omitted:
+            return head + tail.decode("utf-8", errors="replace")
+        # Хвост мог начаться посреди строки - отрезаем до первого перевода строки
+        nl = tail.find(b"\n")
+        if 0 <= nl < 256:
+            omitted += nl + 1
+            tail = tail[nl + 1:]
+        return (f"{head}\n... [Polly: {omitted} bytes of output omitted] ...\n"
+                f"{tail.decode('utf-8', errors='replace')}")
+
+
+def run_captured(command, timeout=None, max_bytes=64 * 1024, echo=None, cwd=None):
+    """
+    Запускает команду (в папке cwd, по умолчанию текущей) и читает ее вывод
+    неблокирующе через selectors: вывод сразу идет в терминал (echo), а в
+    память попадает не больше max_bytes.
+    Возвращает (output, returncode, status), status: "ok" / "timeout" /
+    "interrupted" / "cancelled" (событие CANCEL установлено).
+    """
+    env = os.environ.copy()
+    env["PYTHONUNBUFFERED"] = "1"
+    proc = subprocess.Popen(
+        command,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=env,
+        cwd=cwd,
+        preexec_fn=os.setsid,
+    )
+    fd = proc.stdout.fileno()
+    os.set_blocking(fd, False)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buf = HeadTailBuffer(max_bytes)
+    deadline = time.monotonic() + timeout if timeout else None
+    status = "ok"
+    stop = CANCEL.get()
+    sel = selectors.DefaultSelector()
+    sel.register(fd, selectors.EVENT_READ)
+    try:
+        while True:
+            if stop is not None and stop.is_set():
+                status = "cancelled"
+                break
+            wait = 0.5 if deadline is None else min(deadline - time.monotonic(), 0.5)
+            if wait <= 0:
+                status = "timeout"
+                break
+            if not sel.select(wait):
+                # Процесс завершился, а stdout держит открытым его фоновый потомок
+                if proc.poll() is not None:
+                    break
+                continue
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                break  # EOF: закрылись все копии stdout
+            buf.append(data)
+            if echo is not None:
+                echo(decoder.decode(data))
+    except KeyboardInterrupt:
+        status = "interrupted"
+    finally:
+        sel.close()
+        if echo is not None:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                echo(tail)
+
+    if status != "ok":
+        _signal_group(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            _signal_group(proc.pid, signal.SIGKILL)
+    proc.stdout.close()
+    returncode = proc.wait()
+    return buf.getvalue(), returncode, status
@@ -0,0 +1,169 @@
+import threading
+import time
+from rich.markdown import Markdown
+from rich.segment import Segment
+
+FENCES = ("```", "~~~")
+
+
+def _is_blank(line):
+    # Строки со стилем (фон code-блока, рамка таблицы) - часть блока, не отступ
+    return all(not seg.text.strip() and not seg.style for seg in line)
+
+
+class StreamRenderer:
+    """
+    Инкрементальный Markdown-рендер для потокового ответа.
+
+    Завершенные блоки (абзацы, списки, закрытые code-fence) парсятся и
+    рендерятся один раз и замораживаются. На каждом кадре заново парсится
+    только хвост - последний незавершенный блок. Кадры рисует авто-рефреш
+    Live, поэтому токены между кадрами просто накапливаются.
+    Финальный кадр (после finish) - весь ответ одним Markdown: по блокам он
+    может отличаться (loose-список, ссылка-сноска, определенная ниже).
+    """
+    def __init__(self, code_theme="monokai"):
+        self.code_theme = code_theme
+        self.follow = True  # Во время стрима показываем только нижние строки
+
+        self._lock = threading.Lock()
+        self._parts = []          # Весь текст ответа кусками (join один раз)
+        self._frozen = []         # Markdown-исходники замороженных блоков
+        self._frozen_lines = []   # Отрендеренные строки замороженных блоков
+        self._frozen_width = None
+        self._rendered_count = 0  # Сколько блоков уже есть в _frozen_lines
+
+        self._tail = ""           # Незавершенный блок
+        self._scan = 0            # До какой позиции хвост уже просканирован
+        self._in_fence = False
+        self._cut = None          # Позиция после пустой строки - кандидат на разрез
+        self._has_text = False
+
+        self._tail_cache = None   # (tail, width, lines)
+        self._final = False
+        self._final_cache = None  # (width, lines)
+
+        self.render_seconds = 0.0  # Время рендера кадров (для /stats)
+        self.frames = 0
+
+    # --- ВВОД ---
+
+    def feed(self, text):
+        if not text:
+            return
+        with self._lock:
+            self._parts.append(text)
+            self._tail += text
+            self._split_blocks()
+
+    def finish(self):
+        """Отключает режим слежения: финальный кадр Live покажет ответ целиком."""
+        with self._lock:
+            self.follow = False
+            self._final = True
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def _freeze(self, pos):
+        self._frozen.append(self._tail[:pos])
+        self._tail = self._tail[pos:]
+        self._scan = 0
+        self._cut = None
+        self._has_text = False
+
+    def _split_blocks(self):
+        # Сканируем только новые завершенные строки хвоста
+        while True:
+            nl = self._tail.find("\n", self._scan)
+            if nl == -1:
+                break
+            start, end = self._scan, nl + 1
+            line = self._tail[start:nl]
+            self._scan = end
+            stripped = line.strip()
+
+            if self._cut is not None and stripped:
+                # Строка с отступом после пустой - продолжение элемента списка,
+                # без отступа - начало нового блока
+                if line[0].isspace():
+                    self._cut = None
+                else:
+                    self._freeze(start)
+                    start, end = 0, end - start
+                    self._scan = end
+
+            if stripped.startswith(FENCES):
+                self._in_fence = not self._in_fence
+                self._has_text = True
+                if not self._in_fence:
+                    # Закрытый code-fence - готовый блок
+                    self._freeze(end)
+                continue
+
+            if stripped:
+                self._has_text = True
+            elif not self._in_fence and self._has_text:
+                self._cut = end
+
+    # --- РЕНДЕР ---
+
+    def _render(self, source, console, options):
+        lines = console.render_lines(Markdown(source, code_theme=self.code_theme), options, pad=False)
+        # Отступы между блоками ставим сами, поэтому срезаем пустые края
+        while lines and _is_blank(lines[0]):
+            lines.pop(0)
+        while lines and _is_blank(lines[-1]):
+            lines.pop()
+        return lines
+
+    def _lines(self, console, options):
+        with self._lock:
+            width = options.max_width
+            if self._final:
+                # Один полный рендер вместо склейки блоков
+                if self._final_cache is None or self._final_cache[0] != width:
+                    text = self.text
+                    self._final_cache = (width, self._render(text, console, options) if text.strip() else [])
+                return [], self._final_cache[1]
+            if width != self._frozen_width:
+                self._frozen_lines = []
+                self._rendered_count = 0
+                self._frozen_width = width
+
+            for source in self._frozen[self._rendered_count:]:
+                if self._frozen_lines:
+                    self._frozen_lines.append([])
+                self._frozen_lines.extend(self._render(source, console, options))
+            self._rendered_count = len(self._frozen)
+
+            tail = self._tail
+            cached = self._tail_cache
+            if cached and cached[0] == tail and cached[1] == width:
+                tail_lines = cached[2]
+            else:
+                tail_lines = self._render(tail, console, options) if tail.strip() else []
+                self._tail_cache = (tail, width, tail_lines)
+
+        return self._frozen_lines, tail_lines
+
+    def __rich_console__(self, console, options):
+        t0 = time.perf_counter()
+        frozen, tail = self._lines(console, options)
+        self.render_seconds += time.perf_counter() - t0
+        self.frames += 1
+        gap = [[]] if frozen and tail else []
+        if self.follow:
+            # Рамка панели + строка статуса; старые строки не трогаем вовсе
+            visible = max(console.size.height - 3, 1)
+            lines = tail[-visible:]
+            room = visible - len(lines) - len(gap)
+            if frozen and room > 0:
+                lines = frozen[-room:] + gap + lines
+        else:
+            lines = frozen + gap + tail
+        new_line = Segment.line()
+        for line in lines:
+            yield from line
+            yield new_line
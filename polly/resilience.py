@@ -0,0 +1,212 @@
+import asyncio
+import email.utils
+import queue
+import random
+import threading
+import time
+from itertools import chain
+
+import requests
+
+from .sse import iter_deltas
+
+# Статусы, после которых повтор имеет смысл: перегрузка, лимиты, сбои шлюза
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Retry-After: секунды или HTTP-дата. Возвращает секунды или None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+class RetryPolicy:
+    """
+    Экспоненциальный backoff с полным джиттером: пауза ~ U(0, min(max_delay, base * 2^n)).
+    Retry-After сервера важнее расчета, но не дольше max_retry_after.
+    """
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=20, max_retry_after=60):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            max_retries=cfg.get("max_retries", 3),
+            base_delay=cfg.get("retry_base_delay", 0.5),
+            max_delay=cfg.get("retry_max_delay", 20),
+        )
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def retryable(exc):
+        return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                requests.exceptions.ChunkedEncodingError))
+
+
+class _Attempt(threading.Thread):
+    """Один запрос в своем потоке: открывает поток и ждет первый токен."""
+    def __init__(self, start, results, label):
+        super().__init__(daemon=True, name=f"polly-{label}")
+        self._start_fn = start
+        self._results = results
+        self.label = label
+        self.response = None
+        self.cancelled = False
+
+    def run(self):
+        try:
+            response = self._start_fn()
+            self.response = response
+            if self.cancelled:
+                response.close()
+                return
+            deltas = iter_deltas(response.iter_content(chunk_size=None))
+            # Первый токен - дельта с текстом или tool_calls. Пустые дельты до него
+            # (преамбула {"role": "assistant", "content": ""}) копим и отдаем потом:
+            # обрыв после преамбулы - все еще обрыв до первого токена
+            head = []
+            for delta in deltas:
+                head.append(delta)
+                if delta[0] or delta[1]:
+                    break
+            if self.cancelled:
+                response.close()
+                return
+            self._results.put((self, head, deltas, None))
+        except Exception as e:
+            self._results.put((self, None, None, e))
+
+    def cancel(self):
+        self.cancelled = True
+        if self.response is not None:
+            # close() ждет блокировку буфера, которую держит поток, читающий
+            # преамбулу: закрываем в фоне, чтобы не задерживать победителя
+            threading.Thread(target=self._close, daemon=True).start()
+
+    def _close(self):
+        try:
+            self.response.close()
+        except Exception:
+            pass
+
+
+def open_stream(start, policy, hedge_after=0, start_fallback=None, on_retry=None):
+    """
+    Открывает поток ответа и возвращает (label, response, deltas), где deltas -
+    итератор (text, tool_calls), первый токен (текст или tool_calls) уже получен.
+
+    - Обрыв потока до первого токена - повтор всего запроса по policy (ретраи
+      по статусам и ошибкам соединения делает сам stream_completion).
+    - hedge_after > 0: если первого токена нет дольше hedge_after секунд,
+      параллельно уходит start_fallback(); побеждает тот, кто ответит первым,
+      проигравший закрывается.
+    После первого токена ретраев нет: часть ответа уже показана пользователю.
+    """
+    attempt = 0
+    while True:
+        results = queue.Queue()
+        pending = [_Attempt(start, results, "primary")]
+        pending[0].start()
+        hedged = False
+        error = None
+        try:
+            while pending:
+                timeout = hedge_after if hedge_after and start_fallback and not hedged else None
+                try:
+                    att, head, deltas, err = results.get(timeout=timeout)
+                except queue.Empty:
+                    hedged = True
+                    fallback = _Attempt(start_fallback, results, "fallback")
+                    fallback.start()
+                    pending.append(fallback)
+                    continue
+                pending.remove(att)
+                if err is None:
+                    return att.label, att.response, chain(head, deltas)
+                error = err
+        finally:
+            for att in pending:
+                att.cancel()
+
+        if attempt >= policy.max_retries or not policy.retryable(error):
+            raise error
+        wait = policy.delay(attempt, getattr(error, "retry_after", None))
+        attempt += 1
+        if on_retry is not None:
+            on_retry(error, attempt, wait)
+        time.sleep(wait)
+
+
+async def _afirst_token(deltas):
+    """Как _Attempt.run: читает async-итератор дельт до первого токена, пустые дельты копит."""
+    head = []
+    async for delta in deltas:
+        head.append(delta)
+        if delta[0] or delta[1]:
+            break
+    return head, deltas
+
+
+async def _achain(head, deltas):
+    for delta in head:
+        yield delta
+    async for delta in deltas:
+        yield delta
+
+
+async def aopen_stream(start, policy, hedge_after=0, start_fallback=None, on_retry=None):
+    """
+    Асинхронный open_stream с теми же правилами: start() и start_fallback()
+    возвращают async-итератор дельт (text, tool_calls). Возвращает (label, deltas),
+    первый токен уже получен. Проигравший hedged-запрос отменяется.
+    """
+    attempt = 0
+    while True:
+        pending = {asyncio.create_task(_afirst_token(start())): "primary"}
+        hedged = False
+        error = None
+        try:
+            while pending:
+                timeout = hedge_after if hedge_after and start_fallback and not hedged else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    pending[asyncio.create_task(_afirst_token(start_fallback()))] = "fallback"
+                    continue
+                for task in done:
+                    label = pending.pop(task)
+                    if task.exception() is None:
+                        head, deltas = task.result()
+                        return label, _achain(head, deltas)
+                    error = task.exception()
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    # Ответили одновременно: поток второго закрываем сами
+                    asyncio.ensure_future(task.result()[1].aclose())
+
+        if attempt >= policy.max_retries or not policy.retryable(error):
+            raise error
+        wait = policy.delay(attempt, getattr(error, "retry_after", None))
+        attempt += 1
+        if on_retry is not None:
+            on_retry(error, attempt, wait)
+        await asyncio.sleep(wait)
@@ -0,0 +1,171 @@
+import json
+import random
+import threading
+import time
+
+from .config import CONFIG_DIR
+from .models import MODELS_DB, TIER_FREE, model_caps
+from .patch import atomic_write
+
+STATS_FILE = CONFIG_DIR / "model_stats.json"
+
+ALPHA = 0.3             # Вес нового замера в скользящем среднем
+MIN_SAMPLES = 3         # Меньше замеров - модель еще не измерена
+STALE_SECONDS = 3600    # Скорость бесплатных моделей плавает в течение дня: старые замеры перемеряем
+EXPECTED_TOKENS = 300   # Типичная длина ответа для оценки времени шага
+MAX_ERROR_RATE = 0.5    # Хуже - модель считается нездоровой
+COOLDOWN_SECONDS = 300  # Пауза после нескольких ошибок подряд
+COOLDOWN_ERRORS = 2
+SAVE_EVERY = 60         # Сек между записями файла статистики
+
+# Не текстовые/чатовые модели: для автоматического выбора не годятся
+NOT_ROUTABLE = {"openai-audio", "chickytutor", "midijourney"}
+
+
+def _ewma(old, value):
+    return value if old is None else old + ALPHA * (value - old)
+
+
+class ModelRouter:
+    """
+    Замеры TTFT, скорости (tokens/s) и доли ошибок по моделям (скользящее
+    среднее) и выбор самой быстрой здоровой модели с нужными возможностями
+    из MODELS_DB. Замеры переживают перезапуск: ~/.polly/model_stats.json.
+    """
+    def __init__(self, path=STATS_FILE, explore=0.1, allowed=None):
+        self.path = path
+        self.explore = explore
+        self.allowed = set(allowed) if allowed else None
+        self.models = {}  # model -> {"ttft_s", "tokens_per_s", "error_rate", "samples", "errors_in_row", "updated"}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved = time.monotonic()
+        self._load()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(explore=cfg.get("router_explore", 0.1), allowed=cfg.get("router_models"))
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            self.models = {k: v for k, v in data.items() if isinstance(v, dict)}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self.models, indent=1)
+            self._dirty = False
+            self._saved = time.monotonic()
+        try:
+            atomic_write(self.path, data)
+        except OSError:
+            pass  # Статистика - подсказка, не повод ронять сессию
+
+    def record(self, step):
+        """step - словарь StepTimer.finish. Ответы из кэша скорость модели не отражают."""
+        if step.get("cached") or not step.get("model"):
+            return
+        with self._lock:
+            st = self.models.setdefault(step["model"], {"ttft_s": None, "tokens_per_s": None, "error_rate": 0.0,
+                                                        "samples": 0, "errors_in_row": 0, "updated": 0})
+            if step.get("error"):
+                st["error_rate"] = _ewma(st["error_rate"], 1.0)
+                st["errors_in_row"] += 1
+            else:
+                st["error_rate"] = _ewma(st["error_rate"], 0.0)
+                st["errors_in_row"] = 0
+                if step.get("ttft_s") is not None:
+                    st["ttft_s"] = _ewma(st["ttft_s"], step["ttft_s"])
+                if step.get("tokens_per_s"):
+                    st["tokens_per_s"] = _ewma(st["tokens_per_s"], step["tokens_per_s"])
+            st["samples"] += 1
+            st["updated"] = time.time()
+            self._dirty = True
+            due = time.monotonic() - self._saved >= SAVE_EVERY
+        if due:
+            self.save()
+
+    def healthy(self, model, now=None):
+        st = self.models.get(model)
+        if st is None:
+            return True
+        now = now or time.time()
+        if st["errors_in_row"] >= COOLDOWN_ERRORS and now - st["updated"] < COOLDOWN_SECONDS:
+            return False
+        return st["error_rate"] < MAX_ERROR_RATE or now - st["updated"] >= COOLDOWN_SECONDS
+
+    def measured(self, model, now=None):
+        st = self.models.get(model)
+        return (st is not None and st["samples"] >= MIN_SAMPLES and st["ttft_s"] is not None
+                and (now or time.time()) - st["updated"] < STALE_SECONDS)
+
+    def score(self, model):
+        """Ожидаемое время шага, сек: TTFT + генерация EXPECTED_TOKENS, с штрафом за ошибки."""
+        st = self.models[model]
+        seconds = st["ttft_s"] + (EXPECTED_TOKENS / st["tokens_per_s"] if st["tokens_per_s"] else 0)
+        return seconds * (1 + 2 * st["error_rate"])
+
+    def candidates(self, need, current):
+        """Модели MODELS_DB со всеми возможностями need; платные - только если текущая платная."""
+        paid_ok = MODELS_DB.get(current, {}).get("tier", TIER_FREE) != TIER_FREE
+        return [name for name, info in MODELS_DB.items()
+                if name not in NOT_ROUTABLE and (self.allowed is None or name in self.allowed)
+                and set(need) <= model_caps(name) and (paid_ok or info["tier"] == TIER_FREE)]
+
+    def choose(self, need, current):
+        """
+        Самая быстрая здоровая модель с возможностями need. Неизмеренные (или
+        давно не мерянные) модели изредка (explore) пробуются, иначе они
+        никогда не получат замеров. Нет ни одного замера - остаемся на current.
+        """
+        now = time.time()
+        with self._lock:
+            healthy = [m for m in self.candidates(need, current) if self.healthy(m, now)]
+            if not healthy:
+                return current
+            known = [m for m in healthy if self.measured(m, now)]
+            unknown = [m for m in healthy if m not in known]
+            if unknown and (not known or random.random() < self.explore):
+                return current if current in unknown and not known else random.choice(unknown)
+            return min(known, key=self.score)
+
+    def rows(self):
+        """Живые замеры для /models: [(model, stats, healthy)], быстрые сверху."""
+        now = time.time()
+        with self._lock:
+            items = [(m, dict(st), self.healthy(m, now)) for m, st in self.models.items()]
+        return sorted(items, key=lambda r: (r[1]["ttft_s"] is None, r[1]["ttft_s"] or 0))
+
+
+def print_model_stats(router, console, current=None):
+    from rich.table import Table
+    from rich import box
+
+    rows = router.rows()
+    if not rows:
+        console.print("[dim]No latency measurements yet.[/]")
+        return
+    table = Table(title="⏱ Measured latency (this machine)", box=box.ROUNDED)
+    table.add_column("Model", style="cyan")
+    table.add_column("TTFT", justify="right")
+    table.add_column("Tokens/s", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("Samples", justify="right")
+    table.add_column("Updated", style="dim")
+    table.add_column("Status")
+    for model, st, healthy in rows:
+        ttft = f"{st['ttft_s'] * 1000:.0f} ms" if st["ttft_s"] is not None else "-"
+        tps = f"{st['tokens_per_s']:.0f}" if st["tokens_per_s"] else "-"
+        status = "[green]ok[/]" if healthy else "[red]cooldown[/]"
+        if time.time() - st["updated"] >= STALE_SECONDS:
+            status += " [dim](stale)[/]"
+        name = f"{model} [bold](current)[/]" if model == current else model
+        table.add_row(name, ttft, tps, f"{st['error_rate']:.0%}", str(st["samples"]),
+                      time.strftime("%m-%d %H:%M", time.localtime(st["updated"])), status)
+    console.print(table)
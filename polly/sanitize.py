@@ -0,0 +1,114 @@
+import threading
+
+# Правила нормализации истории под строгие API. Ключ - префикс имени модели
+# (как в models.CONTEXT_WINDOWS):
+# - merge_roles: подряд идущие сообщения этих ролей склеиваются в одно
+#   (assistant - только если ни у одного нет tool_calls);
+# - tool_call_text: False - пустой/пробельный текст у assistant с tool_calls
+#   заменяется на None (иначе шлюз делает из него пустой text-блок);
+# - empty_tool_result: чем заменить пустой результат инструмента (None - оставить).
+DEFAULT_RULES = {"merge_roles": ("user",), "tool_call_text": True, "empty_tool_result": None}
+
+PROVIDER_RULES = {
+    # Anthropic: text-блок из одних пробелов - 400
+    "claude": {"merge_roles": ("user",), "tool_call_text": False, "empty_tool_result": None},
+    # Gemini: functionResponse без содержимого и пустые parts отвергаются
+    "gemini": {"merge_roles": ("user",), "tool_call_text": False, "empty_tool_result": "(no output)"},
+    # Perplexity: после system роли строго чередуются user/assistant
+    "perplexity": {"merge_roles": ("user", "assistant"), "tool_call_text": True, "empty_tool_result": "(no output)"},
+}
+
+
+def rules_for(model_name):
+    for family, rules in PROVIDER_RULES.items():
+        if model_name.startswith(family):
+            return family, rules
+    return "default", DEFAULT_RULES
+
+
+def _blank(content):
+    return content is None or str(content).strip() == ""
+
+
+class SanitizedView:
+    """
+    Очищенная копия истории, которая досчитывается по мере добавления сообщений.
+
+    История в core только дописывается, поэтому, как SessionStore.sync, вид
+    помнит identity списка и сколько сообщений уже обработано: шаг стоит
+    O(новых сообщений). Новый или укоротившийся список - пересборка с нуля.
+    Исходные словари не меняются: нормализованные и склеенные сообщения -
+    новые словари. Уже выданный префикс стабилен (меняться может только
+    последнее сообщение, если в него склеится следующее), поэтому JSON
+    сообщений кэшируется PayloadBuilder'ом, а префикс годится для кэша
+    промпта на стороне провайдера.
+    """
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = rules
+        self._history = None
+        self._count = 0
+        self._cleaned = []
+        self._lock = threading.Lock()
+
+    def update(self, history):
+        """Возвращает очищенный список (новый список, сообщения общие с видом - не менять)."""
+        with self._lock:
+            if history is not self._history or len(history) < self._count:
+                self._history = history
+                self._count = 0
+                self._cleaned = []
+            for msg in history[self._count:]:
+                self._push(msg)
+            self._count = len(history)
+            return list(self._cleaned)
+
+    def _normalize(self, msg):
+        """Сообщение для отправки, None - выкинуть. Если нужно править - копия."""
+        role = msg.get("role")
+        content = msg.get("content")
+        # Оставляем сообщение, если у него есть текст, вызовы инструментов
+        # или это результат инструмента (даже пустой)
+        if role == "tool":
+            placeholder = self.rules["empty_tool_result"]
+            if placeholder is not None and _blank(content):
+                return {**msg, "content": placeholder}
+            return msg
+        if msg.get("tool_calls"):
+            if not self.rules["tool_call_text"] and content is not None and _blank(content):
+                return {**msg, "content": None}
+            return msg
+        if _blank(content):
+            return None
+        return msg
+
+    def _push(self, msg):
+        msg = self._normalize(msg)
+        if msg is None:
+            return
+        cleaned = self._cleaned
+        if cleaned:
+            prev = cleaned[-1]
+            role = msg.get("role")
+            if (role == prev.get("role") and role in self.rules["merge_roles"]
+                    and not msg.get("tool_calls") and not prev.get("tool_calls")):
+                cleaned[-1] = {**prev, "content": f"{prev.get('content', '')}\n\n{msg.get('content', '')}"}
+                return
+        cleaned.append(msg)
+
+
+# Вид на провайдера: у hedged-запроса к модели другого семейства свои правила.
+# views - словарь видов диалога (PollyIDE.sanitized_views): вид помнит одну
+# историю, общий на весь процесс пересобирался бы заново при каждой смене
+# диалога в batch. Без views - общий словарь для разовых вызовов.
+_views = {}
+_views_lock = threading.Lock()
+
+def sanitized_history(model_name, history, views=None):
+    family, rules = rules_for(model_name)
+    if views is None:
+        views = _views
+    with _views_lock:
+        view = views.get(family)
+        if view is None:
+            view = views[family] = SanitizedView(rules)
+    return view.update(history)
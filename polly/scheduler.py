@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+from .tools import READ_ONLY_TOOLS
+
+
+class ToolScheduler:
+    """
+    Планировщик tool_calls одного ответа модели.
+    - Подряд идущие read-only вызовы (read_file, list_files) идут пачкой в пул потоков.
+    - Любой изменяющий вызов - барьер: выполняется один, строго по порядку,
+      поэтому чтение после записи всегда видит записанное.
+    - Результаты возвращаются в исходном порядке вызовов.
+    """
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self._pool = None
+
+    def plan(self, calls):
+        """calls: [(name, args), ...] -> список пачек индексов."""
+        batches = []
+        current = []
+        for i, (name, _) in enumerate(calls):
+            if name in READ_ONLY_TOOLS:
+                current.append(i)
+                continue
+            if current:
+                batches.append(current)
+                current = []
+            batches.append([i])
+        if current:
+            batches.append(current)
+        return batches
+
+    def map(self, fn, items):
+        """Параллельный map с сохранением порядка результатов."""
+        if len(items) < 2 or self.max_workers < 2:
+            return [fn(item) for item in items]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="polly-tool")
+        return list(self._pool.map(fn, items))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,207 @@
+import os
+import re
+import threading
+from .workspace import repo_root, walk
+
+MAX_FILE_BYTES = 1024 * 1024  # Больше - скорее всего сгенерированный файл или данные
+MAX_LINE_CHARS = 200
+
+_WORD = re.compile(r"\w+")
+_GROUP = re.compile(r"\(([^()]*)\)(\{[^}]*\}|[?*+])?")
+_OPTIONAL_REPEAT = re.compile(r"\{0*(,|\})")  # {0}, {0,n}, {,n}
+_GROUP_PREFIX = re.compile(r"\?(?::|p<\w+>)")  # (?:...) и (?P<name>...) - обычные группы
+_INDEXES = {}
+_indexes_lock = threading.Lock()
+
+
+def _trigrams(words):
+    grams = set()
+    for w in words:
+        for i in range(len(w) - 2):
+            grams.add(w[i:i + 3])
+    return grams
+
+
+def _query_trigrams(query, regex):
+    """
+    Триграммы, которые обязаны встретиться в файле с совпадением.
+    Индексируются только триграммы из \\w-символов (внутри одного слова),
+    поэтому и из запроса берем только такие.
+    """
+    text = query.lower()
+    if regex:
+        if "|" in text:
+            return set()  # Альтернатива: общих обязательных литералов нет
+        # Убираем экранирования и классы, затем группы (изнутри наружу),
+        # потом необязательные символы
+        text = re.sub(r"\\.|\[[^\]]*\]", " ", text)
+        while True:
+            stripped = _GROUP.sub(_group_literal, text)
+            if stripped == text:
+                break
+            text = stripped
+        text = re.sub(r".[?*]|.\{[^}]*\}", " ", text)
+        text = re.sub(r"[.+()^$]", " ", text)
+    return _trigrams(_WORD.findall(text))
+
+
+def _group_literal(m):
+    """Группа -> ее текст, если он обязателен в совпадении, иначе пробел."""
+    body, quant = m.group(1), m.group(2) or ""
+    if quant in ("?", "*") or _OPTIONAL_REPEAT.match(quant):
+        return " "  # (foo)?bar совпадает и с "bar"
+    if body.startswith("?"):
+        prefix = _GROUP_PREFIX.match(body)
+        if prefix is None:
+            return " "  # Lookaround, флаги, условия: текст не обязан быть в файле
+        body = body[prefix.end():]
+    return f" {body} "
+
+
+class CodeIndex:
+    """
+    Триграммный индекс рабочей папки в памяти.
+    Строится лениво при первом поиске, дальше обновляется по mtime файлов:
+    переиндексируются только измененные, удаленные выкидываются.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.files = {}     # rel_path -> (mtime_ns, text, trigrams)
+        self.postings = {}  # trigram -> set(rel_path)
+        self.binary = {}    # rel_path -> (mtime_ns, size): бинарные файлы не перечитываем, пока не изменятся
+        self._lock = threading.Lock()
+
+    def _remove(self, rel):
+        _, _, grams = self.files.pop(rel)
+        for g in grams:
+            bucket = self.postings.get(g)
+            if bucket is not None:
+                bucket.discard(rel)
+                if not bucket:
+                    del self.postings[g]
+
+    def _add(self, rel, mtime, text):
+        grams = _trigrams(set(_WORD.findall(text.lower())))
+        self.files[rel] = (mtime, text, grams)
+        for g in grams:
+            self.postings.setdefault(g, set()).add(rel)
+
+    def refresh(self):
+        """Синхронизирует индекс с диском. Возвращает число переиндексированных файлов."""
+        entries, _ = walk(self.root, max_depth=64, max_entries=200000)
+        seen = set()
+        changed = 0
+        for _, rel, is_dir in entries:
+            if is_dir:
+                continue
+            full = os.path.join(self.root, rel)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            if st.st_size > MAX_FILE_BYTES:
+                continue
+            seen.add(rel)
+            if self.binary.get(rel) == (st.st_mtime_ns, st.st_size):
+                continue
+            cached = self.files.get(rel)
+            if cached and cached[0] == st.st_mtime_ns:
+                continue
+            try:
+                with open(full, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if cached:
+                self._remove(rel)
+            if b"\0" in data[:8192]:
+                self.binary[rel] = (st.st_mtime_ns, st.st_size)
+                continue
+            self.binary.pop(rel, None)
+            self._add(rel, st.st_mtime_ns, data.decode("utf-8", errors="replace"))
+            changed += 1
+        for rel in [r for r in self.files if r not in seen]:
+            self._remove(rel)
+        for rel in [r for r in self.binary if r not in seen]:
+            del self.binary[rel]
+        return changed
+
+    def search(self, query, regex=False, case_sensitive=False, subpath=None, max_results=100):
+        flags = 0 if case_sensitive else re.IGNORECASE
+        pattern = re.compile(query if regex else re.escape(query), flags)
+        with self._lock:
+            self.refresh()
+            grams = _query_trigrams(query, regex)
+            if grams:
+                # Пересекаем начиная с самого короткого списка
+                lists = sorted((self.postings.get(g, set()) for g in grams), key=len)
+                candidates = set(lists[0])
+                for bucket in lists[1:]:
+                    candidates &= bucket
+                    if not candidates:
+                        break
+            else:
+                candidates = set(self.files)
+
+            prefix = None
+            if subpath:
+                prefix = os.path.relpath(os.path.abspath(subpath), self.root)
+                prefix = None if prefix == "." else prefix
+
+            results = []
+            total = 0
+            for rel in sorted(candidates):
+                # prefix - папка или один файл
+                if prefix and rel != prefix and not rel.startswith(prefix + os.sep):
+                    continue
+                text = self.files[rel][1]
+                if not pattern.search(text):
+                    continue
+                for lineno, line in enumerate(text.splitlines(), 1):
+                    if pattern.search(line):
+                        total += 1
+                        if len(results) < max_results:
+                            results.append((rel, lineno, line.strip()[:MAX_LINE_CHARS]))
+            return results, total
+
+
+def get_index(root="."):
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        index = _INDEXES.get(root)
+        if index is None:
+            index = _INDEXES[root] = CodeIndex(root)
+    return index
+
+
+def _index_root(target):
+    """
+    Корень индекса для пути поиска: рабочая папка, если путь внутри нее
+    (один общий индекс), иначе корень репозитория с этим путем или сама папка.
+    """
+    cwd = os.getcwd()
+    if target == cwd or target.startswith(cwd.rstrip(os.sep) + os.sep):
+        return cwd
+    directory = target if os.path.isdir(target) else os.path.dirname(target)
+    return repo_root(directory) or directory
+
+
+def search_code(query, path=".", regex=False, case_sensitive=False, max_results=100):
+    if not query:
+        return "Error: empty query."
+    target = os.path.realpath(os.path.expanduser(path or "."))
+    if not os.path.exists(target):
+        return f"Error: Path '{path}' not found."
+    root = _index_root(target)
+    try:
+        results, total = get_index(root).search(query, regex, case_sensitive, target, max_results)
+    except re.error as e:
+        return f"Error: invalid regex: {e}"
+    if not results:
+        return f"No matches for '{query}'."
+    # Вне рабочей папки - абсолютные пути: с ними модель сразу вызовет read_file
+    shown = (lambda rel: rel) if root == os.getcwd() else (lambda rel: os.path.join(root, rel))
+    lines = [f"{shown(rel)}:{lineno}: {text}" for rel, lineno, text in results]
+    if total > len(results):
+        lines.append(f"... [{total - len(results)} more matches: narrow the query or path]")
+    return "\n".join(lines)
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from .config import CONFIG_DIR
+
+SESSIONS_DIR = CONFIG_DIR / "sessions"
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class SessionStore:
+    """
+    Append-only журнал сессии в ~/.polly/sessions:
+    - <id>.jsonl   - первая строка meta, дальше по сообщению истории на строку;
+    - <id>.idx     - байтовые смещения начала каждого сегмента (system-сообщение
+                     после /reset или /prompt): resume читает только последний;
+    - <id>.blobs/  - большие результаты инструментов, по ссылке на хэш содержимого.
+    fsync не на каждую строку, а не чаще раза в fsync_seconds (и при закрытии).
+    """
+    def __init__(self, session_id=None, blob_bytes=16384, fsync_seconds=1.0, root=None):
+        self.root = root or SESSIONS_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.id = session_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.path = self.root / f"{self.id}.jsonl"
+        self.idx_path = self.root / f"{self.id}.idx"
+        self.blob_dir = self.root / f"{self.id}.blobs"
+        self.blob_bytes = blob_bytes
+        self.fsync_seconds = fsync_seconds
+        self._f = None
+        self._idx = None
+        self._history = None  # Список истории, который сейчас зеркалим
+        self._count = 0       # Сколько его сообщений уже в файле
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def from_config(cls, cfg, session_id=None):
+        """Новый журнал; заодно удаляет старые сверх session_max_count / session_max_age_days."""
+        if not cfg.get("sessions", True):
+            return None
+        store = cls(session_id, cfg.get("session_blob_bytes", 16384), cfg.get("session_fsync_seconds", 1.0))
+        prune_sessions(cfg.get("session_max_count", 200), cfg.get("session_max_age_days", 30), keep=store.id)
+        return store
+
+    def _open(self):
+        if self._f is None:
+            new = not self.path.exists()
+            self._f = open(self.path, "ab")
+            self._idx = open(self.idx_path, "a")
+            if not new and self._f.tell() and not self._ends_with_newline():
+                self._f.write(b"\n")  # Строка, оборванная сбоем, не должна склеиться с новой
+            if new:
+                self._f.write((_dumps({"type": "meta", "id": self.id, "cwd": os.getcwd(),
+                                       "created": time.time()}) + "\n").encode("utf-8"))
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _encode(self, msg):
+        content = msg.get("content")
+        if msg.get("role") == "tool" and isinstance(content, str) and len(content) > self.blob_bytes:
+            data = content.encode("utf-8")
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            blob = self.blob_dir / digest
+            if not blob.exists():
+                self.blob_dir.mkdir(exist_ok=True)
+                tmp = blob.with_suffix(".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, blob)
+            msg = {**msg, "content": None, "content_ref": digest}
+        return (_dumps(msg) + "\n").encode("utf-8")
+
+    def sync(self, history):
+        """Дописывает в журнал новые сообщения history. Новый список - новый сегмент."""
+        if history is not self._history or len(history) < self._count:
+            self._history = history
+            self._count = 0
+        if self._count == len(history):
+            return
+        self._open()
+        for msg in history[self._count:]:
+            if msg.get("role") == "system":
+                self._f.flush()
+                self._idx.write(f"{self._f.tell()}\n")
+                self._idx.flush()
+            self._f.write(self._encode(msg))
+        self._count = len(history)
+        self._f.flush()
+        if time.monotonic() - self._last_sync >= self.fsync_seconds:
+            self._fsync()
+
+    def _fsync(self):
+        os.fsync(self._f.fileno())
+        os.fsync(self._idx.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._f is not None:
+            self._f.flush()
+            self._fsync()
+            self._f.close()
+            self._idx.close()
+            self._f = self._idx = None
+
+    def _decode(self, line):
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            return None  # Недописанная строка после сбоя
+        if not isinstance(msg, dict) or msg.get("type") == "meta":
+            return None
+        ref = msg.pop("content_ref", None)
+        if ref:
+            try:
+                msg["content"] = (self.blob_dir / ref).read_text(encoding="utf-8")
+            except OSError:
+                msg["content"] = "[Polly: stored tool result is missing]"
+        return msg
+
+    def _last_segment_offset(self):
+        """Смещение последнего сегмента по .idx; None - индекса нет или он не сходится с журналом."""
+        try:
+            with open(self.idx_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 64))
+                offset = int(f.read().split()[-1])
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                first = json.loads(f.readline())
+            return offset if first.get("role") == "system" else None
+        except (OSError, ValueError, IndexError, AttributeError):
+            return None
+
+    def load(self):
+        """История последнего сегмента журнала."""
+        offset = self._last_segment_offset()
+        history = []
+        with open(self.path, "rb") as f:
+            if offset is not None:
+                f.seek(offset)
+            for line in f:
+                msg = self._decode(line)
+                if msg is None:
+                    continue
+                if msg.get("role") == "system":
+                    history = []  # Без индекса: сегменты находим полным проходом
+                history.append(msg)
+        # Оборванный шаг: tool_calls без всех ответов API не примет
+        truncated = False
+        for i in range(len(history) - 1, -1, -1):
+            msg = history[i]
+            if msg.get("role") == "assistant" and msg.get("tool_calls"):
+                if len(history) - 1 - i < len(msg["tool_calls"]):
+                    del history[i:]
+                    truncated = True
+                break
+            if msg.get("role") != "tool":
+                break
+        # Продолжаем тот же журнал: уже записанное не дублируем. Если хвост
+        # отрезан - следующий sync начнет новый сегмент без него.
+        self._history = history
+        self._count = 0 if truncated else len(history)
+        return history
+
+
+def read_meta(path):
+    try:
+        with open(path, "rb") as f:
+            meta = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("type") == "meta" else None
+
+
+def list_sessions(limit=20):
+    """[(id, meta, mtime)] - свежие сверху. Читается только первая строка каждого журнала."""
+    try:
+        files = [p for p in SESSIONS_DIR.glob("*.jsonl")]
+    except OSError:
+        return []
+    files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    out = []
+    for p in files[:limit]:
+        meta = read_meta(p)
+        if meta:
+            out.append((p.stem, meta, p.stat().st_mtime))
+    return out
+
+
+def prune_sessions(max_count=200, max_age_days=30, keep=None, root=None):
+    """
+    Удаляет журналы (с .idx и .blobs) сверх max_count самых свежих и старше
+    max_age_days. 0 - без ограничения. Возвращает число удаленных сессий.
+    """
+    root = root or SESSIONS_DIR
+    try:
+        files = [(p.stat().st_mtime, p) for p in root.glob("*.jsonl")]
+    except OSError:
+        return 0
+    files.sort(reverse=True)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    removed = 0
+    for n, (mtime, path) in enumerate(files):
+        if path.stem == keep:
+            continue
+        if (max_count and n >= max_count) or (cutoff is not None and mtime < cutoff):
+            for extra in (path, path.with_suffix(".idx")):
+                try:
+                    extra.unlink()
+                except OSError:
+                    pass
+            shutil.rmtree(root / f"{path.stem}.blobs", ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def find_session(session_id=None, exclude=None):
+    """Сессия по id или его префиксу; без id - последняя (сначала в текущей папке)."""
+    sessions = [s for s in list_sessions(limit=1000) if s[0] != exclude]
+    if session_id:
+        if any(s[0] == session_id for s in sessions):
+            return session_id
+        matches = [s for s in sessions if s[0].startswith(session_id)]
+        return matches[0][0] if len(matches) == 1 else None
+    cwd = os.getcwd()
+    for sid, meta, _ in sessions:
+        if meta.get("cwd") == cwd:
+            return sid
+    return sessions[0][0] if sessions else None
@@ -0,0 +1,94 @@
+import difflib
+import hashlib
+import os
+
+RANGE_ARGS = ("start_line", "end_line", "offset", "length")
+
+
+class FileSnapshots:
+    """
+    Снимки файлов, уже отданных модели через read_file в этой сессии.
+    Повторное чтение неизмененного файла возвращает короткую ссылку
+    на шаг, где он был прочитан, а измененного - компактный diff.
+    Ключ - абсолютный путь. Те же mtime и размер - файл не перечитываем
+    и не хэшируем (lookup до вызова read_file); иначе сверяем хэш содержимого.
+    Снимок помнит id вызовов, из которых модель знает эту версию файла:
+    если их результаты сокращены или выкинуты из контекста (evict),
+    ссылка на них бесполезна и следующее чтение отдает файл целиком.
+    """
+    def __init__(self, max_bytes=256 * 1024):
+        self.max_bytes = max_bytes  # Больше - read_file отдает превью, не снимок
+        self._files = {}  # abs_path -> (mtime_ns, size, digest, content, step, call_ids)
+
+    def lookup(self, args):
+        """
+        Ссылка на прошлое чтение, если у файла те же mtime и размер, что в снимке:
+        тогда read_file можно не вызывать. Иначе None.
+        """
+        path = args.get("path")
+        if not path or args.get("fresh") or any(args.get(k) is not None for k in RANGE_ARGS):
+            return None
+        full = os.path.abspath(path)
+        prev = self._files.get(full)
+        if prev is None:
+            return None
+        try:
+            st = os.stat(full)
+        except OSError:
+            return None
+        if (st.st_mtime_ns, st.st_size) != prev[:2]:
+            return None
+        return self._unchanged(path, prev[4])
+
+    def dedupe(self, args, result, step, call_id=None):
+        path = args.get("path")
+        if not path or any(args.get(k) is not None for k in RANGE_ARGS):
+            return result
+        if not isinstance(result, str) or result.startswith("System Error:"):
+            return result
+        full = os.path.abspath(path)
+        try:
+            st = os.stat(full)
+        except OSError:
+            return result
+        if st.st_size > self.max_bytes:
+            return result
+
+        prev = self._files.get(full)
+        if prev is not None and (st.st_mtime_ns, st.st_size) == prev[:2]:
+            digest = prev[2]  # Файл не менялся - хэш прежний
+        else:
+            digest = hashlib.blake2b(result.encode("utf-8", errors="replace"), digest_size=16).hexdigest()
+        self._files[full] = (st.st_mtime_ns, st.st_size, digest, result, step, frozenset([call_id]))
+        if prev is None or args.get("fresh"):
+            return result
+
+        _, _, prev_digest, prev_content, prev_step, prev_calls = prev
+        if prev_digest == digest:
+            # Ссылаемся на самое первое чтение этой версии
+            self._files[full] = (st.st_mtime_ns, st.st_size, digest, result, prev_step, prev_calls)
+            return self._unchanged(path, prev_step)
+
+        diff = "".join(difflib.unified_diff(
+            prev_content.splitlines(keepends=True), result.splitlines(keepends=True),
+            fromfile=f"{path} (step {prev_step})", tofile=f"{path} (now)", n=3))
+        if len(diff) >= len(result) // 2:
+            return result  # Изменилось почти все - diff не короче файла
+        # diff понятен только вместе с прошлой версией
+        self._files[full] = (st.st_mtime_ns, st.st_size, digest, result, step, prev_calls | {call_id})
+        return (f"[Polly: {path} changed since step {prev_step}. Unified diff against that version "
+                f"(call read_file with fresh=true for the full file):]\n{diff}")
+
+    @staticmethod
+    def _unchanged(path, step):
+        return (f"[Polly: {path} is unchanged since step {step}. "
+                f"Call read_file with fresh=true if that earlier result is no longer in your context.]")
+
+    def evict(self, call_ids):
+        """Результаты этих вызовов модель больше не видит: их снимки сбрасываем."""
+        gone = set(call_ids)
+        for full in [f for f, snap in self._files.items() if snap[5] & gone]:
+            del self._files[full]
+
+    def forget(self):
+        self._files.clear()
@@ -0,0 +1,94 @@
+import json
+
+try:
+    import orjson  # Опционально: в разы быстрее json на мелких чанках
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+DONE = b"[DONE]"
+
+
+class SSEDecoder:
+    """
+    Потоковый декодер Server-Sent Events поверх сырых байтов.
+    - Чанки сети режут события где угодно: хвост копится в буфере.
+    - Несколько строк `data:` одного события склеиваются через \\n (по спецификации).
+    - Строки-комментарии (`:`) и прочие поля (event/id/retry) пропускаются.
+    """
+    def __init__(self):
+        self._buf = bytearray()
+        self._data = []
+
+    def feed(self, chunk):
+        """Принимает кусок байтов, возвращает список payload'ов завершенных событий."""
+        events = []
+        buf = self._buf
+        buf += chunk
+        start = 0
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl == -1:
+                break
+            end = nl - 1 if nl > start and buf[nl - 1] == 13 else nl  # \r\n
+            if end == start:
+                # Пустая строка - конец события
+                if self._data:
+                    events.append(self._dispatch())
+            elif buf.startswith(b"data:", start):
+                value = start + 5
+                if value < end and buf[value] == 32:
+                    value += 1
+                self._data.append(bytes(buf[value:end]))
+            start = nl + 1
+        del buf[:start]
+        return events
+
+    def flush(self):
+        """Конец потока: отдаем событие без завершающей пустой строки, если оно есть."""
+        events = self.feed(b"\n") if self._buf else []
+        if self._data:
+            events.append(self._dispatch())
+        return events
+
+    def _dispatch(self):
+        data = self._data
+        self._data = []
+        return data[0] if len(data) == 1 else b"\n".join(data)
+
+
+def iter_deltas(chunks):
+    """
+    Итерирует по (text, tool_calls) из потока байтов chat/completions.
+    Быстрый путь: для обычного текстового чанка tool_calls = None, и
+    вызывающему коду не нужно лазить по словарям.
+    """
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        for data in decoder.feed(chunk):
+            if data == DONE:
+                return
+            yield from _deltas(data)
+    for data in decoder.flush():
+        if data == DONE:
+            return
+        yield from _deltas(data)
+
+
+def _deltas(data):
+    try:
+        chunk = _loads(data)
+    except ValueError:
+        # Некоторые прокси шлют события без пустой строки между ними:
+        # тогда склейка data-строк не JSON - разбираем строки по отдельности
+        if b"\n" in data:
+            for line in data.split(b"\n"):
+                if line != DONE:
+                    yield from _deltas(line)
+        return
+    try:
+        delta = chunk["choices"][0]["delta"]
+    except (KeyError, IndexError, TypeError):
+        return
+    if delta:
+        yield delta.get("content"), delta.get("tool_calls")
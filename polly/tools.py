@@ -1,46 +1,146 @@
 import os
 import shutil
-import subprocess
+import mmap
 import time
-import threading
-import signal
 from rich.prompt import Prompt
 from rich.console import Console
 from .models import supports_search
+from .workspace import walk
+from .search import search_code
+from .patch import PatchError, atomic_write, edit_file, apply_patch
+from . import procs
+from .metrics import STATS
 
 console = Console()
 
-# Глобальное хранилище запущенных фоновых процессов
-# Format: {pid: subprocess.Popen}
-ACTIVE_PROCESSES = {}
+# Инструменты без побочных эффектов: их можно выполнять параллельно
+READ_ONLY_TOOLS = {"read_file", "list_files", "search_code", "list_processes", "process_logs"}
+
+# Лимиты инструментов (перезаписываются из конфига через configure_tools)
+LIMITS = {
+    "read_max_bytes": 256 * 1024,  # Больше - отдаем head/tail вместо всего файла
+    "read_preview_lines": 100,     # Сколько строк в head и в tail
+    "bg_ready_timeout": 10,        # Максимум ожидания готовности фонового процесса, сек
+    "bg_log_bytes": 64 * 1024,     # Кольцевой буфер лога на каждый фоновый процесс
+    "exec_max_bytes": 64 * 1024,   # Сколько вывода команды попадает в результат (head + tail)
+}
+
+def configure_tools(cfg):
+    for key in LIMITS:
+        if cfg.get(key):
+            LIMITS[key] = cfg[key]
+
+# Схема зависит только от флага google_search: строим один раз на значение.
+# Возвращается общий список - вызывающий код не должен его менять.
+_SCHEMA_CACHE = {}
 
 def get_tools_schema(config):
+    key = bool(config.get("google_search", True))
+    tools = _SCHEMA_CACHE.get(key)
+    if tools is None:
+        tools = _SCHEMA_CACHE[key] = _build_tools_schema(key)
+    return tools
+
+def _build_tools_schema(google_search):
     tools = [
         # --- ФАЙЛОВАЯ СИСТЕМА ---
         {
             "type": "function",
             "function": {
                 "name": "list_files",
-                "description": "List all files in directory. No limits.",
-                "parameters": {"type": "object", "properties": {"path": {"type": "string", "default": "."}}}
+                "description": "List directory contents (respects .gitignore). Use recursive=true to map a whole project tree in one call.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string", "default": "."},
+                        "recursive": {"type": "boolean", "description": "Walk subdirectories. Default False."},
+                        "max_depth": {"type": "integer", "description": "Depth for recursive mode. Default 4."},
+                        "max_entries": {"type": "integer", "description": "Stop after this many entries. Default 500."},
+                        "include_ignored": {"type": "boolean", "description": "Also show .gitignore'd files. Default False."}
+                    }
+                }
             }
         },
         {
             "type": "function",
             "function": {
                 "name": "read_file",
-                "description": "Read FULL content of a file. No truncation.",
-                "parameters": {"type": "object", "properties": {"path": {"type": "string"}}, "required": ["path"]}
+                "description": "Read a file. Small files are returned in full. Large files return head/tail with the total line count: then request a slice with start_line/end_line (1-based, inclusive) or offset/length (bytes).",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string"},
+                        "start_line": {"type": "integer"},
+                        "end_line": {"type": "integer"},
+                        "offset": {"type": "integer", "description": "Byte offset"},
+                        "length": {"type": "integer", "description": "Bytes to read"},
+                        "fresh": {"type": "boolean", "description": "Return full content even if the file was already read in this session"}
+                    },
+                    "required": ["path"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "search_code",
+                "description": "Search code in the working directory (indexed, respects .gitignore). Returns matching lines as path:line: text. Prefer this over reading many files.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "Text to find (or a regex if regex=true)"},
+                        "path": {"type": "string", "description": "Limit to this subdirectory. Default '.'"},
+                        "regex": {"type": "boolean", "description": "Treat query as a Python regex. Default False."},
+                        "case_sensitive": {"type": "boolean", "description": "Default False."},
+                        "max_results": {"type": "integer", "description": "Default 100."}
+                    },
+                    "required": ["query"]
+                }
             }
         },
         {
             "type": "function",
             "function": {
                 "name": "write_file",
-                "description": "Create/Overwrite file.",
+                "description": "Create/Overwrite file. To change part of an existing file use edit_file instead of rewriting it.",
                 "parameters": {"type": "object", "properties": {"path": {"type": "string"}, "content": {"type": "string"}}, "required": ["path", "content"]}
             }
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "edit_file",
+                "description": "Edit an existing file in place. Pass either `edits` (search/replace blocks, applied in order; each search must match the current file exactly once - include enough surrounding lines) or `diff` (unified diff hunks). All edits apply or none. Returns the changed line numbers, not the file.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string"},
+                        "edits": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "search": {"type": "string", "description": "Exact current text to replace"},
+                                    "replace": {"type": "string", "description": "New text"},
+                                    "replace_all": {"type": "boolean", "description": "Replace every occurrence. Default False."}
+                                },
+                                "required": ["search", "replace"]
+                            }
+                        },
+                        "diff": {"type": "string", "description": "Unified diff hunks (@@ -a,b +c,d @@) for this file"}
+                    },
+                    "required": ["path"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "apply_patch",
+                "description": "Apply a multi-file unified diff (--- a/path, +++ b/path, @@ hunks; /dev/null creates or deletes a file, different paths rename it). Every file is checked before anything is written.",
+                "parameters": {"type": "object", "properties": {"patch": {"type": "string"}}, "required": ["patch"]}
+            }
+        },
         {
             "type": "function",
             "function": {
@@ -71,17 +171,53 @@ def get_tools_schema(config):
             "type": "function",
             "function": {
                 "name": "execute_command",
-                "description": "Run shell command. Use 'background=True' for servers/tunnels/long scripts.",
+                "description": "Run shell command. Use 'background=True' for servers/tunnels/long scripts: the call returns as soon as the process is ready (log line, open port or timeout).",
                 "parameters": {
                     "type": "object", 
                     "properties": {
                         "command": {"type": "string", "description": "Command to run"},
-                        "background": {"type": "boolean", "description": "Set True for servers/daemons. Default False."}
+                        "background": {"type": "boolean", "description": "Set True for servers/daemons. Default False."},
+                        "timeout": {"type": "number", "description": "Foreground: stop the command after this many seconds"},
+                        "ready_pattern": {"type": "string", "description": "Background: regex that marks the process as ready when it appears in the log"},
+                        "ready_port": {"type": "integer", "description": "Background: ready once this localhost TCP port accepts connections"},
+                        "ready_timeout": {"type": "number", "description": "Background: max seconds to wait for readiness. Default 10."}
                     }, 
                     "required": ["command"]
                 }
             }
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "list_processes",
+                "description": "List background processes started with execute_command(background=True).",
+                "parameters": {"type": "object", "properties": {}}
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "process_logs",
+                "description": "Tail the log of a background process.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "pid": {"type": "integer"},
+                        "lines": {"type": "integer", "description": "Default 50."},
+                        "grep": {"type": "string", "description": "Only lines matching this regex (case-insensitive)"}
+                    },
+                    "required": ["pid"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "kill_process",
+                "description": "Stop a background process and its whole process group.",
+                "parameters": {"type": "object", "properties": {"pid": {"type": "integer"}}, "required": ["pid"]}
+            }
+        },
         {
             "type": "function",
             "function": {
@@ -96,46 +232,171 @@ def get_tools_schema(config):
         }
     ]
 
-    if config.get("google_search", True):
+    if google_search:
         tools.append({"type": "google_search"})
     
     return tools
 
-def stream_process_output(process, capture_buffer):
-    """Читает вывод процесса в реальном времени и пишет в консоль"""
+def _count_lines(mm, start=0, stop=None):
+    """Считает переводы строк блоками по 1 МБ, не копируя весь файл."""
+    stop = len(mm) if stop is None else stop
+    count = 0
+    block = 1 << 20
+    for pos in range(start, stop, block):
+        count += mm[pos:min(pos + block, stop)].count(b"\n")
+    return count
+
+def _total_lines(mm):
+    total = _count_lines(mm)
+    return total if mm[-1:] == b"\n" else total + 1
+
+def _line_offset(mm, line):
+    """Байтовое смещение начала строки line (с 1)."""
+    if line <= 1:
+        return 0
+    need = line - 1
+    block = 1 << 20
+    pos = 0
+    size = len(mm)
+    # Быстро пропускаем целые блоки
+    while pos < size:
+        end = min(pos + block, size)
+        n = mm[pos:end].count(b"\n")
+        if n >= need:
+            break
+        need -= n
+        pos = end
+    else:
+        return size
+    while need:
+        pos = mm.find(b"\n", pos) + 1
+        need -= 1
+    return pos
+
+def _decode(data):
+    return data.decode("utf-8", errors="replace")
+
+def read_file(path, start_line=None, end_line=None, offset=None, length=None):
+    """
+    Чтение файла с диапазонами. Большие файлы читаются через mmap:
+    в память попадает только запрошенный кусок, а не весь файл.
+    """
+    limit = LIMITS["read_max_bytes"]
+    size = os.path.getsize(path)
+    ranged = any(v is not None for v in (start_line, end_line, offset, length))
+
+    if size <= limit and not ranged:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    if size == 0:
+        return ""
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # --- Диапазон байтов ---
+        if offset is not None or length is not None:
+            start = max(offset or 0, 0)
+            stop = min(start + (length if length is not None else limit), size, start + limit)
+            return f"[bytes {start}-{stop} of {size}]\n" + _decode(mm[start:stop])
+
+        # --- Диапазон строк ---
+        if ranged:
+            first = max(start_line or 1, 1)
+            start = _line_offset(mm, first)
+            if start >= size:
+                return f"[Polly: {path} has only {_total_lines(mm)} lines]"
+            if end_line is not None:
+                stop = _line_offset(mm, end_line + 1)
+            else:
+                stop = size
+            note = ""
+            if stop - start > limit:
+                stop = mm.rfind(b"\n", start, start + limit) + 1 or start + limit
+                note = f"\n[Polly: slice capped at {limit} bytes, continue from line {first + _count_lines(mm, start, stop)}]"
+            chunk = mm[start:stop]
+            last = first + chunk.count(b"\n") - (1 if chunk.endswith(b"\n") or not chunk else 0)
+            return f"[lines {first}-{last} of {_total_lines(mm)}]\n" + _decode(chunk) + note
+
+        # --- Большой файл целиком: head/tail ---
+        n = LIMITS["read_preview_lines"]
+        total = _total_lines(mm)
+        head_end = _line_offset(mm, n + 1)
+        tail_start = size
+        for _ in range(n + (1 if mm[-1:] == b"\n" else 0)):
+            tail_start = mm.rfind(b"\n", 0, tail_start)
+            if tail_start == -1:
+                break
+        tail_start += 1
+        # Превью тоже ограничено лимитом (файл может быть из пары огромных строк)
+        half = limit // 2
+        head = _decode(mm[:min(head_end, half)])
+        tail = _decode(mm[max(tail_start, head_end, size - half):])
+        return (f"[Polly: {path} is {size} bytes, {total} lines - showing first and last {n} lines. "
+                f"Use start_line/end_line or offset/length to read a slice.]\n"
+                f"{head}\n... [{total - 2 * n if total > 2 * n else 0} lines omitted] ...\n{tail}")
+
+def run_command(cmd, timeout=None, cwd=None, echo=None):
+    """Команда на переднем плане: вывод (head + tail) и код возврата в виде результата инструмента."""
     try:
-        # Читаем stdout посимвольно/построчно
-        for line in iter(process.stdout.readline, ''):
-            if not line: break
-            print(line, end='') # Вывод прямо в терминал пользователя
-            capture_buffer.append(line)
-    except:
-        pass
+        output, code, status = procs.run_captured(cmd, timeout, LIMITS["exec_max_bytes"], echo, cwd)
+    except OSError as e:
+        return f"Failed to start: {e}"
+    if status == "interrupted":
+        console.print("\n[bold red]>> User interrupted command (SIGINT)[/]")
+        return f"Command interrupted by user.\nPartial Output:\n{output}"
+    if status == "cancelled":
+        return f"Command cancelled by user and was stopped.\nPartial Output:\n{output}"
+    if status == "timeout":
+        console.print(f"\n[bold red]>> Command timed out after {timeout}s[/]")
+        return f"Command timed out after {timeout}s and was stopped.\nPartial Output:\n{output}"
+    if code:
+        return f"{output}\n[Exit code {code}]"
+    return output
 
 def execute_local_tool(name, args):
+    t0 = time.perf_counter()
+    result = _execute_local_tool(name, args)
+    STATS.record_tool(name, time.perf_counter() - t0, len(result) if isinstance(result, str) else 0)
+    return result
+
+def _execute_local_tool(name, args):
     try:
         if name == "list_files":
             path = args.get("path", ".")
             if not os.path.exists(path): return f"Error: Path '{path}' not found."
-            items = os.listdir(path)
-            items.sort()
+            depth = args.get("max_depth", 4) if args.get("recursive") else 1
+            entries, truncated = walk(path, max_depth=depth, max_entries=args.get("max_entries", 500),
+                                      include_ignored=args.get("include_ignored", False))
             res = []
-            for item in items:
-                full = os.path.join(path, item)
-                mark = "📁" if os.path.isdir(full) else "📄"
-                res.append(f"{mark} {item}")
+            for level, rel, is_dir in entries:
+                mark = "📁" if is_dir else "📄"
+                res.append(f"{'  ' * level}{mark} {os.path.basename(rel)}")
+            if truncated:
+                res.append(f"... [truncated at {len(entries)} entries: list a subdirectory or raise max_entries]")
             return f"Dir: {os.path.abspath(path)}\n" + "\n".join(res)
         
         elif name == "read_file":
-            with open(args["path"], 'r', encoding='utf-8') as f:
-                return f.read()
+            return read_file(args["path"], args.get("start_line"), args.get("end_line"), args.get("offset"), args.get("length"))
         
+        elif name == "search_code":
+            return search_code(args.get("query", ""), args.get("path", "."), args.get("regex", False),
+                               args.get("case_sensitive", False), args.get("max_results", 100))
+
         elif name == "write_file":
             p = args["path"]
-            os.makedirs(os.path.dirname(os.path.abspath(p)), exist_ok=True)
-            with open(p, 'w', encoding='utf-8') as f:
-                f.write(args["content"])
+            atomic_write(p, args["content"])
             return f"Success: Wrote {len(args['content'])} chars to {p}"
+
+        elif name == "edit_file":
+            try:
+                return edit_file(args["path"], args.get("edits"), args.get("diff"))
+            except PatchError as e:
+                return f"Error: {e}"
+
+        elif name == "apply_patch":
+            try:
+                return apply_patch(args["patch"])
+            except PatchError as e:
+                return f"Error: {e}"
         
         elif name == "delete_item":
             p = args["path"]
@@ -166,66 +427,24 @@ def execute_local_tool(name, args):
 
             console.print(f"[bold dim]>> Executing: {cmd}[/]")
             if is_bg:
-                console.print(f"[yellow]>> Starting in BACKGROUND mode (Monitoring for 10s)...[/]")
+                timeout = args.get("ready_timeout") or LIMITS["bg_ready_timeout"]
+                console.print(f"[yellow]>> Starting in BACKGROUND mode (waiting up to {timeout}s for readiness)...[/]")
+                return procs.start_background(cmd, args.get("ready_pattern"), args.get("ready_port"),
+                                              timeout, LIMITS["bg_log_bytes"])
 
-            # ФИКС 1: Добавляем переменную окружения, чтобы Python не буферизировал вывод
-            env = os.environ.copy()
-            env["PYTHONUNBUFFERED"] = "1"
+            def echo(text):
+                print(text, end='', flush=True)  # Вывод прямо в терминал пользователя
 
-            try:
-                process = subprocess.Popen(
-                    cmd, 
-                    shell=True, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.STDOUT, 
-                    text=True, 
-                    bufsize=1,
-                    env=env, # <-- ВАЖНО
-                    preexec_fn=os.setsid 
-                )
-            except Exception as e:
-                return f"Failed to start: {e}"
-
-            output_buffer = []
-            
-            # Если это фоновый процесс (сервер)
-            if is_bg:
-                ACTIVE_PROCESSES[process.pid] = process
-                
-                # ФИКС 2: Читаем в потоке, чтобы readline не блокировал таймер sleep
-                def bg_reader(proc, buffer):
-                    try:
-                        for line in iter(proc.stdout.readline, ''):
-                            if not line: break
-                            print(f"[BG] {line}", end='')
-                            buffer.append(line)
-                    except: pass
-
-                t = threading.Thread(target=bg_reader, args=(process, output_buffer), daemon=True)
-                t.start()
-                
-                # Ждем 10 секунд накопления логов
-                time.sleep(10)
-                
-                if process.poll() is None:
-                    return f"SUCCESS: Process started (PID {process.pid}) and is running.\nLogs so far:\n{''.join(output_buffer)}\n[Polly]: I will keep this running."
-                else:
-                    return f"ERROR: Process started but crashed immediately (Code {process.returncode}).\nLogs:\n{''.join(output_buffer)}"
-
-            # Если это обычный процесс
-            else:
-                try:
-                    for line in iter(process.stdout.readline, ''):
-                        print(line, end='')
-                        output_buffer.append(line)
-                    
-                    process.wait()
-                    return "".join(output_buffer)
-                
-                except KeyboardInterrupt:
-                    console.print("\n[bold red]>> User interrupted command (SIGINT)[/]")
-                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                    return f"Command interrupted by user.\nPartial Output:\n{''.join(output_buffer)}"
+            return run_command(cmd, args.get("timeout"), echo=echo)
+
+        elif name == "list_processes":
+            return procs.list_processes()
+
+        elif name == "process_logs":
+            return procs.process_logs(int(args["pid"]), int(args.get("lines", 50)), args.get("grep"))
+
+        elif name == "kill_process":
+            return procs.kill_process(int(args["pid"]))
 
         elif name == "secrets_env":
             keys = args.get("keys", [])
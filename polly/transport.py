@@ -0,0 +1,145 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # Опционально: нужен только для HTTP/2 (pip install httpx[http2])
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # Без него httpx.Client(http2=True) падает с ImportError
+except ImportError:
+    h2 = None
+
+
+def http2_supported():
+    """HTTP/2 включаем, только если установлены и httpx, и h2; иначе HTTP/1.1."""
+    return httpx is not None and h2 is not None
+
+
+class _H2Response:
+    """
+    Обертка над потоковым ответом httpx с интерфейсом requests.Response,
+    чтобы api.py и core.py не знали, какой транспорт под капотом.
+    """
+    def __init__(self, response):
+        self._r = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    @property
+    def text(self):
+        self._r.read()
+        return self._r.text
+
+    def json(self):
+        self._r.read()
+        return self._r.json()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            self.close()
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self._r.url}", response=self)
+
+    def iter_content(self, chunk_size=None):
+        # iter_bytes, не iter_raw: как requests, снимаем Content-Encoding (gzip/br)
+        try:
+            yield from self._r.iter_bytes(chunk_size)
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+
+    def iter_lines(self):
+        try:
+            for line in self._r.iter_lines():
+                yield line.encode("utf-8")
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+
+    def close(self):
+        self._r.close()
+
+
+class HttpPool:
+    """
+    Долгоживущий keep-alive пул соединений к API.
+    Один экземпляр на PollyIDE: TCP/TLS рукопожатие платится один раз,
+    а не на каждый ход агента.
+    """
+    def __init__(self, pool_size=4, connect_timeout=10, read_timeout=120, http2=False):
+        self.timeout = (connect_timeout, read_timeout)
+        self.http2 = bool(http2) and http2_supported()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._connections = 0
+
+        if self.http2:
+            self._client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+        else:
+            self._session = requests.Session()
+            self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self._session.mount("https://", self._adapter)
+            self._session.mount("http://", self._adapter)
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            pool_size=cfg.get("http_pool_size", 4),
+            connect_timeout=cfg.get("connect_timeout", 10),
+            read_timeout=cfg.get("read_timeout", 120),
+            http2=cfg.get("http2", False),
+        )
+
+    def _trace(self, event, info):
+        # httpx сообщает о каждом новом TCP соединении через trace-расширение
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self._connections += 1
+
+    def post(self, url, headers=None, data=None, stream=True):
+        with self._lock:
+            self._requests += 1
+
+        if self.http2:
+            try:
+                req = self._client.build_request("POST", url, headers=headers, content=data,
+                                                 extensions={"trace": self._trace})
+                return _H2Response(self._client.send(req, stream=stream))
+            except httpx.HTTPError as e:
+                raise requests.exceptions.ConnectionError(str(e))
+
+        return self._session.post(url, headers=headers, data=data, stream=stream, timeout=self.timeout)
+
+    def stats(self):
+        """Счетчики переиспользования соединений."""
+        connections = self._connections
+        if not self.http2:
+            # urllib3 сам считает открытые соединения в каждом пуле хоста
+            pools = self._adapter.poolmanager.pools
+            connections = sum(pools[key].num_connections for key in pools.keys())
+        return {
+            "transport": "httpx/h2" if self.http2 else "requests/http1.1",
+            "requests": self._requests,
+            "connections": connections,
+            "reused": max(self._requests - connections, 0),
+        }
+
+    def close(self):
+        if self.http2:
+            self._client.close()
+        else:
+            self._session.close()
+
+
+_default_pool = None
+
+def get_default_pool():
+    """Общий пул для вызовов без явного HttpPool (скрипты, одноразовые запросы)."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = HttpPool()
+    return _default_pool
@@ -0,0 +1,207 @@
+import os
+import re
+import threading
+
+# Всегда скрываем служебную папку git
+ALWAYS_IGNORED = {".git"}
+
+# Кэши: {abs_path: (mtime_ns, data)}. Инвалидация по mtime: mtime папки меняется
+# при создании/удалении/переименовании записей в ней.
+_DIR_CACHE = {}
+_RULES_CACHE = {}
+_lock = threading.Lock()
+
+
+def _glob_to_regex(pattern):
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern[i:i + 3] == "**/":
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern[i:i + 2] == "**":
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 1)
+            if j == -1:
+                out.append("\\[")
+            else:
+                body = pattern[i + 1:j]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class IgnoreRules:
+    """Правила одного .gitignore (упрощенная, но совместимая семантика git)."""
+    def __init__(self, base, lines):
+        self.base = base
+        self.rules = []  # (regex, negate, dir_only, anchored)
+        for raw in lines:
+            line = raw.rstrip("\n").rstrip("\r")
+            if not line or line.startswith("#"):
+                continue
+            line = line.rstrip(" ") if not line.endswith("\\ ") else line
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            line = line.lstrip("/")
+            self.rules.append((re.compile(_glob_to_regex(line) + r"\Z"), negate, dir_only, anchored))
+
+    def match(self, rel, is_dir):
+        """None - правило не сработало, True/False - игнорировать или нет."""
+        name = rel.rsplit("/", 1)[-1]
+        result = None
+        for regex, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel if anchored else name):
+                result = not negate
+        return result
+
+
+def _load_rules(directory):
+    path = os.path.join(directory, ".gitignore")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _RULES_CACHE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            rules = IgnoreRules(directory, f.readlines())
+    except OSError:
+        return None
+    with _lock:
+        _RULES_CACHE[path] = (mtime, rules)
+    return rules
+
+
+def repo_root(directory):
+    """Ближайшая вверх папка с .git или None."""
+    current = os.path.abspath(directory)
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def ancestor_rules(directory):
+    """
+    Правила .gitignore от корня репозитория (папка с .git) до directory.
+    Вне git-репозитория - только правила самой directory: чужие .gitignore
+    выше по дереву (например, в домашней папке) к ней не относятся.
+    """
+    current = os.path.abspath(directory)
+    root = repo_root(current)
+    if root is None:
+        rules = _load_rules(current)
+        return [rules] if rules else []
+    chain = []
+    while True:
+        rules = _load_rules(current)
+        if rules:
+            chain.append(rules)
+        if current == root:
+            break
+        current = os.path.dirname(current)
+    chain.reverse()
+    return chain
+
+
+def is_ignored(path, is_dir, chain):
+    result = False
+    for rules in chain:
+        rel = os.path.relpath(path, rules.base).replace(os.sep, "/")
+        if rel.startswith(".."):
+            continue
+        matched = rules.match(rel, is_dir)
+        if matched is not None:
+            result = matched
+    return result
+
+
+def scan_dir(path):
+    """
+    Содержимое папки через os.scandir (тип записи берется из dirent без лишнего stat).
+    Возвращает отсортированный список (name, is_dir). Кэшируется до смены mtime папки.
+    """
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _DIR_CACHE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            entries.append((entry.name, is_dir))
+    entries.sort()
+    with _lock:
+        _DIR_CACHE[path] = (mtime, entries)
+    return entries
+
+
+def walk(root, max_depth=1, max_entries=500, include_ignored=False):
+    """
+    Обход дерева в глубину с учетом .gitignore.
+    Возвращает (entries, truncated), где entries = [(depth, rel_path, is_dir), ...].
+    """
+    root = os.path.abspath(root)
+    base_chain = [] if include_ignored else ancestor_rules(root)
+    out = []
+
+    def visit(directory, depth, chain):
+        if not include_ignored:
+            local = _load_rules(directory)
+            if local and (not chain or chain[-1] is not local):
+                chain = chain + [local]
+        try:
+            entries = scan_dir(directory)
+        except OSError:
+            return False
+        for name, is_dir in entries:
+            if name in ALWAYS_IGNORED:
+                continue
+            full = os.path.join(directory, name)
+            if not include_ignored and is_ignored(full, is_dir, chain):
+                continue
+            if len(out) >= max_entries:
+                return True
+            out.append((depth, os.path.relpath(full, root), is_dir))
+            if is_dir and depth + 1 < max_depth:
+                if visit(full, depth + 1, chain):
+                    return True
+        return False
+
+    truncated = visit(root, 0, base_chain)
+    return out, truncated
@@ -9,6 +9,11 @@ setup(
         "requests",
         "rich",
     ],
+    extras_require={
+        "http2": ["httpx[http2]"],
+        "speedups": ["orjson"],
+        "async": ["httpx"],
+    },
     entry_points={
         "console_scripts": [
             "polly=polly.main:main",
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# До импорта polly: CONFIG_DIR считается от HOME при импорте, ~/.polly не трогаем
+os.environ["HOME"] = tempfile.mkdtemp(prefix="polly-tests-")
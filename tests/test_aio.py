@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+import polly.api
+from polly.agent import TurnBudget
+from polly.aio import AsyncHttpPool, AsyncPollyIDE, aiter_deltas
+from polly.resilience import RetryPolicy, aopen_stream
+from polly.transport import HttpPool
+from fake_server import FakeSSEServer, Step
+
+PAYLOAD = {"model": "bench", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+
+
+@pytest.fixture
+def server():
+    srv = FakeSSEServer(Step(tokens=5)).start()
+    old = polly.api.API_URL
+    polly.api.API_URL = srv.url
+    yield srv
+    polly.api.API_URL = old
+    srv.stop()
+
+
+async def collect(deltas):
+    return "".join([t or "" async for t, _ in deltas])
+
+
+def open_with(policy, **kw):
+    pool = HttpPool()
+    aio_http = AsyncHttpPool(pool, {})
+    start = lambda: aiter_deltas(aio_http.stream(PAYLOAD, retry=policy))
+
+    async def run():
+        t0 = time.perf_counter()
+        try:
+            label, deltas = await aopen_stream(start, policy, **({"start_fallback": start} if kw else {}), **kw)
+            return label, await collect(deltas), time.perf_counter() - t0
+        finally:
+            await aio_http.aclose()
+            pool.close()
+    return asyncio.run(run())
+
+
+def test_drop_after_role_preamble_is_retried(server):
+    server.script(Step(drop=True), Step(tokens=5))
+    label, text, _ = open_with(RetryPolicy(max_retries=2, base_delay=0.01))
+    assert label == "primary" and text
+    assert len(server.requests) == 2
+
+
+def test_hedged_request_wins_over_stalled_primary(server):
+    server.script(Step(tokens=5, stall=3), Step(tokens=5))
+    label, text, elapsed = open_with(RetryPolicy(max_retries=0), hedge_after=0.2)
+    assert label == "fallback" and text
+    assert elapsed < 2  # Поток зависшего основного запроса event loop не держит
+
+
+def test_async_step_answers_after_a_drop(server):
+    server.script(Step(drop=True), Step(tokens=5))
+    ide = AsyncPollyIDE()
+    ide.retry = RetryPolicy(max_retries=2, base_delay=0.01)
+    ide.history.append({"role": "user", "content": "hi"})
+    try:
+        asyncio.run(ide._arun_once())
+    finally:
+        ide.close()
+    assert ide.history[-1]["role"] == "assistant"
+    assert ide.history[-1]["content"]
+
+
+def test_partial_answer_is_kept_on_mid_stream_error(server):
+    ide = AsyncPollyIDE()
+    ide.history.append({"role": "user", "content": "hi"})
+
+    async def broken(*args, **kwargs):
+        yield b'data: {"choices": [{"delta": {"content": "partial "}}]}\n\n'
+        raise ConnectionError("reset")
+
+    async def run():
+        aio_http = AsyncHttpPool(ide.http, ide.cfg)
+        aio_http.stream = broken
+        try:
+            return await ide._astream_step(aio_http, TurnBudget.from_config(ide.cfg))
+        finally:
+            await aio_http.aclose()
+    try:
+        assert asyncio.run(run()) == []
+    finally:
+        ide.close()
+    assert ide.history[-1] == {"role": "assistant", "content": "partial "}
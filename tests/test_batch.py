@@ -0,0 +1,30 @@
+import polly.api
+from polly.batch import BatchJob, BatchRunner
+from polly.resilience import RetryPolicy
+from fake_server import FakeSSEServer, Step
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+
+def test_retries_go_through_the_rate_limiter(monkeypatch, tmp_path):
+    srv = FakeSSEServer(Step(tokens=5)).start()
+    srv.script(Step(drop=True), Step(tokens=5))
+    monkeypatch.setattr(polly.api, "API_URL", srv.url)
+    runner = BatchRunner(workers=1, model="bench", cwd=str(tmp_path), tools="none")
+    runner.retry = RetryPolicy(max_retries=2, base_delay=0.01)
+    limiters = {}
+    monkeypatch.setattr(runner, "limiter", lambda model: limiters.setdefault(model, CountingLimiter()))
+    try:
+        record = runner.run_job(BatchJob("j1", "hi"))
+    finally:
+        srv.stop()
+        runner.http.close()
+    assert record["status"] == "ok"
+    assert len(srv.requests) == 2
+    assert limiters["bench"].acquired == 2
@@ -0,0 +1,24 @@
+import sys
+
+import polly.api
+from polly import router
+from polly.main import main
+from polly.sessions import SessionStore
+from fake_server import FakeSSEServer, Step
+
+
+def test_one_shot_run_saves_router_stats(monkeypatch):
+    srv = FakeSSEServer(Step(tokens=5)).start()
+    monkeypatch.setattr(polly.api, "API_URL", srv.url)
+    store = SessionStore("oneshot")
+    store.sync([{"role": "system", "content": "s"}])
+    store.close()
+    monkeypatch.setattr(sys, "argv", ["polly", "resume", "oneshot", "say", "hi"])
+    if router.STATS_FILE.exists():
+        router.STATS_FILE.unlink()
+    try:
+        main()
+    finally:
+        srv.stop()
+    assert router.STATS_FILE.exists()
+    assert len(srv.requests) == 1
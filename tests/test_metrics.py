@@ -0,0 +1,32 @@
+import pytest
+
+import polly.api
+from polly.batch import BatchConversation, BatchJob, BatchRunner
+from fake_server import FakeSSEServer, Step
+
+
+@pytest.fixture
+def server():
+    srv = FakeSSEServer(Step(tokens=5)).start()
+    old = polly.api.API_URL
+    polly.api.API_URL = srv.url
+    yield srv
+    polly.api.API_URL = old
+    srv.stop()
+
+
+def test_ttft_ignores_role_preamble(server, tmp_path):
+    # Преамбула приходит сразу, первый токен - через 0.3 с
+    server.script(Step(tokens=5, stall=0.3))
+    runner = BatchRunner(cwd=str(tmp_path), tools="none")
+    runner.cfg["route_models"] = False
+    conv = BatchConversation(runner, BatchJob("ttft", "measure ttft"))
+    steps = []
+    conv._record_step = steps.append
+    try:
+        conv.run()
+    finally:
+        conv.scheduler.shutdown()
+        runner.http.close()
+    assert len(steps) == 1
+    assert steps[0]["ttfb_s"] < 0.3 <= steps[0]["ttft_s"]
@@ -0,0 +1,72 @@
+import pytest
+
+from polly.patch import (PatchError, apply_edits, apply_hunks, apply_patch, atomic_write, edit_file,
+                         parse_unified_diff)
+
+TEXT = "def f():\n    a = 1   \n    b = 2\n    return a\n"
+
+
+def test_exact_edit():
+    new, changed = apply_edits(TEXT, [{"search": "b = 2", "replace": "b = 3"}])
+    assert new == TEXT.replace("b = 2", "b = 3")
+    assert changed == [3]
+
+
+def test_loose_delete_consumes_newline():
+    # В файле хвостовые пробелы, в search - нет: точного совпадения нет
+    new, changed = apply_edits(TEXT, [{"search": "    a = 1\n    b = 2\n", "replace": ""}])
+    assert new == "def f():\n    return a\n"
+    assert changed == [2]
+
+
+def test_loose_delete_of_last_line():
+    text = "x = 1\ny = 2"
+    new, _ = apply_edits(text, [{"search": "y = 2  ", "replace": ""}])
+    assert new == "x = 1"
+
+
+def test_loose_replace_keeps_layout():
+    new, _ = apply_edits(TEXT, [{"search": "    a = 1\n", "replace": "    a = 10\n"}])
+    assert new == "def f():\n    a = 10\n    b = 2\n    return a\n"
+
+
+def test_ambiguous_search_is_rejected():
+    with pytest.raises(PatchError, match="matches 2 times"):
+        apply_edits("x\nx\n", [{"search": "x", "replace": "y"}])
+
+
+def test_unified_diff_hunk():
+    diff = "@@ -2,2 +2,2 @@\n-    a = 1   \n+    a = 5\n     b = 2\n"
+    (_, _, hunks), = parse_unified_diff(diff)
+    new, changed = apply_hunks(TEXT, hunks)
+    assert new == "def f():\n    a = 5\n    b = 2\n    return a\n"
+    assert changed == [2]
+
+
+def test_atomic_write_follows_symlink(tmp_path):
+    real = tmp_path / "real.txt"
+    real.write_text("old\n")
+    link = tmp_path / "link.txt"
+    link.symlink_to(real)
+    atomic_write(str(link), "new\n")
+    assert link.is_symlink()
+    assert real.read_text() == "new\n"
+
+
+def test_edit_file_through_symlink(tmp_path):
+    real = tmp_path / "real.txt"
+    real.write_text("a = 1\n")
+    link = tmp_path / "link.txt"
+    link.symlink_to(real)
+    edit_file(str(link), edits=[{"search": "a = 1", "replace": "a = 2"}])
+    assert link.is_symlink()
+    assert real.read_text() == "a = 2\n"
+
+
+def test_apply_patch_renames_file(tmp_path):
+    (tmp_path / "old.py").write_text("a = 1\nb = 2\n")
+    diff = "--- a/old.py\n+++ b/new.py\n@@ -1,2 +1,2 @@\n a = 1\n-b = 2\n+b = 3\n"
+    result = apply_patch(diff, resolve=lambda rel: str(tmp_path / rel))
+    assert "Renamed old.py -> new.py" in result
+    assert not (tmp_path / "old.py").exists()
+    assert (tmp_path / "new.py").read_text() == "a = 1\nb = 3\n"
@@ -0,0 +1,28 @@
+import json
+
+from polly.payload import PayloadBuilder
+
+
+def payload(n, tag):
+    return {"model": "m", "messages": [{"role": "user", "content": f"{tag} {i}"} for i in range(n)],
+            "tools": [], "stream": True}
+
+
+def test_body_matches_json_dumps():
+    p = payload(5, "a")
+    assert PayloadBuilder().encode(p) == json.dumps(p).encode("utf-8")
+
+
+def test_conversations_do_not_evict_each_other(monkeypatch):
+    a, b = payload(50, "a"), payload(50, "b")
+    builder_a, builder_b = PayloadBuilder(), PayloadBuilder()
+    builder_a.encode(a)
+    builder_b.encode(b)  # Соседний диалог
+
+    encoded = []
+    real_dumps = json.dumps
+    monkeypatch.setattr(json, "dumps", lambda obj, **kw: encoded.append(obj) or real_dumps(obj, **kw))
+    a["messages"].append({"role": "user", "content": "next"})
+    assert builder_a.encode(a) == real_dumps(a).encode("utf-8")
+    # Заново кодируется только новое сообщение (и скаляры верхнего уровня)
+    assert [m for m in encoded if isinstance(m, dict)] == [a["messages"][-1]]
@@ -0,0 +1,52 @@
+import asyncio
+import contextvars
+import json
+import threading
+import time
+
+import pytest
+
+from polly import procs
+from polly.aio import CANCELLED, AsyncPollyIDE
+from polly.scheduler import ToolScheduler
+from polly.snapshots import FileSnapshots
+
+
+def test_run_captured_stops_on_cancel_event():
+    stop = threading.Event()
+    threading.Timer(0.3, stop.set).start()
+    ctx = contextvars.copy_context()
+    ctx.run(procs.CANCEL.set, stop)
+    t0 = time.monotonic()
+    output, _, status = ctx.run(procs.run_captured, "echo started; sleep 30")
+    assert status == "cancelled"
+    assert "started" in output
+    assert time.monotonic() - t0 < 5
+
+
+def test_cancelled_async_tool_stops_its_command(tmp_path):
+    marker = tmp_path / "finished"
+    ide = AsyncPollyIDE.__new__(AsyncPollyIDE)
+    ide.scheduler = ToolScheduler(max_workers=2)
+    ide.snapshots = FileSnapshots()
+    ide.history = []
+    ide.session = None
+    ide.step = 1
+    command = f"sleep 1; touch {marker}"
+    tool_buffer = [{"id": "call_1", "type": "function",
+                    "function": {"name": "execute_command", "arguments": json.dumps({"command": command})}}]
+
+    async def cancel_soon():
+        task = asyncio.create_task(ide._arun_tools(tool_buffer))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    try:
+        asyncio.run(cancel_soon())
+    finally:
+        ide.scheduler.shutdown()
+    assert ide.history[-1]["content"] == CANCELLED
+    time.sleep(1.5)
+    assert not marker.exists()  # Команда остановлена, а не доработала в фоне
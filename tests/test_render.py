@@ -0,0 +1,34 @@
+import io
+import re
+
+import pytest
+from rich.console import Console
+from rich.markdown import Markdown
+
+from polly.render import StreamRenderer
+
+LOOSE_LIST = "Steps:\n\n- first item\n\n- second item\n\n  more about the second\n\n- third item\n"
+REFERENCE_LINK = "See [the docs][docs] for details.\n\nMore text here.\n\n[docs]: https://example.com/docs\n"
+LEADING_TABLE = "| name | value |\n|------|-------|\n| a | 1 |\n| b | 2 |\n\nAfter the table.\n"
+
+
+def capture(renderable):
+    out = io.StringIO()
+    Console(file=out, width=60, height=40, force_terminal=True, color_system="truecolor").print(renderable)
+    # id гиперссылки (OSC 8) случайный в каждом рендере
+    lines = re.sub(r"id=\d+;", "", out.getvalue()).split("\n")
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return lines
+
+
+@pytest.mark.parametrize("text", [LOOSE_LIST, REFERENCE_LINK, LEADING_TABLE])
+def test_final_frame_matches_one_shot_markdown(text):
+    renderer = StreamRenderer()
+    for i in range(0, len(text), 3):
+        renderer.feed(text[i:i + 3])
+    capture(renderer)  # Кадр во время стрима: блоки замораживаются
+    renderer.finish()
+    assert capture(renderer) == capture(Markdown(text, code_theme=renderer.code_theme))
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+import requests
+
+import polly.api
+from polly.api import stream_completion
+from polly.resilience import RetryPolicy, open_stream
+from polly.transport import HttpPool
+from fake_server import FakeSSEServer, Step
+
+PAYLOAD = {"model": "bench", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+
+
+@pytest.fixture
+def server():
+    srv = FakeSSEServer(Step(tokens=5)).start()
+    old = polly.api.API_URL
+    polly.api.API_URL = srv.url
+    yield srv
+    polly.api.API_URL = old
+    srv.stop()
+
+
+@pytest.fixture
+def http():
+    pool = HttpPool()
+    yield pool
+    pool.close()
+
+
+def text_of(deltas):
+    return "".join(t or "" for t, _ in deltas)
+
+
+def test_drop_after_role_preamble_is_retried(server, http):
+    server.script(Step(drop=True), Step(tokens=5))
+    policy = RetryPolicy(max_retries=2, base_delay=0.01)
+    calls = []
+
+    def start():
+        calls.append("p")
+        return stream_completion(PAYLOAD, http=http, retry=policy)
+
+    label, _, deltas = open_stream(start, policy)
+    assert label == "primary"
+    assert calls == ["p", "p"]
+    assert text_of(deltas)
+
+
+def test_drop_after_preamble_without_retries_raises(server, http):
+    server.script(Step(drop=True))
+    policy = RetryPolicy(max_retries=0)
+    with pytest.raises(requests.exceptions.RequestException):
+        open_stream(lambda: stream_completion(PAYLOAD, http=http, retry=policy), policy)
+
+
+def test_preamble_alone_does_not_stop_hedging(server, http):
+    # Основной запрос отдает преамбулу и молчит, запасной отвечает сразу
+    server.script(Step(tokens=5, stall=3), Step(tokens=5))
+    policy = RetryPolicy(max_retries=0)
+    start = lambda: stream_completion(PAYLOAD, http=http, retry=policy)
+    t0 = time.perf_counter()
+    label, _, deltas = open_stream(start, policy, hedge_after=0.2, start_fallback=start)
+    assert label == "fallback"
+    assert time.perf_counter() - t0 < 2
+    assert text_of(deltas)
+
+
+def test_empty_deltas_are_replayed(server, http):
+    policy = RetryPolicy(max_retries=0)
+    _, _, deltas = open_stream(lambda: stream_completion(PAYLOAD, http=http, retry=policy), policy)
+    first = next(deltas)
+    assert first == ("", None)  # Преамбула не теряется
+    assert text_of(deltas)
@@ -0,0 +1,31 @@
+from polly.core import PollyIDE
+from polly.models import CAP_CODE, CAP_SEARCH, CAP_TOOLS
+from polly.router import ModelRouter
+from polly.tools import get_tools_schema
+
+
+def caps(cfg, last_role="user", tools=None):
+    ide = PollyIDE.__new__(PollyIDE)
+    ide.cfg = cfg
+    ide.history = [{"role": "system", "content": "s"}, {"role": last_role, "content": "x"}]
+    return ide._required_caps(get_tools_schema(cfg) if tools is None else tools)
+
+
+def test_search_required_only_when_enabled_by_user():
+    assert caps({}) == {CAP_TOOLS}  # google_search по умолчанию: ключа в конфиге нет
+    assert caps({"google_search": True}) == {CAP_TOOLS, CAP_SEARCH}
+    assert caps({"google_search": False}) == {CAP_TOOLS}
+
+
+def test_tools_capability_follows_the_request():
+    assert caps({}, tools=[]) == set()
+    assert caps({}, last_role="tool") == {CAP_TOOLS, CAP_CODE}
+
+
+def test_tool_turns_are_not_routed_to_search_only_models(tmp_path):
+    router = ModelRouter(path=tmp_path / "stats.json")
+    with_tools = router.candidates({CAP_TOOLS}, "claude")
+    assert "perplexity-fast" not in with_tools and "nomnom" not in with_tools
+    assert "claude" in with_tools
+    assert "perplexity-fast" in router.candidates(set(), "claude")
+    assert router.candidates({CAP_TOOLS, CAP_SEARCH}, "claude") == ["gemini-fast", "gemini-search", "gemini"]
@@ -0,0 +1,27 @@
+from polly.sanitize import SanitizedView, sanitized_history
+
+
+def history(tag, n):
+    msgs = [{"role": "system", "content": "sys"}]
+    for i in range(n):
+        msgs += [{"role": "user", "content": f"{tag} q{i}"}, {"role": "assistant", "content": f"{tag} a{i}"}]
+    return msgs
+
+
+def test_conversations_keep_their_own_views(monkeypatch):
+    a, b = history("a", 20), history("b", 20)
+    views_a, views_b = {}, {}
+    sanitized_history("openai", a, views_a)
+    sanitized_history("openai", b, views_b)  # Соседний диалог
+
+    pushed = []
+    real_push = SanitizedView._push
+    monkeypatch.setattr(SanitizedView, "_push", lambda self, msg: pushed.append(msg) or real_push(self, msg))
+    a.append({"role": "user", "content": "a next"})
+    assert sanitized_history("openai", a, views_a)[-1]["content"] == "a next"
+    assert pushed == [a[-1]]  # Досчитано только новое сообщение
+
+
+def test_user_messages_are_merged():
+    msgs = [{"role": "user", "content": "one"}, {"role": "user", "content": "two"}]
+    assert sanitized_history("openai", msgs, {}) == [{"role": "user", "content": "one\n\ntwo"}]
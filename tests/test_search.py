@@ -0,0 +1,81 @@
+import os
+import re
+
+import pytest
+
+from polly.search import _query_trigrams, search_code
+
+
+def grams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+@pytest.mark.parametrize("query", ["(abc)*bar", "(foo)?bar", "(foo){0,2}bar", "(?!foo)bar", "((foo)?x)+bar"])
+def test_optional_groups_are_not_required(query):
+    assert _query_trigrams(query, True) == grams("bar")
+
+
+def test_required_groups_keep_literals():
+    assert _query_trigrams("(foo)+bar", True) == grams("foo") | grams("bar")
+    assert _query_trigrams("(?:hello)world", True) == grams("hello") | grams("world")
+
+
+@pytest.mark.parametrize("query,text", [
+    ("(abc)*bar", "just bar here"),
+    ("(foo)?bar", "bar"),
+    ("x(yz){0}end", "xend"),
+])
+def test_optional_group_queries_find_matches(tmp_path, monkeypatch, query, text):
+    assert re.search(query, text)
+    (tmp_path / "f.txt").write_text(text + "\n")
+    monkeypatch.chdir(tmp_path)
+    assert "f.txt:1:" in search_code(query, regex=True)
+
+
+@pytest.fixture
+def outside(tmp_path, monkeypatch):
+    work = tmp_path / "work"
+    work.mkdir()
+    (work / "here.py").write_text("needle_here = 1\n")
+    repo = tmp_path / "other"
+    (repo / ".git").mkdir(parents=True)
+    (repo / "pkg").mkdir()
+    (repo / "pkg" / "mod.py").write_text("needle_there = 2\n")
+    (repo / "top.py").write_text("needle_there = 3\n")
+    monkeypatch.chdir(work)
+    return repo
+
+
+def test_search_path_outside_cwd(outside):
+    out = search_code("needle_there", path=str(outside / "pkg"))
+    assert out == f"{os.path.join(os.path.realpath(outside), 'pkg', 'mod.py')}:1: needle_there = 2"
+
+
+def test_search_single_file_outside_cwd(outside):
+    out = search_code("needle_there", path=str(outside / "top.py"))
+    assert out.endswith("top.py:1: needle_there = 3")
+    assert "mod.py" not in out
+
+
+def test_search_relative_paths_inside_cwd(outside):
+    assert search_code("needle") == "here.py:1: needle_here = 1"
+    assert search_code("needle", path="missing").startswith("Error: Path 'missing' not found")
+
+
+def test_binary_files_are_not_reread(tmp_path, monkeypatch):
+    import polly.search as search
+
+    (tmp_path / "code.py").write_text("needle = 1\n")
+    (tmp_path / "blob.bin").write_bytes(b"\0\1needle" * 100)
+    monkeypatch.chdir(tmp_path)
+    opened = []
+    real_open = open
+    monkeypatch.setattr(search, "open", lambda path, *a, **kw: opened.append(os.path.basename(path))
+                        or real_open(path, *a, **kw), raising=False)
+    for _ in range(3):
+        assert search_code("needle") == "code.py:1: needle = 1"
+    assert sorted(opened) == ["blob.bin", "code.py"]  # Каждый файл прочитан один раз
+
+    os.utime(tmp_path / "blob.bin", ns=(1, 1))  # Изменился - перечитываем
+    search_code("needle")
+    assert opened.count("blob.bin") == 2
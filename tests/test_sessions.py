@@ -0,0 +1,47 @@
+import os
+import time
+
+from polly.core import PollyIDE
+from polly.sessions import SessionStore, prune_sessions
+
+
+def make_session(root, sid, age_days=0, blob=False):
+    store = SessionStore(sid, blob_bytes=10, root=root)
+    history = [{"role": "system", "content": "s"}, {"role": "user", "content": "hi"}]
+    if blob:
+        history.append({"role": "tool", "tool_call_id": "c", "content": "x" * 100})
+    store.sync(history)
+    store.close()
+    when = time.time() - age_days * 86400
+    os.utime(store.path, (when, when))
+    return store
+
+
+def test_prune_by_count_and_age(tmp_path):
+    for i in range(5):
+        make_session(tmp_path, f"s{i}", age_days=i, blob=True)
+    make_session(tmp_path, "old", age_days=90)
+    assert prune_sessions(max_count=3, max_age_days=30, root=tmp_path) == 3
+    assert sorted(p.stem for p in tmp_path.glob("*.jsonl")) == ["s0", "s1", "s2"]
+    assert not (tmp_path / "s4.idx").exists()
+    assert not (tmp_path / "s4.blobs").exists()
+    assert (tmp_path / "s0.blobs").is_dir()
+
+
+def test_prune_keeps_current_and_zero_means_unlimited(tmp_path):
+    for i in range(3):
+        make_session(tmp_path, f"s{i}", age_days=100 + i)
+    assert prune_sessions(max_count=0, max_age_days=0, root=tmp_path) == 0
+    assert prune_sessions(max_count=1, max_age_days=30, keep="s2", root=tmp_path) == 2
+    assert [p.stem for p in tmp_path.glob("*.jsonl")] == ["s2"]
+
+
+def test_one_shot_run_does_not_create_a_session():
+    ide = PollyIDE()
+    try:
+        assert ide.session is None
+        ide.history.append({"role": "user", "content": "hi"})
+        ide._persist()
+        assert ide.session is None
+    finally:
+        ide.close()
@@ -0,0 +1,92 @@
+import json
+
+from polly.context import fit_history
+from polly.snapshots import FileSnapshots
+
+BODY = "".join(f"line {i}: some text to make the file long\n" for i in range(100))
+
+
+def read_turn(call_id, path, content, question):
+    call = {"id": call_id, "type": "function",
+            "function": {"name": "read_file", "arguments": json.dumps({"path": path})}}
+    return [{"role": "user", "content": question},
+            {"role": "assistant", "content": None, "tool_calls": [call]},
+            {"role": "tool", "tool_call_id": call_id, "name": "read_file", "content": content},
+            {"role": "assistant", "content": "Read it."}]
+
+
+def setup(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text(BODY)
+    snaps = FileSnapshots()
+    args = {"path": str(path)}
+    assert snaps.dedupe(args, BODY, 1, "call_1") == BODY
+    history = [{"role": "system", "content": "sys"}] + read_turn("call_1", str(path), BODY, "read it")
+    history.append({"role": "user", "content": "now what?"})
+    return snaps, args, history
+
+
+def test_reread_after_elide_returns_full_file(tmp_path):
+    snaps, args, history = setup(tmp_path)
+    fitted = fit_history(history, 200, snaps.evict)
+    assert "elided" in fitted[3]["content"]
+    assert snaps.dedupe(args, BODY, 2, "call_2") == BODY
+
+
+def test_reread_after_drop_returns_full_file(tmp_path):
+    snaps, args, history = setup(tmp_path)
+    history = history[:-1] + [{"role": "user", "content": "x" * 4000}]
+    fitted = fit_history(history, 1020, snaps.evict)
+    assert all(m.get("tool_call_id") != "call_1" for m in fitted)
+    assert snaps.dedupe(args, BODY, 2, "call_2") == BODY
+
+
+def test_reread_in_context_is_deduplicated(tmp_path):
+    snaps, args, history = setup(tmp_path)
+    assert fit_history(history, 100000, snaps.evict) is history
+    assert "unchanged since step 1" in snaps.dedupe(args, BODY, 2, "call_2")
+
+
+def test_diff_depends_on_the_earlier_read(tmp_path):
+    snaps, args, _ = setup(tmp_path)
+    changed = BODY.replace("line 50:", "line fifty:")
+    (tmp_path / "big.txt").write_text(changed)
+    assert "changed since step 1" in snaps.dedupe(args, changed, 2, "call_2")
+    snaps.evict(["call_1"])
+    assert snaps.dedupe(args, changed, 3, "call_3") == changed
+
+
+def test_unchanged_file_is_not_reread(tmp_path, monkeypatch):
+    from polly import core
+    from polly.core import PollyIDE
+    from polly.scheduler import ToolScheduler
+
+    path = tmp_path / "big.txt"
+    path.write_text(BODY)
+    ide = PollyIDE.__new__(PollyIDE)
+    ide.scheduler = ToolScheduler(max_workers=2)
+    ide.snapshots = FileSnapshots()
+    ide.history = []
+    ide.session = None
+    ide.step = 1
+    reads = []
+
+    def fake_tool(name, args):
+        reads.append(args["path"])
+        return open(args["path"]).read()
+
+    monkeypatch.setattr(core, "execute_local_tool", fake_tool)
+
+    def read(call_id):
+        call = {"id": call_id, "type": "function",
+                "function": {"name": "read_file", "arguments": json.dumps({"path": str(path)})}}
+        ide._run_tools([call])
+        ide.step += 1
+        return ide.history[-1]["content"]
+
+    assert read("call_1") == BODY
+    assert "unchanged since step 1" in read("call_2")
+    assert len(reads) == 1
+    path.write_text(BODY.replace("line 50:", "line fifty:"))
+    assert "changed since step 1" in read("call_3")
+    assert len(reads) == 2
@@ -0,0 +1,22 @@
+import gzip
+
+import pytest
+
+from polly import transport
+from polly.transport import HttpPool, _H2Response
+
+SSE = b'data: {"choices": [{"delta": {"content": "hi"}}]}\n\ndata: [DONE]\n\n'
+
+
+def test_h2_response_decodes_content_encoding():
+    httpx = pytest.importorskip("httpx")
+    raw = httpx.Response(200, headers={"Content-Encoding": "gzip"}, content=gzip.compress(SSE))
+    assert b"".join(_H2Response(raw).iter_content()) == SSE
+
+
+def test_http2_without_h2_falls_back_to_http1(monkeypatch):
+    monkeypatch.setattr(transport, "httpx", object())
+    monkeypatch.setattr(transport, "h2", None)
+    pool = HttpPool(http2=True)
+    assert not pool.http2
+    assert pool.stats()["transport"] == "requests/http1.1"
@@ -0,0 +1,20 @@
+from polly.workspace import ancestor_rules, is_ignored
+
+
+def test_rules_above_a_non_repo_directory_are_ignored(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.txt\n")
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / ".gitignore").write_text("*.log\n")
+    chain = ancestor_rules(project)
+    assert not is_ignored(str(project / "notes.txt"), False, chain)
+    assert is_ignored(str(project / "run.log"), False, chain)
+
+
+def test_rules_up_to_the_repo_root_apply(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.txt\n")
+    (tmp_path / ".git").mkdir()
+    project = tmp_path / "project"
+    project.mkdir()
+    chain = ancestor_rules(project)
+    assert is_ignored(str(project / "notes.txt"), False, chain)